@@ -0,0 +1,2 @@
+# conftest.py
+# Marks the repository root as pytest's rootdir, so tests import core_modules directly.
@@ -9,9 +9,19 @@
 # from .rephraser import rephrase_rules
 # from .unifier_optimizer import unify_and_optimize_rules
 # from .generator import generate_brave_power_list
-# from .main_generator import main_workflow
+# from .main_generator import run_pipeline
 
 # However, for clarity in the main_generator.py, direct imports
 # from .module_name import function_name are often preferred.
 
-# No specific code is required in this __init__.py for the current setup.
+# The embeddable Pipeline (see pipeline.py) is the public entry point for
+# building lists in-process. It is imported on first access, so importing a
+# single stage module does not pull in the whole pipeline.
+__all__ = ["Pipeline"]
+
+
+def __getattr__(name):
+    if name == "Pipeline":
+        from .pipeline import Pipeline
+        return Pipeline
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
@@ -0,0 +1,233 @@
+# core_modules/canonical_form.py
+
+import hashlib
+import re
+
+from .parser_validator import RuleType, split_network_options
+
+# uBO/ABP option aliases, mapped onto one spelling. "1p"/"first-party" are
+# negated third-party in every engine, so they collapse onto "~third-party".
+NETWORK_OPTION_ALIASES = {
+    "3p": "third-party", "1p": "~third-party", "first-party": "~third-party", "css": "stylesheet",
+    "xhr": "xmlhttprequest", "frame": "subdocument", "doc": "document", "beacon": "ping", "ghide": "generichide",
+    "ehide": "elemhide", "shide": "specifichide", "from": "domain", "queryprune": "removeparam",
+}
+# Options whose value is a |-separated list of (possibly negated) hostnames
+DOMAIN_LIST_OPTIONS = {"domain", "denyallow", "to"}
+REGEX_RULE_RE = re.compile(r"^/.+/$")
+HOSTS_RULE_RE = re.compile(r"^(\d{1,3}\.\d{1,3}\.\d{1,3}\.\d{1,3})\s+([\w.-]+)\s*$")
+HOST_ANCHOR_RE = re.compile(r"^(\|\||\|https?://)([^/^:*?|]*)", re.IGNORECASE)
+COSMETIC_SEPARATORS = ("#@#", "#?#", "#$#", "##")
+SCRIPTLET_CALL_RE = re.compile(r"^\+js\((.*)\)$", re.DOTALL)
+UNESCAPED_COMMA_RE = re.compile(r"(?<!\\),")
+# Pseudo-classes whose argument is itself a selector and is normalised like
+# one; every other parenthesised argument (:has-text(), :xpath(),
+# :nth-child(), ...) may be whitespace-sensitive and is copied verbatim.
+SELECTOR_ARGUMENT_PSEUDOS = (":has", ":not", ":is", ":where", ":matches", ":-abp-has", ":if", ":if-not")
+COMBINATORS = ">+~,"
+SELECTOR_NEEDS_SCAN_RE = re.compile(r"[\s*]")
+
+
+def _canonical_domain_list(domains: str, separator: str) -> str:
+    return separator.join(sorted({d.strip().lower() for d in domains.split(separator) if d.strip()}))
+
+
+def _canonical_option(option: str) -> str:
+    name, has_value, value = option.partition("=")
+    negated = name.startswith("~")
+    name = name.lstrip("~").strip().lower()
+    name = NETWORK_OPTION_ALIASES.get(name, name)
+    if name.startswith("~"): # An alias that is itself a negation (1p -> ~third-party)
+        name = name[1:]
+        negated = not negated
+    if name in DOMAIN_LIST_OPTIONS and has_value and "/" not in value: # Regex entries are kept verbatim
+        value = _canonical_domain_list(value, "|")
+    return ("~" if negated else "") + name + ("=" + value if has_value else "")
+
+
+def _strip_redundant_wildcards(pattern: str) -> str:
+    # Unanchored ends are implicit wildcards, so *ads* and ads are the same pattern
+    while "**" in pattern:
+        pattern = pattern.replace("**", "*")
+    stripped = pattern
+    if not stripped.startswith("|"):
+        stripped = stripped.lstrip("*")
+    if not stripped.endswith("|"):
+        stripped = stripped.rstrip("*")
+    if not stripped or REGEX_RULE_RE.match(stripped):
+        return pattern # Match-all rules keep their '*'; */x/* must not turn into the regex /x/
+    return stripped
+
+
+def canonicalize_network_rule(rule_str: str) -> str:
+    """
+    Canonical form of a network rule: the hostname (or, without $match-case,
+    the whole pattern) lower-cased, redundant wildcards removed, option
+    aliases expanded and options deduplicated and sorted. Regex patterns are
+    kept verbatim, and rules whose options cannot be split unambiguously (a
+    '$' inside an option value) are returned unchanged.
+    """
+    prefix = "@@" if rule_str.startswith("@@") else ""
+    rule = rule_str[len(prefix):]
+    if REGEX_RULE_RE.match(rule):
+        return prefix + rule
+    pattern, options = rule, []
+    if "$" in rule:
+        dollar = rule.rfind("$")
+        pattern, option_str = rule[:dollar], rule[dollar + 1:]
+        if "$" in pattern and not REGEX_RULE_RE.match(pattern):
+            return rule_str
+        options = sorted({_canonical_option(o) for o in split_network_options(option_str) if o.strip()})
+    if not REGEX_RULE_RE.match(pattern):
+        if "match-case" in options:
+            pattern = HOST_ANCHOR_RE.sub(lambda m: m.group(1).lower() + m.group(2).lower(), pattern)
+        else:
+            pattern = pattern.lower()
+        pattern = _strip_redundant_wildcards(pattern)
+    return prefix + pattern + ("$" + ",".join(options) if options else "")
+
+
+def _pseudo_before(out: list[str]) -> str:
+    """The ':name' (or '::name') that directly precedes an opening parenthesis in the output."""
+    end = len(out)
+    start = end
+    while start > 0 and (out[start - 1].isalnum() or out[start - 1] in "-_"):
+        start -= 1
+    while start > 0 and out[start - 1] == ":":
+        start -= 1
+    return "".join(out[start:end]).lower()
+
+
+def canonicalize_selector(selector: str) -> str:
+    """
+    Normalises the whitespace of a CSS selector (runs of whitespace collapse
+    to one descendant combinator, none around > + ~ , or inside the parens
+    of selector pseudo-classes) and drops a universal '*' that only precedes
+    a class, id, attribute or pseudo-class. Strings, attribute brackets and
+    the arguments of non-selector pseudo-classes are copied verbatim.
+    """
+    selector = selector.strip()
+    if not SELECTOR_NEEDS_SCAN_RE.search(selector):
+        return selector
+    out: list[str] = []
+    verbatim_depth = 0 # > 0 inside a verbatim argument, counting its nested parens
+    pending_space = False
+    i, length = 0, len(selector)
+    while i < length:
+        char = selector[i]
+        if char in "\"'" or char == "[" or (verbatim_depth and char not in "()"):
+            # Copy a quoted string, an attribute selector or verbatim text as-is
+            if char in "\"'":
+                end = i + 1
+                while end < length and selector[end] != char:
+                    end += 2 if selector[end] == "\\" else 1
+            elif char == "[":
+                end = selector.find("]", i)
+                end = length - 1 if end < 0 else end
+            else:
+                end = i
+            if pending_space and out and out[-1] not in COMBINATORS + "(":
+                out.append(" ")
+            pending_space = False
+            out.append(selector[i:end + 1])
+            i = end + 1
+            continue
+        if char == "(" and verbatim_depth:
+            verbatim_depth += 1
+            out.append(char)
+        elif char == ")" and verbatim_depth:
+            verbatim_depth -= 1
+            out.append(char)
+        elif char.isspace():
+            pending_space = True
+        elif char in COMBINATORS:
+            pending_space = False
+            if out and out[-1] == " ":
+                out.pop()
+            out.append(char)
+            while i + 1 < length and selector[i + 1].isspace():
+                i += 1
+        elif char == "(":
+            pending_space = False
+            pseudo = _pseudo_before(out)
+            out.append(char)
+            if pseudo not in SELECTOR_ARGUMENT_PSEUDOS:
+                verbatim_depth = 1
+            while i + 1 < length and selector[i + 1].isspace():
+                i += 1
+        elif char == ")":
+            pending_space = False
+            out.append(char)
+        else:
+            if pending_space and out and out[-1] not in COMBINATORS + "(":
+                out.append(" ")
+            pending_space = False
+            at_compound_start = not out or out[-1] in COMBINATORS + "( "
+            if char == "*" and at_compound_start and i + 1 < length and selector[i + 1] in ".#[:":
+                i += 1
+                continue
+            out.append(char)
+        i += 1
+    return "".join(out)
+
+
+def _split_cosmetic(rule_str: str) -> tuple[str, str, str] | None:
+    for separator in COSMETIC_SEPARATORS:
+        index = rule_str.find(separator)
+        if index >= 0:
+            return rule_str[:index], separator, rule_str[index + len(separator):]
+    return None
+
+
+def canonicalize_cosmetic_rule(rule_str: str) -> str:
+    """Canonical form of a cosmetic rule: lower-cased, sorted domains and a normalised selector."""
+    parts = _split_cosmetic(rule_str)
+    if parts is None:
+        return rule_str
+    domains, separator, selector = parts
+    return _canonical_domain_list(domains, ",") + separator + canonicalize_selector(selector)
+
+
+def canonicalize_scriptlet_rule(rule_str: str) -> str:
+    """Canonical form of a +js() scriptlet rule: sorted domains, trimmed arguments, no '.js' on the name."""
+    parts = _split_cosmetic(rule_str)
+    if parts is None:
+        return rule_str
+    domains, separator, body = parts
+    call = SCRIPTLET_CALL_RE.match(body.strip())
+    if not call:
+        return _canonical_domain_list(domains, ",") + separator + body.strip()
+    arguments = [argument.strip() for argument in UNESCAPED_COMMA_RE.split(call.group(1))]
+    if arguments and arguments[0].endswith(".js"):
+        arguments[0] = arguments[0][:-3]
+    return _canonical_domain_list(domains, ",") + separator + "+js(" + ", ".join(arguments) + ")"
+
+
+def canonicalize_rule(rule_str: str, rule_type: RuleType) -> str:
+    """Canonical spelling of an active rule; rules of other types are returned stripped."""
+    if rule_type == RuleType.NETWORK:
+        return canonicalize_network_rule(rule_str)
+    if rule_type == RuleType.COSMETIC:
+        return canonicalize_cosmetic_rule(rule_str)
+    if rule_type == RuleType.SCRIPTLET:
+        if "+js(" in rule_str:
+            return canonicalize_scriptlet_rule(rule_str)
+        if "#" not in rule_str: # Network-style AdGuard rule classified as a scriptlet ($jsonprune, ...)
+            return canonicalize_network_rule(rule_str)
+        return rule_str
+    if rule_type == RuleType.HOSTS_RULE:
+        hosts_match = HOSTS_RULE_RE.match(rule_str)
+        if hosts_match:
+            return f"{hosts_match.group(1)} {hosts_match.group(2).lower()}"
+    return rule_str.strip()
+
+
+def canonical_key(rule_str: str, rule_type: RuleType) -> tuple[bytes, str]:
+    """
+    Dedup key of a rule: a 128-bit BLAKE2b digest of its type and canonical
+    form, so that semantically identical spellings share one key. Returns
+    (key, canonical form).
+    """
+    canonical = canonicalize_rule(rule_str, rule_type)
+    digest = hashlib.blake2b(f"{rule_type.name}\x00{canonical}".encode("utf-8"), digest_size=16).digest()
+    return digest, canonical
@@ -0,0 +1,102 @@
+# core_modules/checkpoints.py
+
+import hashlib
+import json
+import logging
+import os
+import pathlib
+import pickle
+import struct
+import sys
+import time
+
+logger = logging.getLogger(__name__)
+
+# File layout: MAGIC | u32 header length | JSON header | pickle payload (protocol 5).
+# The JSON header can be read without unpickling the payload, which is all
+# `main_generator all` needs to decide whether a stage can be skipped.
+CHECKPOINT_MAGIC = b"BPLCKPT1"
+CHECKPOINT_FORMAT_VERSION = 2 # 2: unify checkpoint holds the structured, variant-independent result
+_HEADER_LENGTH = struct.Struct("<I")
+
+
+class CheckpointError(Exception):
+    """Raised when a checkpoint is missing, corrupt or was written by an incompatible version."""
+
+
+def checkpoint_path(checkpoint_dir: str | os.PathLike, stage: str) -> pathlib.Path:
+    return pathlib.Path(checkpoint_dir) / f"{stage}.ckpt"
+
+
+def digest_of(*parts) -> str:
+    """Stable digest of JSON-serialisable parts (configs, upstream digests)."""
+    hasher = hashlib.blake2b(digest_size=16)
+    for part in parts:
+        hasher.update(json.dumps(part, sort_keys=True, default=str).encode("utf-8"))
+        hasher.update(b"\0")
+    return hasher.hexdigest()
+
+
+def write_checkpoint(path: pathlib.Path, stage: str, payload, input_digest: str) -> str:
+    """
+    Atomically writes a stage checkpoint and returns the digest of its
+    payload, which the next stage folds into its own input digest.
+    """
+    payload_bytes = pickle.dumps(payload, protocol=5)
+    content_digest = hashlib.blake2b(payload_bytes, digest_size=16).hexdigest()
+    header = json.dumps({
+        "stage": stage,
+        "format_version": CHECKPOINT_FORMAT_VERSION,
+        "python": list(sys.version_info[:2]),
+        "input_digest": input_digest,
+        "content_digest": content_digest,
+        "created": time.time(),
+        "payload_bytes": len(payload_bytes),
+    }).encode("utf-8")
+
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = path.with_suffix(path.suffix + ".tmp")
+    with open(tmp_path, "wb") as f:
+        f.write(CHECKPOINT_MAGIC)
+        f.write(_HEADER_LENGTH.pack(len(header)))
+        f.write(header)
+        f.write(payload_bytes)
+    os.replace(tmp_path, path)
+    logger.info(f"Checkpoint: Wrote '{stage}' ({len(payload_bytes)} bytes) to {path}.")
+    return content_digest
+
+
+def _read_header(f, path: pathlib.Path) -> dict:
+    if f.read(len(CHECKPOINT_MAGIC)) != CHECKPOINT_MAGIC:
+        raise CheckpointError(f"{path} is not a checkpoint file.")
+    (header_length,) = _HEADER_LENGTH.unpack(f.read(_HEADER_LENGTH.size))
+    header = json.loads(f.read(header_length))
+    if header.get("format_version") != CHECKPOINT_FORMAT_VERSION:
+        raise CheckpointError(f"{path} has checkpoint format {header.get('format_version')}, expected {CHECKPOINT_FORMAT_VERSION}.")
+    return header
+
+
+def read_checkpoint_header(path: pathlib.Path) -> dict | None:
+    """Returns the header of a checkpoint, or None if it is missing or unreadable."""
+    try:
+        with open(path, "rb") as f:
+            return _read_header(f, path)
+    except FileNotFoundError:
+        return None
+    except (OSError, ValueError, struct.error, CheckpointError) as e:
+        logger.warning(f"Checkpoint: Ignoring unreadable checkpoint {path}: {e}")
+        return None
+
+
+def read_checkpoint(path: pathlib.Path) -> tuple[dict, object]:
+    """Returns (header, payload) of a checkpoint."""
+    try:
+        with open(path, "rb") as f:
+            header = _read_header(f, path)
+            payload = pickle.loads(f.read())
+    except FileNotFoundError:
+        raise CheckpointError(f"Checkpoint {path} does not exist; run the previous stage first.") from None
+    except (OSError, ValueError, struct.error, pickle.UnpicklingError, EOFError) as e:
+        raise CheckpointError(f"Checkpoint {path} could not be read: {e}") from e
+    logger.info(f"Checkpoint: Loaded '{header['stage']}' from {path}.")
+    return header, payload
@@ -0,0 +1,70 @@
+# core_modules/config_loader.py
+
+import json
+import logging
+import pathlib
+
+# The configuration and the Brave metadata path are resolved against the
+# project root, the parent of core_modules.
+PROJECT_ROOT = pathlib.Path(__file__).resolve().parent.parent
+
+def load_configuration(config_path_str: str) -> dict | None:
+    logger_cfg = logging.getLogger(__name__)
+    # argparse provides path relative to CWD. If running from project root, this is fine.
+    config_path = pathlib.Path(config_path_str) 
+
+    if not config_path.is_file(): # Check path as given first
+        # If not found, try resolving relative to project root (in case CWD is different)
+        config_path_alt = PROJECT_ROOT / config_path_str
+        if config_path_alt.is_file():
+            config_path = config_path_alt
+        else:
+            logger_cfg.error(f"Configuration file not found at '{config_path_str}' (CWD) or '{config_path_alt}' (project root).")
+            return None
+
+    logger_cfg.info(f"Loading configuration from: {config_path.resolve()}")
+    try:
+        with open(config_path, 'r', encoding='utf-8') as f:
+            config = json.load(f)
+        logger_cfg.info("Configuration loaded successfully.")
+        return config
+    except json.JSONDecodeError as e:
+        logger_cfg.error(f"Error decoding JSON from config file {config_path.resolve()}: {e}")
+        raise
+    except Exception as e:
+        logger_cfg.error(f"Error loading config file {config_path.resolve()}: {e}")
+        raise
+
+
+def load_brave_scriptlet_metadata(config: dict) -> dict:
+    logger_meta = logging.getLogger(__name__)
+    metadata_filepath_str = config.get("brave_metadata_filepath")
+    if not metadata_filepath_str:
+        logger_meta.warning("Path to Brave scriptlet metadata ('brave_metadata_filepath') not in config. Scriptlet rephrasing may be limited.")
+        return {}
+
+    metadata_path = PROJECT_ROOT / metadata_filepath_str # Path relative to project root
+    if not metadata_path.is_file():
+        logger_meta.error(f"Brave scriptlet metadata file not found: {metadata_path.resolve()}")
+        return {}
+    
+    logger_meta.info(f"Loading Brave scriptlet metadata from: {metadata_path.resolve()}")
+    try:
+        with open(metadata_path, 'r', encoding='utf-8') as f:
+            metadata_content = json.load(f)
+        if "scriptlets" in metadata_content and isinstance(metadata_content["scriptlets"], list):
+            scriptlet_map = {}
+            for scriptlet_def in metadata_content["scriptlets"]:
+                if "name" in scriptlet_def:
+                    scriptlet_map[scriptlet_def["name"]] = scriptlet_def
+                    if "aliases" in scriptlet_def and isinstance(scriptlet_def["aliases"], list):
+                        for alias in scriptlet_def["aliases"]:
+                            scriptlet_map[alias] = scriptlet_def
+            logger_meta.info(f"Loaded and mapped {len(scriptlet_map)} scriptlets (including aliases).")
+            return scriptlet_map
+        else:
+            logger_meta.warning("Brave scriptlet metadata is not in expected format (missing 'scriptlets' list).")
+            return {}
+    except Exception as e:
+        logger_meta.error(f"Error loading/parsing Brave scriptlet metadata {metadata_path.resolve()}: {e}")
+        return {}
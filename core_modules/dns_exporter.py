@@ -0,0 +1,321 @@
+# core_modules/dns_exporter.py
+
+import logging
+import mmap
+import pathlib
+import re
+import struct
+from datetime import datetime
+
+from .parser_validator import RuleType
+from .unifier_optimizer import collect_domain_block_rules, get_domain_from_network_rule, select_rules
+
+logger = logging.getLogger(__name__)
+
+DNS_FORMATS = ("domains", "hosts", "dnsmasq", "unbound", "rpz", "binary")
+FORMAT_EXTENSIONS = {
+    "domains": "domains.txt",
+    "hosts": "hosts",
+    "dnsmasq": "dnsmasq.conf",
+    "unbound": "unbound.conf",
+    "rpz": "rpz.zone",
+    "binary": "domains.bin",
+}
+HOSTS_IGNORED_NAMES = {"localhost", "localhost.localdomain", "local", "broadcasthost", "ip6-localhost", "ip6-loopback", "0.0.0.0"}
+
+# Binary domain set, all integers little-endian:
+#   header   magic(8) version(u32) domain_count(u32) block_size(u32) block_count(u32) index_offset(u64)
+#   blocks   per block: first key as varint(len) + bytes, then for every
+#            following key varint(shared prefix len) + varint(suffix len) + suffix
+#   index    block_count x u64 absolute block offsets
+# Keys are domains with their labels reversed ("ads.example.com" ->
+# "com.example.ads"), sorted bytewise, so a reader binary-searches the block
+# index on first keys, decodes one block, and checks each parent domain of a
+# query name the same way.
+BINARY_MAGIC = b"BPLDOMS\x00"
+BINARY_VERSION = 1
+BINARY_HEADER = struct.Struct("<8sIIIIQ")
+BINARY_OFFSET = struct.Struct("<Q")
+RPZ_SOA_SERIAL_RE = re.compile(r"^@ IN SOA \S+ \S+ \((\d+) ")
+
+def reverse_labels(domain: str) -> str:
+    return ".".join(reversed(domain.split(".")))
+
+def _parent_domains(domain: str):
+    labels = domain.split(".")
+    for i in range(1, len(labels)):
+        yield ".".join(labels[i:])
+
+def drop_redundant_subdomains(domains) -> list[str]:
+    """Sorted `domains` without the subdomains of another domain in the set."""
+    blocked = set(domains)
+    return sorted(domain for domain in blocked if not any(parent in blocked for parent in _parent_domains(domain)))
+
+def collect_blocked_domains(unified_rules: dict, variant: dict | None = None, reduce_subdomains: bool = True) -> list[str]:
+    """
+    Returns the sorted domains that can be blocked at the resolver: every
+    `||domain^` rule without options (and every hosts-file entry) selected for
+    `variant`, minus subdomains of another blocked domain unless
+    `reduce_subdomains` is false. A domain is left out when any exception
+    rule targets it or one of its subdomains, because a DNS block cannot let
+    part of a domain through.
+    """
+    selected = set(select_rules(unified_rules, variant, keep_covered=True))
+    domain_candidates = []
+    exception_domains = set()
+    for rule_data in unified_rules["rules"]:
+        rule_str = rule_data["string"]
+        if rule_data["type"] == RuleType.NETWORK and rule_data["is_exception"]:
+            domain = get_domain_from_network_rule(rule_str)
+            if domain: exception_domains.add(domain.lower())
+            continue
+        if rule_str not in selected: continue
+        if rule_data["type"] == RuleType.NETWORK:
+            domain_candidates.append(rule_data)
+        elif rule_data["type"] == RuleType.HOSTS_RULE:
+            parts = rule_str.split("#", 1)[0].split()
+            # "0.0.0.0 a.com b.com" lists several names on one line
+            for host in parts[1:]:
+                host = host.lower().rstrip(".")
+                if "." in host and host not in HOSTS_IGNORED_NAMES:
+                    domain_candidates.append({"string": f"||{host}^"})
+
+    # Same structure the unifier optimises with: domain -> {options: rule}
+    domain_block_rules = collect_domain_block_rules(domain_candidates)
+    blocked = {domain.lower() for domain, by_options in domain_block_rules.items() if "" in by_options and domain.isascii()}
+
+    excepted = set()
+    for exception_domain in exception_domains:
+        for candidate in (exception_domain, *_parent_domains(exception_domain)):
+            if candidate in blocked: excepted.add(candidate)
+    if excepted:
+        logger.info(f"DNS export: Leaving out {len(excepted)} domain(s) that exception rules partially allow.")
+    blocked -= excepted
+
+    if not reduce_subdomains:
+        return sorted(blocked)
+    domains = drop_redundant_subdomains(blocked)
+    logger.info(f"DNS export: {len(domains)} domain(s) blocked at the resolver ({len(blocked) - len(domains)} subdomain(s) redundant).")
+    return domains
+
+def next_rpz_serial(zone_path: pathlib.Path, now: datetime) -> int:
+    """
+    The SOA serial for a new RPZ zone, in the YYYYMMDDnn convention: the
+    first build of a day gets nn=00, every later build the previous serial
+    (read from the zone file being replaced) plus one, so the serial always
+    increases and secondaries transfer every build.
+    """
+    serial = int(now.strftime("%Y%m%d")) * 100
+    try:
+        with open(zone_path, encoding="utf-8") as f:
+            for line in f:
+                match = RPZ_SOA_SERIAL_RE.match(line)
+                if match:
+                    serial = max(serial, int(match.group(1)) + 1)
+                    break
+    except OSError:
+        pass # No previous zone
+    return serial
+
+def _format_lines(export_format: str, domains: list[str], dns_config: dict, version_timestamp: str, rpz_serial: int = 0):
+    sinkhole = dns_config.get("sinkhole_address", "0.0.0.0")
+    title = dns_config.get("title", "Brave Power List (DNS)")
+    comment = "#" if export_format in ("domains", "hosts", "dnsmasq", "unbound") else ";"
+    yield f"{comment} Title: {title}"
+    yield f"{comment} Version: {version_timestamp}"
+    yield f"{comment} Domains: {len(domains)}"
+    if export_format == "domains":
+        yield from domains
+    elif export_format == "hosts":
+        # hosts files cannot match subdomains; every listed name is blocked on its own,
+        # so this format is given the blocked domains before subdomain reduction
+        for domain in domains:
+            yield f"{sinkhole} {domain}"
+    elif export_format == "dnsmasq":
+        for domain in domains:
+            yield f"address=/{domain}/{sinkhole}"
+    elif export_format == "unbound":
+        yield "server:"
+        for domain in domains:
+            yield f'    local-zone: "{domain}." always_nxdomain'
+    elif export_format == "rpz":
+        zone = dns_config.get("rpz_zone", "rpz.brave-power-list.local")
+        yield "$TTL 300"
+        yield f"@ IN SOA localhost. hostmaster.{zone}. ({rpz_serial} 3600 600 604800 300)"
+        yield "  IN NS localhost."
+        for domain in domains:
+            yield f"{domain} CNAME ."
+            yield f"*.{domain} CNAME ."
+
+def _write_varint(f, value: int):
+    while True:
+        byte = value & 0x7F
+        value >>= 7
+        if value:
+            f.write(bytes((byte | 0x80,)))
+        else:
+            f.write(bytes((byte,)))
+            return
+
+def _read_varint(buf, pos: int) -> tuple[int, int]:
+    value = shift = 0
+    while True:
+        byte = buf[pos]
+        pos += 1
+        value |= (byte & 0x7F) << shift
+        if not byte & 0x80:
+            return value, pos
+        shift += 7
+
+def write_binary_domain_set(domains, output_path: pathlib.Path, block_size: int = 16) -> int:
+    """
+    Writes `domains` in the front-coded binary format described above.
+    Keys are sorted up front, then written block by block straight to the
+    file; the header is patched once the block index is known. Returns the
+    number of domains written.
+    """
+    keys = sorted({reverse_labels(domain).encode("ascii") for domain in domains})
+    block_offsets = []
+    with open(output_path, "wb") as f:
+        f.write(BINARY_HEADER.pack(BINARY_MAGIC, BINARY_VERSION, 0, block_size, 0, 0)) # Patched at the end
+        previous = b""
+        for index, key in enumerate(keys):
+            if index % block_size == 0:
+                block_offsets.append(f.tell())
+                _write_varint(f, len(key))
+                f.write(key)
+            else:
+                shared = 0
+                limit = min(len(previous), len(key))
+                while shared < limit and previous[shared] == key[shared]:
+                    shared += 1
+                _write_varint(f, shared)
+                _write_varint(f, len(key) - shared)
+                f.write(key[shared:])
+            previous = key
+        index_offset = f.tell()
+        for offset in block_offsets:
+            f.write(BINARY_OFFSET.pack(offset))
+        f.seek(0)
+        f.write(BINARY_HEADER.pack(BINARY_MAGIC, BINARY_VERSION, len(keys), block_size, len(block_offsets), index_offset))
+    return len(keys)
+
+class BinaryDomainSet:
+    """
+    Reference reader for the binary domain set: memory-maps the file and
+    answers `name in domain_set` for a name or any of its parent domains,
+    as a resolver plugin would.
+    """
+
+    def __init__(self, path: str | pathlib.Path):
+        self._file = open(path, "rb")
+        self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, self.domain_count, self.block_size, self.block_count, self._index_offset = BINARY_HEADER.unpack_from(self._map, 0)
+        if magic != BINARY_MAGIC or version != BINARY_VERSION:
+            self.close()
+            raise ValueError(f"{path} is not a version {BINARY_VERSION} binary domain set.")
+
+    def close(self):
+        if not self._map.closed: self._map.close()
+        self._file.close()
+
+    def _block_offset(self, block: int) -> int:
+        return BINARY_OFFSET.unpack_from(self._map, self._index_offset + block * BINARY_OFFSET.size)[0]
+
+    def _first_key(self, block: int) -> bytes:
+        length, pos = _read_varint(self._map, self._block_offset(block))
+        return self._map[pos:pos + length]
+
+    def _block_keys(self, block: int):
+        pos = self._block_offset(block)
+        length, pos = _read_varint(self._map, pos)
+        key = self._map[pos:pos + length]
+        pos += length
+        yield key
+        end = self._block_offset(block + 1) if block + 1 < self.block_count else self._index_offset
+        while pos < end:
+            shared, pos = _read_varint(self._map, pos)
+            length, pos = _read_varint(self._map, pos)
+            key = key[:shared] + self._map[pos:pos + length]
+            pos += length
+            yield key
+
+    def contains_exact(self, domain: str) -> bool:
+        key = reverse_labels(domain.lower().rstrip(".")).encode("ascii", "ignore")
+        low, high = 0, self.block_count - 1
+        block = -1
+        while low <= high: # Last block whose first key is <= key
+            mid = (low + high) // 2
+            if self._first_key(mid) <= key:
+                block, low = mid, mid + 1
+            else:
+                high = mid - 1
+        if block < 0:
+            return False
+        for candidate in self._block_keys(block):
+            if candidate == key: return True
+            if candidate > key: return False
+        return False
+
+    def __contains__(self, name: str) -> bool:
+        name = name.lower().rstrip(".")
+        return self.contains_exact(name) or any(self.contains_exact(parent) for parent in _parent_domains(name))
+
+    def __len__(self) -> int:
+        return self.domain_count
+
+def resolve_dns_outputs(dns_config: dict) -> list[dict]:
+    """The files the DNS export writes: [{"format", "output_filename"}, ...]."""
+    output_dir = pathlib.Path(dns_config.get("output_dir", "dns"))
+    basename = dns_config.get("basename", "BravePowerList")
+    outputs = []
+    for export_format in dns_config.get("formats", DNS_FORMATS):
+        if export_format not in FORMAT_EXTENSIONS:
+            logger.warning(f"DNS export: Unknown format '{export_format}'; skipping it.")
+            continue
+        outputs.append({"format": export_format, "output_filename": str(output_dir / f"{basename}.{FORMAT_EXTENSIONS[export_format]}")})
+    return outputs
+
+def export_dns_lists(unified_rules: dict, config: dict) -> dict:
+    """
+    Writes every configured DNS format (dns_export_options) from one shared
+    unifier result. The rules are selected as for the output variant named by
+    'variant' (default: every rule). Text formats are written line by line.
+
+    Returns:
+        {"success": bool, "domain_count": int, "outputs": [{"format", "output_filename", "success"}, ...]}
+    """
+    dns_config = config.get("dns_export_options", {})
+    variant = None
+    if dns_config.get("variant"):
+        from .generator import resolve_output_variants
+        variant = next((v for v in resolve_output_variants(config) if v["name"] == dns_config["variant"]), None)
+        if variant is None:
+            logger.error(f"DNS export: Output variant '{dns_config['variant']}' is not configured.")
+            return {"success": False, "domain_count": 0, "outputs": []}
+
+    all_domains = collect_blocked_domains(unified_rules, variant, reduce_subdomains=False)
+    domains = drop_redundant_subdomains(all_domains)
+    logger.info(f"DNS export: {len(domains)} domain(s) blocked at the resolver ({len(all_domains) - len(domains)} subdomain(s) "
+                f"redundant outside the hosts format).")
+    now = datetime.now()
+    version_timestamp = now.strftime("%Y%m%d.%H%M%S")
+    outputs = []
+    for output in resolve_dns_outputs(dns_config):
+        output_path = pathlib.Path(output["output_filename"])
+        try:
+            output_path.parent.mkdir(parents=True, exist_ok=True)
+            if output["format"] == "binary":
+                write_binary_domain_set(domains, output_path, dns_config.get("binary_block_size", 16))
+            else:
+                format_domains = all_domains if output["format"] == "hosts" else domains
+                rpz_serial = next_rpz_serial(output_path, now) if output["format"] == "rpz" else 0
+                with open(output_path, "w", encoding="utf-8") as f:
+                    for line in _format_lines(output["format"], format_domains, dns_config, version_timestamp, rpz_serial):
+                        f.write(line + "\n")
+            logger.info(f"DNS export: Wrote {output['format']} list to '{output_path.resolve()}'.")
+            outputs.append({**output, "success": True})
+        except (IOError, OSError) as e:
+            logger.error(f"DNS export: Failed to write {output['format']} list to {output_path.resolve()}: {e}")
+            outputs.append({**output, "success": False})
+    return {"success": all(output["success"] for output in outputs), "domain_count": len(domains), "outputs": outputs}
@@ -1,42 +1,387 @@
 # core_modules/downloader.py
 
 import asyncio
+import hashlib
 import logging
 import pathlib
-from parfive import Downloader, Results
+import random
+import time
+import zlib
+from urllib.parse import urlparse
+
+import aiohttp
+
+from .line_scanner import MappedListSource, is_local_source, local_source_path
+from .preprocessor import extract_include_targets
+from .sources import normalize_source_entries
+
+try:
+    import brotli # Optional: enables 'br' in Accept-Encoding
+except ImportError:
+    brotli = None
 
 # Configure a logger for this module.
 # When this module is imported, its logger name will be 'core_modules.downloader'.
 logger = logging.getLogger(__name__)
 
+RETRYABLE_STATUS_CODES = {408, 425, 429, 500, 502, 503, 504}
+USER_AGENT = "BravePowerList-Generator (+https://github.com/itsrody/BravePowerList)"
+NOT_MODIFIED = object() # Returned by SourceFetcher.fetch when a conditional request gets a 304
+
+
+class DownloadError(Exception):
+    """A failed fetch attempt. `retryable` tells the retry loop whether another attempt may succeed."""
+
+    def __init__(self, message: str, retryable: bool = True, retry_after: float | None = None):
+        super().__init__(message)
+        self.retryable = retryable
+        self.retry_after = retry_after
+
+
+def _temp_filename_for_url(url: str) -> str:
+    # Many lists share a basename (filter.txt, filters.txt), so name temp files by URL hash.
+    return hashlib.sha1(url.encode("utf-8")).hexdigest()[:20] + ".part"
+
+
+def _parse_retry_after(value: str | None) -> float | None:
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        return None # HTTP-date form is not worth honouring for list hosts
+
+
+def _content_range_start(value: str | None) -> int | None:
+    """First byte position of a 206 Content-Range header ("bytes 100-199/200"), or None if unparseable."""
+    if not value:
+        return None
+    unit, _, byte_range = value.strip().partition(" ")
+    first, dash, _ = byte_range.partition("-")
+    if unit.lower() != "bytes" or not dash or not first.isdigit():
+        return None
+    return int(first)
+
+
+def _default_accept_encoding() -> str:
+    return "gzip, br" if brotli is not None else "gzip"
+
+
+def decode_list_body(raw_bytes: bytes, content_encoding: str) -> str:
+    """Decompresses a transfer according to its Content-Encoding and decodes it as UTF-8."""
+    encoding = (content_encoding or "identity").strip().lower()
+    if encoding in ("gzip", "x-gzip"):
+        raw_bytes = zlib.decompress(raw_bytes, 16 + zlib.MAX_WBITS)
+    elif encoding == "deflate":
+        try:
+            raw_bytes = zlib.decompress(raw_bytes)
+        except zlib.error:
+            raw_bytes = zlib.decompress(raw_bytes, -zlib.MAX_WBITS) # Raw deflate, as some servers send
+    elif encoding == "br":
+        if brotli is None:
+            raise DownloadError("Server sent a brotli body but the 'brotli' package is not installed.", retryable=False)
+        raw_bytes = brotli.decompress(raw_bytes)
+    elif encoding not in ("identity", ""):
+        raise DownloadError(f"Unsupported Content-Encoding '{encoding}'.", retryable=False)
+    return raw_bytes.decode("utf-8", errors="replace")
+
+
+class SourceFetcher:
+    """
+    Fetches filter lists over one shared aiohttp session.
+
+    - Connections are limited globally (`max_conn`) and per host
+      (`max_conn_per_host`, with overrides in `host_connection_limits`).
+    - Failed attempts (connection errors, timeouts, truncated bodies,
+      408/425/429/5xx) are retried with exponential backoff and full jitter,
+      honouring Retry-After.
+    - Bodies are streamed to a partial file in `temp_dir`; when a transfer
+      breaks after `resume_min_bytes`, the next attempt asks for the rest
+      with a Range request guarded by If-Range.
+    - Mirrors are raced with the primary URL; the first successful response
+      wins and the others are cancelled.
+    - With `validators` ({"etag", "last_modified"} from an earlier fetch),
+      the request is conditional and a 304 returns NOT_MODIFIED.
+    - Every fetch records timing, throughput and the response validators
+      in `self.stats`.
+    """
+
+    def __init__(self, session: aiohttp.ClientSession, downloader_config: dict, temp_download_path: pathlib.Path):
+        self._session = session
+        self._temp_download_path = temp_download_path
+        self.max_conn_per_host = downloader_config.get("max_conn_per_host", 2)
+        self.host_connection_limits = downloader_config.get("host_connection_limits", {})
+        self.retries = downloader_config.get("retries", 4)
+        self.backoff_base = downloader_config.get("backoff_base_seconds", 0.5)
+        self.backoff_max = downloader_config.get("backoff_max_seconds", 30.0)
+        self.resume_min_bytes = downloader_config.get("resume_min_bytes", 256 * 1024)
+        accept_encoding = downloader_config.get("accept_encoding")
+        self.accept_encoding = ", ".join(accept_encoding) if accept_encoding else _default_accept_encoding()
+        self._host_semaphores: dict[str, asyncio.Semaphore] = {}
+        self.stats: dict[str, dict] = {}
+
+    def _host_semaphore(self, url: str) -> asyncio.Semaphore:
+        host = urlparse(url).hostname or ""
+        semaphore = self._host_semaphores.get(host)
+        if semaphore is None:
+            semaphore = asyncio.Semaphore(self.host_connection_limits.get(host, self.max_conn_per_host))
+            self._host_semaphores[host] = semaphore
+        return semaphore
+
+    def _backoff_delay(self, attempt: int, retry_after: float | None) -> float:
+        delay = random.uniform(0, min(self.backoff_max, self.backoff_base * (2 ** attempt)))
+        if retry_after is not None:
+            delay = max(delay, min(retry_after, self.backoff_max))
+        return delay
+
+    async def _open(self, url: str, headers: dict):
+        """Sends the request and returns (url, response, host_semaphore) once a 200/206/304 status arrives."""
+        semaphore = self._host_semaphore(url)
+        await semaphore.acquire()
+        try:
+            response = await self._session.get(url, headers=headers)
+        except (aiohttp.ClientError, asyncio.TimeoutError, OSError) as e:
+            semaphore.release()
+            raise DownloadError(f"{url}: {type(e).__name__}: {e}") from e
+        except BaseException:
+            semaphore.release()
+            raise
+        if response.status not in (200, 206, 304):
+            status = response.status
+            retry_after = _parse_retry_after(response.headers.get("Retry-After"))
+            response.release()
+            semaphore.release()
+            raise DownloadError(f"{url}: HTTP {status}", retryable=status in RETRYABLE_STATUS_CODES, retry_after=retry_after)
+        return url, response, semaphore
+
+    async def _open_first(self, candidates: list[str], headers: dict):
+        """Races the primary URL and its mirrors; returns the first successful response."""
+        if len(candidates) == 1:
+            return await self._open(candidates[0], headers)
+
+        pending = {asyncio.create_task(self._open(url, headers)) for url in candidates}
+        errors: list[DownloadError] = []
+        winner = None
+        try:
+            while pending and winner is None:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is not None:
+                        errors.append(task.exception())
+                    elif winner is None:
+                        winner = task.result()
+                    else: # Another candidate answered in the same tick; release it
+                        _, response, semaphore = task.result()
+                        response.release()
+                        semaphore.release()
+        finally:
+            for task in pending:
+                task.cancel()
+            for result in await asyncio.gather(*pending, return_exceptions=True):
+                if isinstance(result, tuple):
+                    _, response, semaphore = result
+                    response.release()
+                    semaphore.release()
+        if winner is None:
+            retryable = any(getattr(e, "retryable", True) for e in errors)
+            retry_after = max((e.retry_after for e in errors if getattr(e, "retry_after", None) is not None), default=None)
+            raise DownloadError("; ".join(str(e) for e in errors), retryable=retryable, retry_after=retry_after)
+        if winner[0] != candidates[0]:
+            logger.info(f"Mirror {winner[0]} answered first for {candidates[0]}.")
+        return winner
+
+    async def _stream_to_file(self, response: aiohttp.ClientResponse, part_path: pathlib.Path, append: bool, stats: dict):
+        written = 0
+        try:
+            with open(part_path, "ab" if append else "wb") as f:
+                async for chunk in response.content.iter_chunked(64 * 1024):
+                    f.write(chunk)
+                    written += len(chunk)
+                    stats["wire_bytes"] += len(chunk)
+        except (aiohttp.ClientError, asyncio.TimeoutError, OSError) as e:
+            raise DownloadError(f"{response.url}: transfer interrupted after {written} bytes ({type(e).__name__}: {e})") from e
+        expected = response.content_length
+        if expected is not None and written < expected:
+            raise DownloadError(f"{response.url}: truncated body ({written} of {expected} bytes)")
+
+    async def fetch(self, source: dict, validators: dict | None = None):
+        """
+        Fetches one source ({"url": ..., "mirrors": [...]}); returns its
+        decoded body, NOT_MODIFIED for a conditional request answered with
+        304, or None on failure.
+        """
+        url = source["url"]
+        candidates = [url] + list(source.get("mirrors", []))
+        part_path = self._temp_download_path / _temp_filename_for_url(url)
+        stats = {"url": url, "served_by": None, "attempts": 0, "wire_bytes": 0, "decoded_bytes": 0,
+                 "content_encoding": None, "resumed": False, "seconds": 0.0, "status": "failed", "last_error": None,
+                 "etag": None, "last_modified": None}
+        self.stats[url] = stats
+        resume_state = None # {"url", "validator", "encoding"} of the transfer being resumed
+        started = time.perf_counter()
+
+        try:
+            for attempt in range(self.retries + 1):
+                stats["attempts"] = attempt + 1
+                headers = {"Accept-Encoding": self.accept_encoding}
+                try:
+                    offset = part_path.stat().st_size if resume_state and part_path.exists() else 0
+                    if resume_state and offset >= self.resume_min_bytes:
+                        headers["Range"] = f"bytes={offset}-"
+                        headers["If-Range"] = resume_state["validator"]
+                        served_by, response, semaphore = await self._open(resume_state["url"], headers)
+                    else:
+                        offset = 0
+                        if validators:
+                            if validators.get("etag"): headers["If-None-Match"] = validators["etag"]
+                            if validators.get("last_modified"): headers["If-Modified-Since"] = validators["last_modified"]
+                        served_by, response, semaphore = await self._open_first(candidates, headers)
+                    if response.status == 304:
+                        response.release()
+                        semaphore.release()
+                        stats.update({"served_by": served_by, "status": "not_modified",
+                                      "seconds": round(time.perf_counter() - started, 3)})
+                        return NOT_MODIFIED
+                    if offset > 0 and response.status == 206:
+                        range_start = _content_range_start(response.headers.get("Content-Range"))
+                        if range_start != offset: # Appending would corrupt the body; start over from byte zero
+                            response.release()
+                            semaphore.release()
+                            resume_state = None
+                            part_path.unlink(missing_ok=True)
+                            raise DownloadError(f"{served_by}: Content-Range start {range_start} does not match "
+                                                f"resume offset {offset}; restarting the transfer")
+                    try:
+                        append = offset > 0 and response.status == 206
+                        if append:
+                            stats["resumed"] = True
+                            logger.info(f"Resuming {served_by} at byte {offset}.")
+                        else:
+                            encoding = response.headers.get("Content-Encoding", "identity")
+                            stats["etag"] = response.headers.get("ETag")
+                            stats["last_modified"] = response.headers.get("Last-Modified")
+                            validator = response.headers.get("ETag")
+                            if not validator or validator.startswith("W/"): # If-Range needs a strong validator
+                                validator = response.headers.get("Last-Modified")
+                            resume_state = {"url": served_by, "validator": validator, "encoding": encoding} if validator else None
+                        await self._stream_to_file(response, part_path, append, stats)
+                    finally:
+                        response.release()
+                        semaphore.release()
+
+                    encoding = resume_state["encoding"] if resume_state else response.headers.get("Content-Encoding", "identity")
+                    content = decode_list_body(part_path.read_bytes(), encoding)
+                    elapsed = time.perf_counter() - started
+                    stats.update({
+                        "served_by": served_by, "content_encoding": encoding.lower(), "status": "ok",
+                        "decoded_bytes": len(content), "seconds": round(elapsed, 3),
+                        "throughput_kib_s": round(stats["wire_bytes"] / 1024 / elapsed, 1) if elapsed > 0 else None,
+                    })
+                    return content
+                except (DownloadError, zlib.error) as e:
+                    retryable = getattr(e, "retryable", True)
+                    if isinstance(e, zlib.error): # Corrupt compressed body: start over, without resuming
+                        resume_state = None
+                    stats["last_error"] = str(e)
+                    if not retryable or attempt == self.retries:
+                        logger.error(f"Failed to download {url} after {attempt + 1} attempt(s): {e}")
+                        return None
+                    delay = self._backoff_delay(attempt, getattr(e, "retry_after", None))
+                    logger.warning(f"Attempt {attempt + 1} for {url} failed ({e}); retrying in {delay:.2f}s.")
+                    await asyncio.sleep(delay)
+            return None
+        finally:
+            stats["seconds"] = stats["seconds"] or round(time.perf_counter() - started, 3)
+            try:
+                part_path.unlink(missing_ok=True)
+            except OSError as e_unlink:
+                logger.warning(f"Could not delete temporary file {part_path}: {e_unlink}")
+
+
+def _map_local_sources(sources: list[str]) -> dict[str, MappedListSource]:
+    """Wraps file:// URLs and local paths for the mmap line scanner; nothing is read yet."""
+    mapped: dict[str, MappedListSource] = {}
+    for source in sources:
+        path = local_source_path(source)
+        try:
+            with open(path, "rb"):
+                pass
+        except OSError as e:
+            logger.error(f"Cannot open local filter list {path}: {e}")
+            continue
+        mapped[source] = MappedListSource(path)
+        logger.info(f"Using local filter list {path} ({path.stat().st_size} bytes, memory-mapped).")
+    return mapped
+
+
+def create_session(downloader_config: dict) -> aiohttp.ClientSession:
+    """Creates the shared aiohttp session (connection pool) used for all downloads of a run."""
+    timeout = aiohttp.ClientTimeout(
+        total=downloader_config.get("request_timeout_seconds", 120),
+        connect=downloader_config.get("connect_timeout_seconds", 15),
+        sock_read=downloader_config.get("read_timeout_seconds", 30),
+    )
+    return aiohttp.ClientSession(
+        connector=aiohttp.TCPConnector(limit=downloader_config.get("max_conn", 5)),
+        timeout=timeout,
+        auto_decompress=False, # Bodies are decoded after the (possibly resumed) transfer completes
+        headers={"User-Agent": USER_AGENT},
+    )
+
+
 async def download_filter_lists(
-    filter_list_urls: list[str],
-    downloader_config: dict
-) -> dict[str, str]:
+    filter_list_urls: list,
+    downloader_config: dict,
+    download_stats: dict | None = None
+) -> dict[str, str | MappedListSource]:
     """
-    Downloads filter lists from the given URLs concurrently using parfive.
+    Downloads filter lists concurrently over one shared aiohttp session.
+
+    `!#include` directives are resolved as well: after each round of
+    downloads, the include targets referenced by the lists just fetched are
+    downloaded concurrently in the next round, until no new targets remain
+    or `max_include_depth` is reached. Every URL is fetched at most once per
+    call (the per-call source cache), which also breaks include cycles.
+
+    `file://` URLs and local paths are not copied or downloaded: they are
+    returned as MappedListSource objects that the parser reads through the
+    mmap line scanner.
 
     Args:
-        filter_list_urls: A list of URLs pointing to filter list files.
+        filter_list_urls: A list of sources: URLs (http/https/file), local
+                          paths, or {"url": ..., "mirrors": [...]} entries.
         downloader_config: A dictionary containing downloader-specific
                            configurations, e.g.,
                            {
                                "max_conn": 5,
+                               "max_conn_per_host": 2,
+                               "host_connection_limits": {"raw.githubusercontent.com": 2},
+                               "retries": 4,
+                               "backoff_base_seconds": 0.5,
+                               "backoff_max_seconds": 30,
+                               "resume_min_bytes": 262144,
                                "temp_dir": "./temp_downloads/",
-                               "overwrite_temp_files": True
+                               "resolve_includes": True,
+                               "max_include_depth": 3
                            }
+        download_stats: Optional dictionary that receives per-source timing
+                        and throughput statistics, keyed by URL.
 
     Returns:
         A dictionary where keys are the successful URLs and values are the
-        raw string content (UTF-8 decoded) of the downloaded filter lists.
+        raw string content (UTF-8 decoded) of the downloaded filter lists,
+        or a MappedListSource for local lists. Included sub-lists appear
+        under their resolved URL. Lists served by a mirror are keyed by
+        their primary URL.
     """
-    if not filter_list_urls:
+    sources = normalize_source_entries(filter_list_urls)
+    if not sources:
         logger.warning("No filter list URLs provided to downloader.")
         return {}
 
-    max_connections = downloader_config.get("max_conn", 5)
     temp_download_path_str = downloader_config.get("temp_dir", "./temp_downloads/")
-    overwrite_temp = downloader_config.get("overwrite_temp_files", True)
+    resolve_includes = downloader_config.get("resolve_includes", True)
+    max_include_depth = downloader_config.get("max_include_depth", 3)
 
     # The temp_download_path should be relative to the project root (where the script is run)
     # If main_generator.py is in core_modules, and it sets up PROJECT_ROOT correctly,
@@ -50,29 +395,18 @@ async def download_filter_lists(
         logger.error(f"Could not create temporary download directory {temp_download_path.resolve()}: {e}")
         return {} # Fail if temp dir cannot be created
 
-    downloader = Downloader(
-        max_conn=max_connections,
-        progress=False,
-        overwrite=overwrite_temp,
-        config_dir=False # Prevent parfive from creating its own .parfive config directory
-    )
-
-    downloaded_content: dict[str, str] = {}
+    source_cache: dict[str, str | MappedListSource] = {}
+    attempted_urls: set[str] = set()
 
-    if not filter_list_urls:
-        logger.info("No URLs to download.")
-        return downloaded_content
-
-    logger.info(f"Starting download of {len(filter_list_urls)} filter list(s) into '{temp_download_path.resolve()}'.")
-
-    for url in filter_list_urls:
-        if not url or not isinstance(url, str) or not (url.startswith("http://") or url.startswith("https://")):
-            logger.warning(f"Skipping invalid or non-HTTP/S URL: {url}")
+    pending_sources = []
+    for source in sources:
+        url = source["url"]
+        if not (url.startswith("http://") or url.startswith("https://") or is_local_source(url)):
+            logger.warning(f"Skipping URL that is neither HTTP/S nor an existing local file: {url}")
             continue
-        downloader.enqueue_file(url, path=str(temp_download_path)) # Ensure path is string for parfive
-        logger.debug(f"Enqueued for download: {url}")
+        pending_sources.append(source)
 
-    if not downloader.queued_downloads:
+    if not pending_sources:
         logger.info("No valid URLs were enqueued for download.")
         # Clean up temp_download_path if it was created and is empty
         try:
@@ -80,42 +414,52 @@ async def download_filter_lists(
                 temp_download_path.rmdir()
         except OSError:
             pass # Ignore cleanup error if it fails
-        return downloaded_content
+        return {}
 
-    results: Results = await downloader.download()
-    logger.info(f"Download process completed. Errors encountered for {len(results.errors_set)} URL(s).")
+    logger.info(f"Starting download of {len(pending_sources)} filter list(s) into '{temp_download_path.resolve()}'.")
 
-    for i, downloaded_file_path_obj in enumerate(results):
-        original_url = downloader.queued_downloads[i].url
-        error = results.errors[i]
+    async with create_session(downloader_config) as session:
+        fetcher = SourceFetcher(session, downloader_config, temp_download_path)
+        depth = 0
+        while pending_sources:
+            attempted_urls.update(source["url"] for source in pending_sources)
+            batch_content: dict[str, str | MappedListSource] = _map_local_sources(
+                [source["url"] for source in pending_sources if is_local_source(source["url"])])
+            remote_sources = [source for source in pending_sources if source["url"] not in batch_content
+                              and not is_local_source(source["url"])]
+            if remote_sources:
+                bodies = await asyncio.gather(*(fetcher.fetch(source) for source in remote_sources))
+                for source, body in zip(remote_sources, bodies):
+                    if body is not None:
+                        batch_content[source["url"]] = body
+            source_cache.update(batch_content)
 
-        if error:
-            logger.error(f"Failed to download {original_url}: {error}")
-            partial_file_path = downloader.queued_downloads[i].filepath_partial
-            if partial_file_path and partial_file_path.exists():
-                try:
-                    partial_file_path.unlink()
-                    logger.debug(f"Cleaned up partial temporary file: {partial_file_path}")
-                except OSError as e_unlink:
-                    logger.warning(f"Could not delete partial temporary file {partial_file_path}: {e_unlink}")
-            continue
+            if not resolve_includes:
+                break
+            next_round: list[dict] = []
+            for url, content in batch_content.items():
+                for target in extract_include_targets(url, content):
+                    if target in attempted_urls or any(s["url"] == target for s in next_round):
+                        continue
+                    if not (target.startswith("http://") or target.startswith("https://") or is_local_source(target)):
+                        logger.warning(f"Skipping !#include target '{target}' from {url}: not HTTP/S and not an existing local file.")
+                        continue
+                    next_round.append({"url": target, "mirrors": []})
+            if next_round and depth >= max_include_depth:
+                logger.warning(f"Maximum !#include depth ({max_include_depth}) reached; {len(next_round)} target(s) not fetched.")
+                break
+            if next_round:
+                logger.info(f"Resolving {len(next_round)} !#include target(s) (depth {depth + 1}).")
+            pending_sources = next_round
+            depth += 1
 
-        if downloaded_file_path_obj and downloaded_file_path_obj.exists():
-            try:
-                logger.debug(f"Successfully downloaded to temporary location: {downloaded_file_path_obj}")
-                content = downloaded_file_path_obj.read_text(encoding='utf-8')
-                downloaded_content[original_url] = content
-                logger.info(f"Successfully downloaded and read content from: {original_url}")
-            except Exception as e_read:
-                logger.error(f"Error reading downloaded file {downloaded_file_path_obj} for URL {original_url}: {e_read}")
-            finally:
-                try:
-                    downloaded_file_path_obj.unlink()
-                    logger.debug(f"Cleaned up temporary file: {downloaded_file_path_obj}")
-                except OSError as e_unlink:
-                    logger.warning(f"Could not delete temporary file {downloaded_file_path_obj}: {e_unlink}")
-        else:
-            logger.error(f"Download for {original_url} reported no error, but temp file not found at {downloaded_file_path_obj}.")
+    for url, stats in fetcher.stats.items():
+        if stats["status"] == "ok":
+            logger.info(f"Downloaded {url} via {stats['served_by']}: {stats['wire_bytes']} bytes on the wire "
+                        f"({stats['content_encoding']}), {stats['decoded_bytes']} decoded, {stats['attempts']} attempt(s), "
+                        f"{stats['seconds']}s, {stats['throughput_kib_s']} KiB/s{', resumed' if stats['resumed'] else ''}.")
+    if download_stats is not None:
+        download_stats.update(fetcher.stats)
 
     try:
         if temp_download_path.exists() and not any(temp_download_path.iterdir()):
@@ -125,10 +469,10 @@ async def download_filter_lists(
         logger.warning(f"Could not remove temporary download directory {temp_download_path.resolve()} "
                        f"(it might not be empty or permissions issue): {e}")
 
-    if not downloaded_content:
+    if not source_cache:
         logger.warning("No filter lists were successfully downloaded and read.")
     else:
-        logger.info(f"Successfully downloaded and processed content for {len(downloaded_content)} "
-                    f"out of {len(filter_list_urls)} provided valid URL(s).")
+        logger.info(f"Successfully downloaded and processed content for {len(source_cache)} "
+                    f"list(s) ({len(sources)} configured, includes resolved).")
 
-    return downloaded_content
+    return source_cache
@@ -6,6 +6,21 @@ import pathlib
 
 logger = logging.getLogger(__name__)
 
+def build_header_lines(header_config: dict, version_timestamp: str | None = None) -> list[str]:
+    """The '! Title/Description/Author/Version' header written at the top of every list."""
+    title = header_config.get("title", "Brave Power List")
+    description = header_config.get("description", "Brave browser unified and optimized filter list.")
+    author = header_config.get("author", "Murtaza Salih") # Default to PRD specified author
+    if version_timestamp is None:
+        version_timestamp = datetime.now().strftime("%Y%m%d.%H%M%S")
+    return [
+        f"! Title: {title}",
+        f"! Description: {description}",
+        f"! Author: {author}",
+        f"! Version: {version_timestamp}",
+        "!"
+    ]
+
 def generate_brave_power_list(
     optimized_rule_strings: list[str],
     config: dict
@@ -33,19 +48,7 @@ def generate_brave_power_list(
     if not header_config: # Should not happen if config is well-defined
         logger.warning("Generator: 'generator_header' not found in configuration. Using default header values.")
 
-    title = header_config.get("title", "Brave Power List")
-    description = header_config.get("description", "Brave browser unified and optimized filter list.")
-    author = header_config.get("author", "Murtaza Salih") # Default to PRD specified author
-
-    version_timestamp = datetime.now().strftime("%Y%m%d.%H%M%S")
-
-    header_lines = [
-        f"! Title: {title}",
-        f"! Description: {description}",
-        f"! Author: {author}",
-        f"! Version: {version_timestamp}",
-        "!" 
-    ]
+    header_lines = build_header_lines(header_config)
 
     # Output path is relative to where the main script is executed (project root)
     output_path = pathlib.Path(output_filename_str)
@@ -72,3 +75,80 @@ def generate_brave_power_list(
     except Exception as e:
         logger.error(f"Generator: An unexpected error occurred while writing to {output_path.resolve()}: {e}")
         return False
+
+
+def resolve_output_variants(config: dict) -> list[dict]:
+    """
+    Returns the output variants declared in config['output_variants'], each
+    with its own 'output_filename' and a 'generator_header' merged over the
+    global one. Without 'output_variants', the single list described by
+    'output_filename' / 'generator_header' is the only variant.
+    """
+    global_header = config.get("generator_header", {})
+    declared_variants = config.get("output_variants")
+    if not declared_variants:
+        return [{"name": "default", "output_filename": config.get("output_filename"), "generator_header": global_header}]
+
+    variants = []
+    for index, variant in enumerate(declared_variants):
+        resolved = dict(variant)
+        resolved.setdefault("name", f"variant_{index}")
+        resolved["generator_header"] = {**global_header, **variant.get("generator_header", {})}
+        if not resolved.get("output_filename"):
+            logger.error(f"Generator: Output variant '{resolved['name']}' has no 'output_filename'; skipping it.")
+            continue
+        variants.append(resolved)
+    return variants
+
+def variants_include_comments(config: dict) -> bool:
+    """Whether any output variant keeps comments; if none does, the parser can skip them."""
+    return any(variant.get("include_comments", True) for variant in resolve_output_variants(config))
+
+def provenance_index_path(output_filename: str, index_config: dict) -> pathlib.Path:
+    return pathlib.Path(output_filename + index_config.get("suffix", ".index"))
+
+def generate_output_variants(unified_rules: dict, config: dict) -> dict:
+    """
+    Writes every output variant from one shared unifier result (see
+    unifier_optimizer.collect_unified_rules). Only the per-variant selection
+    and the file write are repeated; parsing, rephrasing, deduplication and
+    optimisation have already happened once.
+
+    With provenance_index_options.enabled, a provenance index (see
+    provenance_index.py) is written next to every variant.
+
+    Returns:
+        {"success": bool, "outputs": [{"name", "output_filename", "rule_count", "success"[, "index_filename"]}, ...]}
+    """
+    from .unifier_optimizer import select_rules
+    from .provenance_index import write_provenance_index
+
+    index_config = config.get("provenance_index_options", {})
+    variants = resolve_output_variants(config)
+    if not variants:
+        logger.error("Generator: No usable output variants configured.")
+        return {"success": False, "outputs": []}
+
+    outputs = []
+    for variant in variants:
+        variant_rule_strings = select_rules(unified_rules, variant)
+        logger.info(f"Generator: Variant '{variant['name']}' selected {len(variant_rule_strings)} lines.")
+        variant_success = generate_brave_power_list(variant_rule_strings, variant)
+        output = {
+            "name": variant["name"],
+            "output_filename": variant["output_filename"],
+            "rule_count": len(variant_rule_strings),
+            "success": variant_success,
+        }
+        if variant_success and index_config.get("enabled", False):
+            index_path = provenance_index_path(variant["output_filename"], index_config)
+            try:
+                host_count = write_provenance_index(unified_rules, variant_rule_strings,
+                                                    len(build_header_lines(variant["generator_header"], "")), index_path)
+                logger.info(f"Generator: Wrote provenance index '{index_path.resolve()}' ({host_count} hosts).")
+                output["index_filename"] = str(index_path)
+            except OSError as e:
+                logger.error(f"Generator: Failed to write provenance index {index_path.resolve()}: {e}")
+                output["success"] = False
+        outputs.append(output)
+    return {"success": all(output["success"] for output in outputs), "outputs": outputs}
@@ -0,0 +1,84 @@
+# core_modules/incremental.py
+
+import json
+import logging
+
+from .parser_validator import parse_and_validate_rules
+from .rephraser import rephrase_rules
+
+logger = logging.getLogger(__name__)
+
+
+class IncrementalRuleCache:
+    """
+    The per-line results (parsed and rephrased rule objects) of the previous
+    version of every source, keyed by the raw line. When a new version of a
+    source arrives, the lines are diffed by hash against the previous
+    version: lines already seen are carried over with their new line
+    numbers, and only inserted lines go through parse_and_validate_rules'
+    per-line validation and rephrase_rules. Preprocessor directives and
+    !#include expansion still run over the whole source, since whether a
+    line is active depends on its context.
+
+    A rule's parse and rephrase results depend on its text alone under a
+    given configuration, so the cache is dropped whenever the parser or
+    rephraser options change.
+    """
+
+    def __init__(self):
+        self.lines: dict[str, dict[str, dict]] = {} # source url -> raw line -> final rule object
+        self._fingerprint: str | None = None
+
+    def _check_fingerprint(self, parser_config: dict, rephraser_config: dict, brave_scriptlet_metadata: dict):
+        fingerprint = json.dumps([parser_config, rephraser_config, sorted(brave_scriptlet_metadata or {})], sort_keys=True, default=str)
+        if fingerprint != self._fingerprint:
+            if self.lines:
+                logger.info("Incremental: Parser or rephraser configuration changed; discarding cached line results.")
+            self.lines.clear()
+            self._fingerprint = fingerprint
+
+    def parse_and_rephrase(
+        self,
+        raw_lists_data: dict,
+        parser_config: dict,
+        brave_scriptlet_metadata: dict,
+        rephraser_config: dict,
+        top_level_sources: list[str] | None = None
+    ) -> list[dict]:
+        """
+        Equivalent to rephrase_rules(parse_and_validate_rules(...)) over
+        `raw_lists_data`, reusing the previous results of unchanged lines.
+        The cache entries of the sources in `raw_lists_data` are replaced by
+        this version's lines; other sources are left alone.
+        """
+        self._check_fingerprint(parser_config, rephraser_config, brave_scriptlet_metadata)
+
+        def reuse_line(source_url: str, raw_line: str) -> dict | None:
+            previous = self.lines.get(source_url)
+            return previous.get(raw_line) if previous else None
+
+        parsed_rules = parse_and_validate_rules(raw_lists_data, parser_config, top_level_sources, reuse_line=reuse_line)
+        new_positions = [position for position, rule_obj in enumerate(parsed_rules)
+                         if reuse_line(rule_obj["source_url"], rule_obj["raw_line_string"]) is None]
+        rephrased_new = rephrase_rules([parsed_rules[position] for position in new_positions], brave_scriptlet_metadata, rephraser_config)
+        final_rules = list(parsed_rules)
+        for position, rule_obj in zip(new_positions, rephrased_new): # rephrase_rules returns one object per input, in order
+            final_rules[position] = rule_obj
+
+        updated: dict[str, dict[str, dict]] = {source_url: {} for source_url in raw_lists_data}
+        for rule_obj in final_rules:
+            updated.setdefault(rule_obj["source_url"], {})[rule_obj["raw_line_string"]] = rule_obj
+        for source_url, current in updated.items():
+            previous = self.lines.get(source_url, {})
+            inserted = sum(1 for raw_line in current if raw_line not in previous)
+            deleted = sum(1 for raw_line in previous if raw_line not in current)
+            if previous:
+                logger.info(f"Incremental: {source_url}: {inserted} line(s) inserted, {deleted} deleted, "
+                            f"{len(current) - inserted} reused.")
+            self.lines[source_url] = current
+        logger.info(f"Incremental: Parsed and rephrased {len(new_positions)} new of {len(final_rules)} line(s).")
+        return final_rules
+
+    def forget(self, source_urls):
+        for source_url in source_urls:
+            self.lines.pop(source_url, None)
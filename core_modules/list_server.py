@@ -0,0 +1,536 @@
+# core_modules/list_server.py
+
+import asyncio
+import gzip
+import hashlib
+import json
+import logging
+import os
+import pathlib
+import random
+import re
+import time
+from collections import deque
+from email.utils import formatdate
+
+from aiohttp import web
+
+from .downloader import NOT_MODIFIED, SourceFetcher, create_session
+from .generator import build_header_lines, resolve_output_variants
+from .line_scanner import MappedListSource, is_local_source, local_source_path
+from .incremental import IncrementalRuleCache
+from .preprocessor import extract_include_targets
+from .rule_budget import apply_rule_budget
+from .rule_cost import score_unified_rules
+from .sources import normalize_source_entries
+from .unifier_optimizer import UnifiedRuleSet, select_rules
+
+try:
+    import resource # Unix only: peak RSS for /stats
+except ImportError:
+    resource = None
+
+logger = logging.getLogger(__name__)
+
+# "! Expires: 4 days (update frequency)", "! Expires: 12 hours"
+EXPIRES_RE = re.compile(r"^!\s*Expires:\s*(\d+)\s*(days?|d|hours?|h)\b", re.IGNORECASE | re.MULTILINE)
+EXPIRES_HEAD_BYTES = 4096 # The Expires header sits in the first lines of a list
+REBUILD_HISTORY_SIZE = 50
+
+
+def parse_expires_seconds(content) -> float | None:
+    """Returns the `! Expires:` period of a list in seconds, or None if it has none."""
+    if isinstance(content, MappedListSource):
+        try:
+            with open(content.path, "rb") as f:
+                head = f.read(EXPIRES_HEAD_BYTES).decode("utf-8", "replace")
+        except OSError:
+            return None
+    else:
+        head = content[:EXPIRES_HEAD_BYTES]
+    match = EXPIRES_RE.search(head)
+    if not match:
+        return None
+    amount = int(match.group(1))
+    return amount * (86400 if match.group(2).lower().startswith("d") else 3600)
+
+
+def _accepts_gzip(accept_encoding: str) -> bool:
+    for coding in accept_encoding.split(","):
+        name, _, params = coding.strip().partition(";")
+        if name.strip().lower() in ("gzip", "*"):
+            return params.replace(" ", "").lower() not in ("q=0", "q=0.0", "q=0.00", "q=0.000")
+    return False
+
+
+def _make_document(text: str, rule_count: int) -> dict:
+    """A served representation: identity and gzip bodies with their strong ETags."""
+    body = text.encode("utf-8")
+    digest = hashlib.blake2b(body, digest_size=16).hexdigest()
+    return {
+        "body": body,
+        "gzip": gzip.compress(body, compresslevel=6, mtime=0),
+        "etag": f'"{digest}"',
+        "gzip_etag": f'"{digest}-gz"',
+        "last_modified": formatdate(usegmt=True),
+        "rule_count": rule_count,
+    }
+
+
+def _shard_index(rule_string: str, shard_count: int) -> int:
+    # Hash sharding keeps a rule in the same shard across rebuilds, so a
+    # change only touches the shards that hold the changed rules.
+    return int.from_bytes(hashlib.blake2b(rule_string.encode("utf-8"), digest_size=4).digest(), "big") % shard_count
+
+
+def _current_rss_bytes() -> int | None:
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError, AttributeError):
+        return None
+
+
+class SourceGroupState:
+    """
+    One configured source and the lists it pulls in with `!#include`, with
+    its fetched documents, its rephrased rules (kept between rebuilds) and
+    its refresh schedule.
+    """
+
+    def __init__(self, source: dict, initial_poll_seconds: float):
+        self.source = source
+        self.url = source["url"]
+        self.documents: dict[str, dict] = {} # url -> {"content", "digest", "validators", "stat", "includes", "expires_seconds"}
+        self.rephrased_rules: list[dict] = []
+        self.poll_interval = initial_poll_seconds
+        self.next_poll = 0.0 # time.monotonic(); 0 polls on start-up
+        self.change_interval_ewma: float | None = None
+        self.last_changed_monotonic: float | None = None
+        self.last_checked: float | None = None
+        self.last_changed: float | None = None
+        self.expires_seconds: float | None = None
+        self.polls = 0
+        self.changes = 0
+        self.failures = 0
+
+    def to_stats(self, now: float) -> dict:
+        return {
+            "url": self.url,
+            "documents": sorted(self.documents),
+            "rules": len(self.rephrased_rules),
+            "polls": self.polls,
+            "changes": self.changes,
+            "failures": self.failures,
+            "last_checked": self.last_checked,
+            "last_changed": self.last_changed,
+            "poll_interval_seconds": round(self.poll_interval, 1),
+            "next_poll_in_seconds": round(max(0.0, self.next_poll - now), 1),
+            "change_interval_ewma_seconds": round(self.change_interval_ewma, 1) if self.change_interval_ewma else None,
+            "expires_seconds": self.expires_seconds,
+        }
+
+
+class ListServer:
+    """
+    Long-running `serve` mode. Keeps every source's parsed and rephrased
+    rules in memory, polls each source on its own schedule and rebuilds only
+    what changed, and serves the output variants over HTTP:
+
+        GET  /lists/<variant>.txt                 the full list
+        GET  /lists/<variant>/shards.json         shard index (urls, ETags, rule counts)
+        GET  /lists/<variant>/shards/<n>.txt      one shard
+        GET  /stats                               rebuild latency, memory and per-source schedule
+        GET  /reports/rule-cost.json              the latest rule cost report
+        GET  /reports/rule-budget.json            the latest rule budget report
+        POST /refresh                             poll every source now
+
+    Lists are served with strong ETags (If-None-Match answers 304) and
+    pre-compressed gzip bodies, so edge caches revalidate cheaply. A
+    variant (or shard) whose rules did not change keeps its ETag across
+    rebuilds.
+
+    Polling is conditional (ETag / Last-Modified; local files by size and
+    mtime) and adaptive: each source's interval follows an EWMA of how
+    often it actually changed, grows while it stays unchanged, is capped by
+    the list's `! Expires:` period and clamped to
+    [min_poll_seconds, max_poll_seconds].
+    """
+
+    def __init__(self, config: dict, brave_scriptlets_data: dict | None = None):
+        self.config = config
+        self.serve_config = config.get("serve_options", {})
+        self.downloader_config = config.get("downloader_options", {})
+        self.brave_scriptlets_data = brave_scriptlets_data or {}
+
+        self.min_poll = self.serve_config.get("min_poll_seconds", 300)
+        self.max_poll = self.serve_config.get("max_poll_seconds", 86400)
+        self.failure_retry = self.serve_config.get("failure_retry_seconds", 600)
+        self.ewma_alpha = self.serve_config.get("change_ewma_alpha", 0.3)
+        self.poll_fraction = self.serve_config.get("poll_fraction", 0.5)
+        self.unchanged_backoff = self.serve_config.get("unchanged_backoff", 1.25)
+        self.shard_count = max(1, self.serve_config.get("shard_count", 8))
+        self.cache_max_age = self.serve_config.get("cache_max_age_seconds", 300)
+        self.write_output_files = self.serve_config.get("write_output_files", False)
+        self.resolve_includes = self.downloader_config.get("resolve_includes", True)
+        self.max_include_depth = self.downloader_config.get("max_include_depth", 3)
+
+        initial_poll = self.serve_config.get("initial_poll_seconds", 3600)
+        self.groups = [SourceGroupState(source, initial_poll) for source in normalize_source_entries(config.get("filter_list_urls", []))]
+        self.variants = resolve_output_variants(config)
+        self.published: dict[str, dict] = {} # variant name -> {"rules_digest", "full", "shards": [...]}
+        self.rebuild_history: deque = deque(maxlen=REBUILD_HISTORY_SIZE)
+        self.rule_cache = IncrementalRuleCache()
+        self.unified_set = UnifiedRuleSet(config.get("unifier_optimizer_options", {}))
+        self.cost_report: dict | None = None
+        self.budget_report: dict | None = None
+        self.started = time.time()
+        self._fetcher: SourceFetcher | None = None
+        self._wake = asyncio.Event()
+        self._rebuild_lock = asyncio.Lock()
+
+    # --- Fetching -----------------------------------------------------------
+
+    async def _refresh_document(self, url: str, mirrors: list[str], previous: dict | None) -> tuple[dict | None, bool | None]:
+        """Returns (document, changed); changed is None when the fetch failed and `previous` was kept."""
+        if is_local_source(url):
+            path = local_source_path(url)
+            try:
+                stat = path.stat()
+            except OSError as e:
+                logger.error(f"Serve: Cannot stat local filter list {path}: {e}")
+                return previous, None
+            stat_key = (stat.st_size, stat.st_mtime_ns)
+            if previous and previous["stat"] == stat_key:
+                return previous, False
+            content, digest, validators = MappedListSource(path), None, None
+        else:
+            body = await self._fetcher.fetch({"url": url, "mirrors": mirrors}, previous["validators"] if previous else None)
+            if body is NOT_MODIFIED:
+                return previous, False
+            if body is None:
+                return previous, None
+            digest = hashlib.blake2b(body.encode("utf-8"), digest_size=16).digest()
+            if previous and previous["digest"] == digest:
+                return previous, False # Server without validators, same body
+            fetch_stats = self._fetcher.stats.get(url, {})
+            content, stat_key = body, None
+            validators = {"etag": fetch_stats.get("etag"), "last_modified": fetch_stats.get("last_modified")}
+
+        return {
+            "content": content,
+            "digest": digest,
+            "stat": stat_key,
+            "validators": validators,
+            "includes": extract_include_targets(url, content) if self.resolve_includes else [],
+            "expires_seconds": parse_expires_seconds(content),
+        }, True
+
+    async def _refresh_group(self, group: SourceGroupState) -> tuple[bool, bool]:
+        """Re-checks a source and its include targets, level by level. Returns (changed, failed)."""
+        documents: dict[str, dict] = {}
+        changed = failed = False
+        seen = {group.url}
+        level = [(group.url, group.source.get("mirrors", []))]
+        depth = 0
+        while level:
+            results = await asyncio.gather(*(self._refresh_document(url, mirrors, group.documents.get(url)) for url, mirrors in level))
+            next_level = []
+            for (url, _), (document, document_changed) in zip(level, results):
+                if document_changed is None:
+                    failed = True
+                elif document_changed:
+                    changed = True
+                if document is None:
+                    continue
+                documents[url] = document
+                if depth >= self.max_include_depth:
+                    continue
+                for target in document["includes"]:
+                    if target in seen:
+                        continue
+                    seen.add(target)
+                    if target.startswith("http://") or target.startswith("https://") or is_local_source(target):
+                        next_level.append((target, []))
+            level = next_level
+            depth += 1
+        if documents.keys() != group.documents.keys():
+            changed = True
+        group.documents = documents
+        top_document = documents.get(group.url)
+        group.expires_seconds = top_document["expires_seconds"] if top_document else None
+        return changed, failed
+
+    def _next_poll_interval(self, group: SourceGroupState, changed: bool, failed: bool, now: float) -> float:
+        if failed and not changed:
+            interval = min(group.poll_interval, self.failure_retry)
+        elif changed and group.change_interval_ewma is not None:
+            interval = group.change_interval_ewma * self.poll_fraction
+        elif changed:
+            interval = group.poll_interval
+        else:
+            interval = group.poll_interval * self.unchanged_backoff
+            # Do not drift past the next expected change while the estimate is fresh
+            if group.change_interval_ewma and now - group.last_changed_monotonic < 2 * group.change_interval_ewma:
+                interval = min(interval, group.change_interval_ewma)
+        if group.expires_seconds:
+            interval = min(interval, group.expires_seconds)
+        interval = max(self.min_poll, min(self.max_poll, interval))
+        return interval * random.uniform(0.9, 1.1)
+
+    async def poll_and_rebuild(self, groups: list[SourceGroupState]):
+        results = await asyncio.gather(*(self._refresh_group(group) for group in groups))
+        now = time.monotonic()
+        changed_groups = []
+        for group, (changed, failed) in zip(groups, results):
+            group.polls += 1
+            group.last_checked = time.time()
+            if failed:
+                group.failures += 1
+            if changed:
+                changed_groups.append(group)
+                group.changes += 1
+                if group.last_changed_monotonic is not None:
+                    observed = now - group.last_changed_monotonic
+                    group.change_interval_ewma = observed if group.change_interval_ewma is None else (
+                        self.ewma_alpha * observed + (1 - self.ewma_alpha) * group.change_interval_ewma)
+                group.last_changed_monotonic = now
+                group.last_changed = group.last_checked
+            group.poll_interval = self._next_poll_interval(group, changed, failed, now)
+            group.next_poll = now + group.poll_interval
+            logger.info(f"Serve: {group.url} {'changed' if changed else 'unchanged'}{' (fetch failed)' if failed else ''}; "
+                        f"next poll in {group.poll_interval:.0f}s.")
+        if changed_groups:
+            async with self._rebuild_lock:
+                await asyncio.to_thread(self.rebuild, changed_groups)
+
+    # --- Rebuilding ---------------------------------------------------------
+
+    def rebuild(self, changed_groups: list[SourceGroupState]):
+        """
+        Re-parses and rephrases only the lines that changed in the changed
+        sources, patches their contributions into the unified rule set and
+        re-renders every variant.
+        """
+        started = time.perf_counter()
+        for group in changed_groups:
+            previous_urls = {rule_obj["source_url"] for rule_obj in group.rephrased_rules}
+            if not group.documents:
+                group.rephrased_rules = []
+            else:
+                group.rephrased_rules = self.rule_cache.parse_and_rephrase(
+                    {url: document["content"] for url, document in group.documents.items()},
+                    self.config.get("parser_validator_options", {}),
+                    self.brave_scriptlets_data,
+                    self.config.get("rephraser_options", {}),
+                    top_level_sources=[group.url]
+                )
+            self.rule_cache.forget(previous_urls - group.documents.keys()) # Dropped include targets
+            self.unified_set.replace_group(group.url, group.rephrased_rules)
+        parsed_at = time.perf_counter()
+
+        unified_rules = self.unified_set.result()
+        rule_cost_config = self.config.get("rule_cost_options", {})
+        if rule_cost_config.get("enabled", True):
+            self.cost_report = score_unified_rules(unified_rules, rule_cost_config)
+        budget_config = self.config.get("rule_budget_options", {})
+        if budget_config.get("enabled", False):
+            self.budget_report = apply_rule_budget(unified_rules, self.config.get("filter_list_urls", []), budget_config)
+        unified_at = time.perf_counter()
+
+        published = dict(self.published)
+        changed_variants = []
+        for variant in self.variants:
+            if self._render_variant(variant, unified_rules, published):
+                changed_variants.append(variant["name"])
+        self.published = published # Swapped in one assignment; request handlers never see a partial rebuild
+        finished = time.perf_counter()
+
+        record = {
+            "finished": time.time(),
+            "reparsed_sources": [group.url for group in changed_groups],
+            "unique_rules": len(unified_rules["rules"]),
+            "changed_variants": changed_variants,
+            "parse_rephrase_seconds": round(parsed_at - started, 3),
+            "unify_seconds": round(unified_at - parsed_at, 3),
+            "render_seconds": round(finished - unified_at, 3),
+            "total_seconds": round(finished - started, 3),
+        }
+        self.rebuild_history.append(record)
+        logger.info(f"Serve: Rebuilt in {record['total_seconds']}s ({len(changed_groups)} source(s) re-parsed, "
+                    f"variants changed: {', '.join(changed_variants) or 'none'}).")
+
+    def _render_variant(self, variant: dict, unified_rules: dict, published: dict) -> bool:
+        rule_strings = select_rules(unified_rules, variant)
+        rules_digest = hashlib.blake2b("\n".join(rule_strings).encode("utf-8"), digest_size=16).digest()
+        previous = published.get(variant["name"])
+        if previous and previous["rules_digest"] == rules_digest:
+            return False
+
+        version_timestamp = time.strftime("%Y%m%d.%H%M%S")
+        header_lines = build_header_lines(variant["generator_header"], version_timestamp)
+        full_document = _make_document("\n".join(header_lines + rule_strings) + "\n", len(rule_strings))
+
+        shard_rules: list[list[str]] = [[] for _ in range(self.shard_count)]
+        for rule_string in rule_strings:
+            if not rule_string.startswith("!"):
+                shard_rules[_shard_index(rule_string, self.shard_count)].append(rule_string)
+        shards = []
+        for index, rules in enumerate(shard_rules):
+            shard_digest = hashlib.blake2b("\n".join(rules).encode("utf-8"), digest_size=16).digest()
+            if previous and previous["shards"][index]["rules_digest"] == shard_digest:
+                shards.append(previous["shards"][index]) # Unchanged shard keeps its ETag
+                continue
+            shard_header = dict(variant["generator_header"])
+            shard_header["title"] = f"{shard_header.get('title', 'Brave Power List')} (shard {index + 1}/{self.shard_count})"
+            document = _make_document("\n".join(build_header_lines(shard_header, version_timestamp) + rules) + "\n", len(rules))
+            document["rules_digest"] = shard_digest
+            shards.append(document)
+
+        published[variant["name"]] = {"rules_digest": rules_digest, "full": full_document, "shards": shards,
+                                      "version": version_timestamp}
+        if self.write_output_files:
+            output_path = pathlib.Path(variant["output_filename"])
+            try:
+                output_path.parent.mkdir(parents=True, exist_ok=True)
+                tmp_path = output_path.with_suffix(output_path.suffix + ".tmp")
+                tmp_path.write_bytes(full_document["body"])
+                os.replace(tmp_path, output_path)
+            except OSError as e:
+                logger.error(f"Serve: Failed to write {output_path}: {e}")
+        return True
+
+    # --- HTTP ---------------------------------------------------------------
+
+    def _document_response(self, request: web.Request, document: dict) -> web.Response:
+        use_gzip = _accepts_gzip(request.headers.get("Accept-Encoding", ""))
+        etag = document["gzip_etag"] if use_gzip else document["etag"]
+        headers = {
+            "ETag": etag,
+            "Last-Modified": document["last_modified"],
+            "Cache-Control": f"public, max-age={self.cache_max_age}",
+            "Vary": "Accept-Encoding",
+        }
+        if_none_match = request.headers.get("If-None-Match")
+        if if_none_match:
+            candidates = {tag.strip().removeprefix("W/") for tag in if_none_match.split(",")}
+            if "*" in candidates or etag in candidates:
+                return web.Response(status=304, headers=headers)
+        if use_gzip:
+            headers["Content-Encoding"] = "gzip"
+        return web.Response(body=document["gzip"] if use_gzip else document["body"], headers=headers,
+                            content_type="text/plain", charset="utf-8")
+
+    def _published_variant(self, request: web.Request) -> dict:
+        if not self.published:
+            raise web.HTTPServiceUnavailable(text="The first build has not finished yet.", headers={"Retry-After": "5"})
+        variant = self.published.get(request.match_info["variant"])
+        if variant is None:
+            raise web.HTTPNotFound(text=f"Unknown variant '{request.match_info['variant']}'.")
+        return variant
+
+    async def handle_list(self, request: web.Request) -> web.Response:
+        return self._document_response(request, self._published_variant(request)["full"])
+
+    async def handle_shard(self, request: web.Request) -> web.Response:
+        shards = self._published_variant(request)["shards"]
+        index = int(request.match_info["index"])
+        if not 0 <= index < len(shards):
+            raise web.HTTPNotFound(text=f"Shard {index} does not exist ({len(shards)} shards).")
+        return self._document_response(request, shards[index])
+
+    async def handle_shard_index(self, request: web.Request) -> web.Response:
+        name = request.match_info["variant"]
+        variant = self._published_variant(request)
+        return web.json_response({
+            "variant": name,
+            "version": variant["version"],
+            "shards": [{"index": index, "url": f"/lists/{name}/shards/{index}.txt", "etag": shard["etag"],
+                        "rules": shard["rule_count"]} for index, shard in enumerate(variant["shards"])],
+        })
+
+    async def handle_stats(self, request: web.Request) -> web.Response:
+        now = time.monotonic()
+        rebuild_seconds = [record["total_seconds"] for record in self.rebuild_history]
+        peak_rss = None
+        if resource is not None:
+            peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024 # KiB on Linux
+        return web.json_response({
+            "uptime_seconds": round(time.time() - self.started, 1),
+            "rebuilds": len(self.rebuild_history),
+            "last_rebuild": self.rebuild_history[-1] if self.rebuild_history else None,
+            "rebuild_seconds": {
+                "last": rebuild_seconds[-1] if rebuild_seconds else None,
+                "mean": round(sum(rebuild_seconds) / len(rebuild_seconds), 3) if rebuild_seconds else None,
+                "max": max(rebuild_seconds, default=None),
+            },
+            "memory": {"rss_bytes": _current_rss_bytes(), "peak_rss_bytes": peak_rss},
+            "sources": [group.to_stats(now) for group in self.groups],
+            "variants": [{"name": name, "version": variant["version"], "etag": variant["full"]["etag"],
+                          "rules": variant["full"]["rule_count"], "shards": len(variant["shards"])}
+                         for name, variant in self.published.items()],
+        }, dumps=lambda obj: json.dumps(obj, indent=2))
+
+    async def handle_cost_report(self, request: web.Request) -> web.Response:
+        if self.cost_report is None:
+            raise web.HTTPNotFound(text="No rule cost report yet (rule_cost_options.enabled may be false).")
+        return web.json_response(self.cost_report)
+
+    async def handle_budget_report(self, request: web.Request) -> web.Response:
+        if self.budget_report is None:
+            raise web.HTTPNotFound(text="No rule budget report yet (rule_budget_options.enabled may be false).")
+        return web.json_response(self.budget_report)
+
+    async def handle_refresh(self, request: web.Request) -> web.Response:
+        for group in self.groups:
+            group.next_poll = 0.0
+        self._wake.set()
+        return web.json_response({"scheduled": len(self.groups)}, status=202)
+
+    def build_app(self) -> web.Application:
+        app = web.Application()
+        app.router.add_get("/lists/{variant}.txt", self.handle_list)
+        app.router.add_get("/lists/{variant}/shards.json", self.handle_shard_index)
+        app.router.add_get(r"/lists/{variant}/shards/{index:\d+}.txt", self.handle_shard)
+        app.router.add_get("/stats", self.handle_stats)
+        app.router.add_get("/reports/rule-cost.json", self.handle_cost_report)
+        app.router.add_get("/reports/rule-budget.json", self.handle_budget_report)
+        app.router.add_post("/refresh", self.handle_refresh)
+        return app
+
+    # --- Main loop ----------------------------------------------------------
+
+    async def run(self, host: str | None = None, port: int | None = None):
+        host = host or self.serve_config.get("host", "127.0.0.1")
+        port = port or self.serve_config.get("port", 8080)
+        if not self.groups:
+            logger.error("Serve: No filter list sources configured.")
+            return
+        if not self.variants:
+            logger.error("Serve: No usable output variants configured.")
+            return
+        temp_download_path = pathlib.Path(self.downloader_config.get("temp_dir", "./temp_downloads/"))
+        temp_download_path.mkdir(parents=True, exist_ok=True)
+
+        async with create_session(self.downloader_config) as session:
+            self._fetcher = SourceFetcher(session, self.downloader_config, temp_download_path)
+            runner = web.AppRunner(self.build_app())
+            await runner.setup()
+            await web.TCPSite(runner, host, port).start()
+            logger.info(f"Serve: Listening on http://{host}:{port}/ ({len(self.groups)} source(s), "
+                        f"variants: {', '.join(variant['name'] for variant in self.variants)}).")
+            try:
+                while True:
+                    now = time.monotonic()
+                    due = [group for group in self.groups if group.next_poll <= now]
+                    if due:
+                        await self.poll_and_rebuild(due)
+                        continue
+                    self._wake.clear()
+                    sleep_for = min(group.next_poll for group in self.groups) - now
+                    try:
+                        await asyncio.wait_for(self._wake.wait(), timeout=sleep_for)
+                    except asyncio.TimeoutError:
+                        pass
+            finally:
+                await runner.cleanup()
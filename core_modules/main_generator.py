@@ -1,23 +1,38 @@
 # core_modules/main_generator.py
 
 import argparse
+import contextlib
 import json
 import logging
 import pathlib
 import sys
-import asyncio
-
-# Relative imports for modules within the same package (core_modules)
-from downloader import download_filter_lists
-from parser_validator import parse_and_validate_rules
-from rephraser import rephrase_rules
-from unifier_optimizer import unify_and_optimize_rules
-from generator import generate_brave_power_list
 
 # --- Global Project Root Path ---
 # Assumes main_generator.py is in core_modules, so project_root is its parent.
 PROJECT_ROOT = pathlib.Path(__file__).resolve().parent.parent
 
+# The stage modules use package-relative imports, so make 'core_modules' importable
+# when this file is run as a script (python core_modules/main_generator.py).
+if str(PROJECT_ROOT) not in sys.path:
+    sys.path.insert(0, str(PROJECT_ROOT))
+
+# Stage modules are imported inside the stage functions below, so that e.g. a
+# `generate`-only run never pays for aiohttp or the parser/rephraser imports.
+from core_modules.checkpoints import (
+    CheckpointError, checkpoint_path, digest_of, read_checkpoint, read_checkpoint_header, write_checkpoint,
+)
+from core_modules.config_loader import load_brave_scriptlet_metadata, load_configuration
+
+STAGES = ("download", "parse", "rephrase", "unify", "generate")
+STAGE_TITLES = {
+    "download": "1. Downloader Module",
+    "parse": "2. Parser & Validator Module",
+    "rephrase": "3. Rephraser Module",
+    "unify": "4. Unifier & Optimizer Module",
+    "generate": "5. Generator Module",
+}
+_NOT_LOADED = object()
+
 def setup_logging(log_level_str: str = "INFO", log_format_str: str = None):
     if not log_format_str:
         log_format_str = "%(asctime)s - %(levelname)s - %(name)s - %(funcName)s - %(message)s"
@@ -28,137 +43,350 @@ def setup_logging(log_level_str: str = "INFO", log_format_str: str = None):
         logging.warning(f"Invalid log level '{log_level_str}'. Defaulting to INFO.")
     logging.basicConfig(
         level=log_level, format=log_format_str, datefmt='%Y-%m-%d %H:%M:%S',
-        handlers=[logging.StreamHandler(sys.stdout)]
+        handlers=[logging.StreamHandler(sys.stdout)], force=True # Allow re-init with config settings
     )
-    logging.getLogger('parfive').setLevel(logging.WARNING)
+    logging.getLogger('aiohttp').setLevel(logging.WARNING)
     logging.getLogger('asyncio').setLevel(logging.INFO)
 
-def load_configuration(config_path_str: str) -> dict | None:
-    logger_cfg = logging.getLogger(__name__)
-    # argparse provides path relative to CWD. If running from project root, this is fine.
-    config_path = pathlib.Path(config_path_str) 
-
-    if not config_path.is_file(): # Check path as given first
-        # If not found, try resolving relative to project root (in case CWD is different)
-        config_path_alt = PROJECT_ROOT / config_path_str
-        if config_path_alt.is_file():
-            config_path = config_path_alt
-        else:
-            logger_cfg.error(f"Configuration file not found at '{config_path_str}' (CWD) or '{config_path_alt}' (project root).")
-            return None
-
-    logger_cfg.info(f"Loading configuration from: {config_path.resolve()}")
-    try:
-        with open(config_path, 'r', encoding='utf-8') as f:
-            config = json.load(f)
-        logger_cfg.info("Configuration loaded successfully.")
-        return config
-    except json.JSONDecodeError as e:
-        logger_cfg.error(f"Error decoding JSON from config file {config_path.resolve()}: {e}")
-        raise
-    except Exception as e:
-        logger_cfg.error(f"Error loading config file {config_path.resolve()}: {e}")
-        raise
-
-
-def load_brave_scriptlet_metadata(config: dict) -> dict:
-    logger_meta = logging.getLogger(__name__)
-    metadata_filepath_str = config.get("brave_metadata_filepath")
-    if not metadata_filepath_str:
-        logger_meta.warning("Path to Brave scriptlet metadata ('brave_metadata_filepath') not in config. Scriptlet rephrasing may be limited.")
-        return {}
-
-    metadata_path = PROJECT_ROOT / metadata_filepath_str # Path relative to project root
-    if not metadata_path.is_file():
-        logger_meta.error(f"Brave scriptlet metadata file not found: {metadata_path.resolve()}")
-        return {}
-    
-    logger_meta.info(f"Loading Brave scriptlet metadata from: {metadata_path.resolve()}")
-    try:
-        with open(metadata_path, 'r', encoding='utf-8') as f:
-            metadata_content = json.load(f)
-        if "scriptlets" in metadata_content and isinstance(metadata_content["scriptlets"], list):
-            scriptlet_map = {}
-            for scriptlet_def in metadata_content["scriptlets"]:
-                if "name" in scriptlet_def:
-                    scriptlet_map[scriptlet_def["name"]] = scriptlet_def
-                    if "aliases" in scriptlet_def and isinstance(scriptlet_def["aliases"], list):
-                        for alias in scriptlet_def["aliases"]:
-                            scriptlet_map[alias] = scriptlet_def
-            logger_meta.info(f"Loaded and mapped {len(scriptlet_map)} scriptlets (including aliases).")
-            return scriptlet_map
-        else:
-            logger_meta.warning("Brave scriptlet metadata is not in expected format (missing 'scriptlets' list).")
-            return {}
-    except Exception as e:
-        logger_meta.error(f"Error loading/parsing Brave scriptlet metadata {metadata_path.resolve()}: {e}")
-        return {}
+async def run_download_stage(config: dict) -> dict:
+    from core_modules.downloader import download_filter_lists
+    raw_lists_data = await download_filter_lists(
+        config.get("filter_list_urls", []),
+        config.get("downloader_options", {})
+    )
+    if not raw_lists_data: logging.getLogger("MainWorkflow").warning("Downloader returned no data. Workflow might produce empty list.") # Allow continuing
+    return raw_lists_data
 
-async def main_workflow(config: dict):
-    main_logger = logging.getLogger("MainWorkflow")
-    main_logger.info("Starting Brave Power List Generation Workflow...")
+def run_parse_stage(config: dict, raw_lists_data: dict) -> list[dict]:
+    from core_modules.generator import variants_include_comments
+    from core_modules.parser_validator import parse_and_validate_rules
+    from core_modules.sources import source_urls
+    parsed_rules = parse_and_validate_rules(
+        raw_lists_data,
+        config.get("parser_validator_options", {}),
+        top_level_sources=source_urls(config.get("filter_list_urls", [])),
+        keep_comments=variants_include_comments(config)
+    )
+    if not parsed_rules: logging.getLogger("MainWorkflow").warning("Parser & Validator returned no rules.")
+    return parsed_rules
 
+def run_rephrase_stage(config: dict, parsed_rules: list[dict]) -> list[dict]:
+    from core_modules.rephraser import rephrase_rules
     brave_scriptlets_data = {}
     if config.get("rephraser_options", {}).get("load_brave_metadata", True):
         brave_scriptlets_data = load_brave_scriptlet_metadata(config)
+    return rephrase_rules(
+        parsed_rules,
+        brave_scriptlets_data,
+        config.get("rephraser_options", {})
+    )
 
-    try:
-        main_logger.info("--- 1. Downloader Module ---")
-        raw_lists_data = await download_filter_lists(
-            config.get("filter_list_urls", []),
-            config.get("downloader_options", {})
-        )
-        if not raw_lists_data: main_logger.warning("Downloader returned no data. Workflow might produce empty list."); # Allow continuing
+def run_unify_stage(config: dict, rephrased_rules: list[dict]) -> dict:
+    from core_modules.unifier_optimizer import collect_unified_rules
+    # Variant-independent: every output variant is selected from this one result
+    unified_rules = collect_unified_rules(
+        rephrased_rules,
+        config.get("unifier_optimizer_options", {})
+    )
+    return finish_unified_rules(config, unified_rules)
 
-        main_logger.info("--- 2. Parser & Validator Module ---")
-        parsed_rules = parse_and_validate_rules(
-            raw_lists_data,
-            config.get("parser_validator_options", {})
-        )
-        if not parsed_rules: main_logger.warning("Parser & Validator returned no rules.");
+def finish_unified_rules(config: dict, unified_rules: dict) -> dict:
+    """Cost-scores and budgets a unifier result, as configured."""
+    rule_cost_config = config.get("rule_cost_options", {})
+    if rule_cost_config.get("enabled", True):
+        from core_modules.rule_cost import score_unified_rules, write_cost_report
+        cost_report = score_unified_rules(unified_rules, rule_cost_config)
+        if rule_cost_config.get("report_path"):
+            write_cost_report(cost_report, rule_cost_config["report_path"])
+    budget_config = config.get("rule_budget_options", {})
+    if budget_config.get("enabled", False):
+        from core_modules.rule_budget import apply_rule_budget, write_budget_report
+        budget_report = apply_rule_budget(unified_rules, config.get("filter_list_urls", []), budget_config)
+        if budget_config.get("report_path"):
+            write_budget_report(budget_report, budget_config["report_path"])
+    if not unified_rules["rules"]:
+        logging.getLogger("MainWorkflow").warning("Unifier & Optimizer returned no rules for final list. Output will be minimal (header only).")
+    return unified_rules
 
-        main_logger.info("--- 3. Rephraser Module ---")
-        rephrased_rules = rephrase_rules(
-            parsed_rules,
-            brave_scriptlets_data,
-            config.get("rephraser_options", {})
-        )
+def use_source_scheduler(config: dict, stages: tuple[str, ...] = STAGES) -> bool:
+    """
+    Whether download..unify run fused through the bounded source scheduler
+    (see source_scheduler.py): enabled, at least `min_sources` sources, and
+    every one of those stages requested together.
+    """
+    scheduler_config = config.get("scheduler_options", {})
+    if not scheduler_config.get("enabled", False) or not all(stage in stages for stage in STAGES[:4]):
+        return False
+    from core_modules.sources import source_urls
+    return len(source_urls(config.get("filter_list_urls", []))) >= scheduler_config.get("min_sources", 0)
 
-        main_logger.info("--- 4. Unifier & Optimizer Module ---")
-        unified_optimized_rules = unify_and_optimize_rules(
-            rephrased_rules,
-            config.get("unifier_optimizer_options", {})
-        )
-        if not unified_optimized_rules: 
-            main_logger.warning("Unifier & Optimizer returned no rules for final list. Output will be minimal (header only).")
-            # unified_optimized_rules = [] # Ensure it's an empty list for the generator
-            
-        main_logger.info("--- 5. Generator Module ---")
-        generation_successful = generate_brave_power_list(
-            unified_optimized_rules,
-            config
-        )
+async def run_scheduled_unify_stage(config: dict) -> dict:
+    """Download, parse, rephrase and unify every source under the scheduler's memory budget."""
+    from core_modules.source_scheduler import SourceScheduler
+    brave_scriptlets_data = {}
+    if config.get("rephraser_options", {}).get("load_brave_metadata", True):
+        brave_scriptlets_data = load_brave_scriptlet_metadata(config)
+    unified_rules = await SourceScheduler(config, brave_scriptlets_data).run()
+    return finish_unified_rules(config, unified_rules)
+
+def run_generate_stage(config: dict, unified_rules: dict) -> dict:
+    from core_modules.generator import generate_output_variants
+    result = generate_output_variants(unified_rules, config)
+    if config.get("dns_export_options", {}).get("enabled", False):
+        from core_modules.dns_exporter import export_dns_lists
+        dns_result = export_dns_lists(unified_rules, config)
+        result["dns_outputs"] = dns_result["outputs"]
+        result["success"] = result["success"] and dns_result["success"]
+    if config.get("webkit_export_options", {}).get("enabled", False):
+        from core_modules.webkit_exporter import export_webkit_lists
+        webkit_result = export_webkit_lists(unified_rules, config)
+        result["webkit_manifest"] = webkit_result["manifest"]
+        result["success"] = result["success"] and webkit_result["success"]
+    return result
+
+def _stage_inputs(stage: str, config: dict):
+    """The configuration that influences a stage; part of its checkpoint input digest."""
+    if stage == "download":
+        return [config.get("filter_list_urls", []), config.get("downloader_options", {})]
+    if stage == "parse":
+        from core_modules.generator import variants_include_comments
+        return [config.get("filter_list_urls", []), config.get("parser_validator_options", {}), variants_include_comments(config)]
+    if stage == "rephrase":
+        metadata_path = PROJECT_ROOT / config.get("brave_metadata_filepath", "")
+        metadata_stat = metadata_path.stat() if metadata_path.is_file() else None
+        return [config.get("rephraser_options", {}), config.get("brave_metadata_filepath"),
+                [metadata_stat.st_size, metadata_stat.st_mtime_ns] if metadata_stat else None]
+    if stage == "unify":
+        return [config.get("unifier_optimizer_options", {}), config.get("rule_cost_options", {}),
+                config.get("rule_budget_options", {}), config.get("filter_list_urls", [])] # Source priorities and caps
+    return [config.get("output_filename"), config.get("generator_header", {}), config.get("output_variants"),
+            config.get("dns_export_options", {}), config.get("provenance_index_options", {}),
+            config.get("webkit_export_options", {})]
+
+def _stage_output_present(stage: str, config: dict) -> bool:
+    if stage == "generate":
+        from core_modules.generator import resolve_output_variants
+        variants = resolve_output_variants(config)
+        output_filenames = [variant.get("output_filename") for variant in variants]
+        index_config = config.get("provenance_index_options", {})
+        if index_config.get("enabled", False):
+            from core_modules.generator import provenance_index_path
+            output_filenames += [str(provenance_index_path(filename, index_config)) for filename in output_filenames if filename]
+        dns_config = config.get("dns_export_options", {})
+        if dns_config.get("enabled", False):
+            from core_modules.dns_exporter import resolve_dns_outputs
+            output_filenames += [output["output_filename"] for output in resolve_dns_outputs(dns_config)]
+        webkit_config = config.get("webkit_export_options", {})
+        if webkit_config.get("enabled", False):
+            from core_modules.webkit_exporter import resolve_webkit_manifest
+            output_filenames.append(str(resolve_webkit_manifest(webkit_config))) # The chunks are written before it
+        return bool(variants) and all(filename and pathlib.Path(filename).is_file() for filename in output_filenames)
+    return True
+
+def resolve_checkpoint_dir(config: dict, override: str | None = None) -> pathlib.Path:
+    return pathlib.Path(override or config.get("checkpoint_options", {}).get("checkpoint_dir", "./checkpoints/"))
+
+def run_pipeline(
+    config: dict,
+    stages: tuple[str, ...] = STAGES,
+    checkpoint_dir: str | pathlib.Path | None = None,
+    skip_unchanged: bool = False,
+    profiler=None
+) -> bool:
+    """
+    Runs a contiguous range of stages, reading the checkpoint of the stage
+    before the first one and writing a checkpoint after every stage.
 
-        if generation_successful:
-            main_logger.info("Brave Power List Generation Workflow COMPLETED successfully.")
-        else:
+    With skip_unchanged, a stage whose input digest (upstream checkpoint
+    digest + the configuration it depends on) matches its existing
+    checkpoint is skipped without loading anything; upstream payloads are
+    only unpickled when a later stage actually has to run. The download
+    stage always runs, since its input is the remote lists themselves.
+
+    With a profiling.PipelineProfiler, every stage that runs is profiled.
+
+    When use_source_scheduler() applies, download..unify run as one
+    bounded pass (run_scheduled_unify_stage) and only the unify checkpoint
+    is written; its input digest covers the configuration of all four
+    stages, and it is never skipped, since its input is the remote lists.
+    The download, parse and rephrase checkpoints of an earlier run are
+    deleted, so no stage can resume from data older than that checkpoint.
+    """
+    main_logger = logging.getLogger("MainWorkflow")
+    checkpoint_dir = resolve_checkpoint_dir(config, checkpoint_dir)
+    first_index = STAGES.index(stages[0])
+
+    upstream_digest = None
+    upstream_payload = _NOT_LOADED
+    if first_index > 0:
+        upstream_header = read_checkpoint_header(checkpoint_path(checkpoint_dir, STAGES[first_index - 1]))
+        if upstream_header is None:
+            main_logger.error(f"No '{STAGES[first_index - 1]}' checkpoint in {checkpoint_dir}; run that stage first.")
+            return False
+        upstream_digest = upstream_header["content_digest"]
+
+    scheduled = use_source_scheduler(config, stages)
+    for stage in stages:
+        if scheduled and stage in STAGES[:3]:
+            continue
+        stage_index = STAGES.index(stage)
+        stage_inputs = _stage_inputs(stage, config)
+        if scheduled and stage == "unify":
+            stage_inputs = [_stage_inputs(prior, config) for prior in STAGES[:3]] + stage_inputs + [config.get("scheduler_options", {})]
+        input_digest = digest_of(stage, upstream_digest, stage_inputs)
+        stage_checkpoint = checkpoint_path(checkpoint_dir, stage)
+
+        if skip_unchanged and stage != "download" and not (scheduled and stage == "unify"):
+            existing = read_checkpoint_header(stage_checkpoint)
+            if existing and existing["input_digest"] == input_digest and _stage_output_present(stage, config):
+                main_logger.info(f"--- {STAGE_TITLES[stage]} --- skipped (inputs unchanged)")
+                upstream_digest = existing["content_digest"]
+                upstream_payload = _NOT_LOADED
+                continue
+
+        if stage_index > 0 and upstream_payload is _NOT_LOADED and not (scheduled and stage == "unify"):
+            _, upstream_payload = read_checkpoint(checkpoint_path(checkpoint_dir, STAGES[stage_index - 1]))
+
+        main_logger.info(f"--- {STAGE_TITLES[stage]} ---")
+        with profiler.stage(stage) if profiler else contextlib.nullcontext():
+            if stage == "download":
+                import asyncio
+                result = asyncio.run(run_download_stage(config))
+            elif stage == "parse":
+                result = run_parse_stage(config, upstream_payload)
+            elif stage == "rephrase":
+                result = run_rephrase_stage(config, upstream_payload)
+            elif stage == "unify" and scheduled:
+                import asyncio
+                result = asyncio.run(run_scheduled_unify_stage(config))
+            elif stage == "unify":
+                result = run_unify_stage(config, upstream_payload)
+            else:
+                result = run_generate_stage(config, upstream_payload)
+        if stage == "generate" and not result["success"]:
             main_logger.error("Generator Module FAILED. Final list may not have been created or is incomplete.")
-            main_logger.info("Brave Power List Generation Workflow FAILED.")
-    except Exception as e:
-        main_logger.critical(f"Critical error during generation workflow: {e}", exc_info=True)
-        main_logger.info("Brave Power List Generation Workflow FAILED due to an unhandled exception.")
+            return False
+
+        upstream_digest = write_checkpoint(stage_checkpoint, stage, result, input_digest)
+        upstream_payload = result
+        if scheduled and stage == "unify":
+            # The fused pass replaces these stages; a later `rephrase` or `unify` must not resume from older data
+            for prior in STAGES[:3]:
+                stale_checkpoint = checkpoint_path(checkpoint_dir, prior)
+                if stale_checkpoint.exists():
+                    stale_checkpoint.unlink()
+                    main_logger.info(f"Removed the '{prior}' checkpoint, which predates this scheduled run.")
+    return True
+
+def run_verify(config: dict, checkpoint_dir: str | None = None, corpus_path: str | None = None) -> bool:
+    """
+    Replays a request corpus against the network rules in the unify
+    checkpoint: writes the dead-rule and optimiser-equivalence report and
+    returns False if the optimised rules change any verdict. The reference
+    is the rephrase checkpoint the unify checkpoint was built from, so
+    canonical deduplication, coverage, cost filtering and budget trimming
+    are all checked.
+    """
+    main_logger = logging.getLogger("MainWorkflow")
+    matcher_config = config.get("matcher_options", {})
+    corpus_path = corpus_path or matcher_config.get("corpus_path")
+    if not corpus_path:
+        main_logger.error("No request corpus given (--corpus or matcher_options.corpus_path).")
+        return False
+    if not pathlib.Path(corpus_path).is_file():
+        main_logger.error(f"Request corpus not found: {corpus_path}")
+        return False
+    from core_modules.network_matcher import reference_network_rules, verify_unified_rules
+    checkpoint_dir = resolve_checkpoint_dir(config, checkpoint_dir)
+    unify_header, unified_rules = read_checkpoint(checkpoint_path(checkpoint_dir, "unify"))
+    # The rephrase checkpoint is the reference only if this unify checkpoint was built from it
+    reference_rules = None
+    rephrase_header = read_checkpoint_header(checkpoint_path(checkpoint_dir, "rephrase"))
+    if rephrase_header and unify_header["input_digest"] == digest_of("unify", rephrase_header["content_digest"], _stage_inputs("unify", config)):
+        _, rephrased_rules = read_checkpoint(checkpoint_path(checkpoint_dir, "rephrase"))
+        reference_rules = reference_network_rules(rephrased_rules)
+        del rephrased_rules
+    else:
+        main_logger.warning("No rephrase checkpoint matches the unify checkpoint; checking the output against the unified "
+                            "rules before coverage, cost and budget removal (canonical deduplication is not checked).")
+    report = verify_unified_rules(unified_rules, corpus_path, matcher_config, reference_rules)
+    report_path = pathlib.Path(matcher_config.get("report_path", "reports/matcher_report.json"))
+    report_path.parent.mkdir(parents=True, exist_ok=True)
+    with open(report_path, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2)
+    main_logger.info(f"Matcher report written to {report_path.resolve()}.")
+    if not report["equivalence"]["equivalent"]:
+        main_logger.error(f"Optimised rules change {report['equivalence']['mismatches']} verdict(s); see {report_path}.")
+        return False
+    return True
+
+def run_server(config: dict, host: str | None = None, port: int | None = None):
+    """Runs the long-lived `serve` mode until interrupted."""
+    import asyncio
+    from core_modules.list_server import ListServer
+    brave_scriptlets_data = {}
+    if config.get("rephraser_options", {}).get("load_brave_metadata", True):
+        brave_scriptlets_data = load_brave_scriptlet_metadata(config)
+    try:
+        asyncio.run(ListServer(config, brave_scriptlets_data).run(host, port))
+    except KeyboardInterrupt:
+        logging.getLogger("MainWorkflow").info("Serve: Stopped.")
+
+def build_argument_parser() -> argparse.ArgumentParser:
+    # Options are accepted before or after the subcommand; the subcommand copies
+    # use SUPPRESS so they do not overwrite values given before it.
+    def add_common_options(target: argparse.ArgumentParser, suppress: bool):
+        target.add_argument(
+            "--config",
+            type=str,
+            default=argparse.SUPPRESS if suppress else "config.json",
+            help="Path to the JSON configuration file (default: config.json in CWD, assumed project root)"
+        )
+        target.add_argument(
+            "--checkpoint-dir",
+            type=str,
+            default=argparse.SUPPRESS if suppress else None,
+            help="Directory for stage checkpoints (default: checkpoint_options.checkpoint_dir or ./checkpoints/)"
+        )
+        target.add_argument(
+            "--profile",
+            nargs="?",
+            const="",
+            metavar="DIR",
+            default=argparse.SUPPRESS if suppress else None,
+            help="Profile every stage that runs (cProfile, collapsed stacks, tracemalloc, regex counters) "
+                 "into DIR (default: profile_options.output_dir or ./profiles/)"
+        )
 
-if __name__ == "__main__":
     parser = argparse.ArgumentParser(
         description="Brave Power List Generator Orchestrator. Run from the project root directory."
     )
-    parser.add_argument(
-        "--config",
-        type=str,
-        default="config.json",
-        help="Path to the JSON configuration file (default: config.json in CWD, assumed project root)"
-    )
-    args = parser.parse_args()
+    add_common_options(parser, suppress=False)
+    subparsers = parser.add_subparsers(dest="command", metavar="{" + ",".join(STAGES) + ",all,verify,serve}")
+    stage_help = {
+        "download": "Download the filter lists and write the download checkpoint.",
+        "parse": "Parse and validate the downloaded lists (reads the download checkpoint).",
+        "rephrase": "Rephrase rules for Brave (reads the parse checkpoint).",
+        "unify": "Deduplicate, optimise and cost-score rules (reads the rephrase checkpoint).",
+        "generate": "Write the final list, every output variant and the DNS exports (reads the unify checkpoint).",
+    }
+    for stage in STAGES:
+        add_common_options(subparsers.add_parser(stage, help=stage_help[stage]), suppress=True)
+    all_parser = subparsers.add_parser("all", help="Run every stage, skipping stages whose inputs are unchanged (default).")
+    add_common_options(all_parser, suppress=True)
+    all_parser.add_argument("--force", action="store_true", help="Re-run every stage even if its inputs are unchanged.")
+    verify_parser = subparsers.add_parser("verify", help="Replay a request corpus against the unify checkpoint: dead rules and optimiser equivalence.")
+    add_common_options(verify_parser, suppress=True)
+    verify_parser.add_argument("--corpus", type=str, default=None, help="Request corpus (default: matcher_options.corpus_path).")
+    serve_parser = subparsers.add_parser("serve", help="Keep state in memory, refresh sources adaptively and serve the lists over HTTP.")
+    add_common_options(serve_parser, suppress=True)
+    serve_parser.add_argument("--host", type=str, default=None, help="Address to listen on (default: serve_options.host or 127.0.0.1).")
+    serve_parser.add_argument("--port", type=int, default=None, help="Port to listen on (default: serve_options.port or 8080).")
+    return parser
+
+if __name__ == "__main__":
+    args = build_argument_parser().parse_args()
+    command = args.command or "all"
 
     script_logger = logging.getLogger("core_modules.main_generator") # Explicit name
     setup_logging() 
@@ -176,11 +404,39 @@ if __name__ == "__main__":
         script_logger.info(f"Using configuration file: {pathlib.Path(args.config).resolve()}")
         script_logger.debug(f"Loaded configuration: {json.dumps(configuration, indent=2)}")
 
-        asyncio.run(main_workflow(configuration))
+        profiler = None
+        if args.profile is not None:
+            if command in ("verify", "serve"):
+                script_logger.warning(f"--profile only applies to pipeline stages; ignored for '{command}'.")
+            else:
+                from core_modules.profiling import PipelineProfiler
+                profile_config = configuration.get("profile_options", {})
+                profiler = PipelineProfiler(args.profile or profile_config.get("output_dir", "./profiles/"), profile_config)
+
+        with contextlib.ExitStack() as profiling_scope:
+            if profiler:
+                from core_modules.profiling import instrument_patterns
+                profiling_scope.enter_context(instrument_patterns(profiler.counters))
+                profiling_scope.callback(profiler.write_summary)
+            if command == "verify":
+                succeeded = run_verify(configuration, args.checkpoint_dir, args.corpus)
+            elif command == "serve":
+                run_server(configuration, args.host, args.port)
+                succeeded = True
+            elif command == "all":
+                succeeded = run_pipeline(configuration, STAGES, args.checkpoint_dir,
+                                         skip_unchanged=not getattr(args, "force", False), profiler=profiler)
+            else:
+                succeeded = run_pipeline(configuration, (command,), args.checkpoint_dir, profiler=profiler)
+        if not succeeded:
+            sys.exit(1)
 
     except json.JSONDecodeError: # Already handled in load_configuration if it raises
         script_logger.error(f"Exiting: Could not decode JSON from '{args.config}'. Ensure it's valid JSON.")
         sys.exit(1)
+    except CheckpointError as e:
+        script_logger.error(f"Exiting: {e}")
+        sys.exit(1)
     except Exception as e:
         script_logger.critical(f"An unexpected error occurred at the top level: {e}", exc_info=True)
         sys.exit(1)
@@ -0,0 +1,510 @@
+# core_modules/network_matcher.py
+
+import json
+import logging
+import re
+import time
+from collections import Counter
+from functools import lru_cache
+
+from .parser_validator import RuleType, split_network_options
+from .unifier_optimizer import ACTIVE_STATUSES, select_rules
+
+logger = logging.getLogger(__name__)
+
+HOSTS_LINE_RE = re.compile(r"^\d{1,3}\.\d{1,3}\.\d{1,3}\.\d{1,3}\s+([\w.-]+)")
+HOST_ONLY_PATTERN_RE = re.compile(r"^\|\|([a-z0-9.-]+)\^$")
+REGEX_PATTERN_RE = re.compile(r"^/(.+)/$")
+TOKEN_RE = re.compile(r"[a-z0-9%]+")
+MIN_TOKEN_LENGTH = 2
+SEPARATOR_REGEX = r"(?:[^\w.%-]|$)" # ABP '^': anything but a letter, digit, _ - . % (or the end)
+HOST_ANCHOR_REGEX = r"^[a-z][a-z0-9+.-]*:(?://)?(?:[^/?#]*\.)?"
+# Host of a lowercased URL; several times faster than urllib's urlsplit on the replay hot path
+URL_HOST_RE = re.compile(r"^[a-z][a-z0-9+.-]*://(?:[^@/?#]*@)?(\[[^\]]*\]|[^:/?#]*)")
+
+# Filter options that select request types, and request type names used by
+# corpora (Chromium/WebExtension names) mapped onto them.
+TYPE_OPTIONS = {
+    "script": "script", "image": "image", "stylesheet": "stylesheet", "css": "stylesheet",
+    "xmlhttprequest": "xmlhttprequest", "xhr": "xmlhttprequest", "subdocument": "subdocument", "frame": "subdocument",
+    "document": "document", "doc": "document", "font": "font", "media": "media", "object": "object",
+    "ping": "ping", "websocket": "websocket", "other": "other", "popup": "popup",
+}
+REQUEST_TYPE_ALIASES = {
+    "main_frame": "document", "sub_frame": "subdocument", "fetch": "xmlhttprequest", "beacon": "ping",
+    "imageset": "image", "csp_report": "other", "object_subrequest": "object", **TYPE_OPTIONS,
+}
+# Options whose rules modify a request instead of blocking it; they never produce a block verdict.
+NON_BLOCKING_OPTIONS = {"csp", "removeparam", "header", "replace", "permissions", "redirect-rule", "urltransform",
+                        "generichide", "elemhide", "specifichide", "ghide", "ehide", "shide", "empty", "mp4"}
+DEFAULT_EXCLUDED_TYPES = frozenset({"popup"})
+SECOND_LEVEL_LABELS = {"co", "com", "org", "net", "gov", "ac", "edu", "ne", "or", "go"}
+
+
+def base_domain(hostname: str) -> str:
+    """Approximate registrable domain (no public suffix list): last two labels, three for ccSLDs like co.uk."""
+    labels = hostname.split(".")
+    if len(labels) >= 3 and len(labels[-1]) == 2 and labels[-2] in SECOND_LEVEL_LABELS:
+        return ".".join(labels[-3:])
+    return ".".join(labels[-2:])
+
+
+def url_hostname(url_lower: str) -> str:
+    match = URL_HOST_RE.match(url_lower)
+    return match.group(1) if match else ""
+
+
+@lru_cache(maxsize=4096)
+def _source_context(source_url: str) -> tuple[str, str]:
+    """(hostname, base domain) of a page URL; pages repeat across a corpus, so this is cached."""
+    hostname = url_hostname(source_url.lower())
+    return hostname, base_domain(hostname) if hostname else ""
+
+
+def _host_matches(hostname: str, domain: str) -> bool:
+    return hostname == domain or hostname.endswith("." + domain)
+
+
+class NetworkFilter:
+    """One parsed network rule. The pattern regex is compiled on first use."""
+
+    __slots__ = ("index", "text", "is_exception", "important", "match_case", "pattern", "host", "is_regex",
+                 "include_types", "exclude_types", "third_party", "include_domains", "exclude_domains",
+                 "badfilter", "_regex")
+
+    def __init__(self, index: int, text: str):
+        self.index = index
+        self.text = text
+        self.is_exception = False
+        self.important = False
+        self.match_case = False
+        self.pattern = ""
+        self.host = None # Set for pure hostname rules (||host^), matched by suffix lookup
+        self.is_regex = False
+        self.include_types = None
+        self.exclude_types = frozenset()
+        self.third_party = None # True: third-party only, False: first-party only
+        self.include_domains = ()
+        self.exclude_domains = ()
+        self.badfilter = False
+        self._regex = None
+
+    @property
+    def regex(self) -> re.Pattern:
+        if self._regex is None:
+            flags = 0 if self.match_case else re.IGNORECASE
+            if self.is_regex:
+                self._regex = re.compile(self.pattern, flags)
+            else:
+                self._regex = re.compile(pattern_to_regex(self.pattern), flags)
+        return self._regex
+
+    def options_match(self, request_type: str, third_party: bool, source_host: str) -> bool:
+        if self.include_types is not None:
+            if request_type not in self.include_types:
+                return False
+        elif request_type in self.exclude_types:
+            return False
+        if self.third_party is not None and self.third_party != third_party:
+            return False
+        if self.include_domains and not any(_host_matches(source_host, d) for d in self.include_domains):
+            return False
+        if self.exclude_domains and any(_host_matches(source_host, d) for d in self.exclude_domains):
+            return False
+        return True
+
+    def pattern_matches(self, url: str, url_lower: str, hostname: str) -> bool:
+        if self.host is not None:
+            return _host_matches(hostname, self.host)
+        return self.regex.search(url if self.match_case else url_lower) is not None
+
+    def tokens(self) -> list[str]:
+        """Literal tokens that any matching URL must contain as a whole token (see TOKEN_RE)."""
+        if self.is_regex:
+            return []
+        pattern = self.pattern.lower()
+        left_anchored = pattern.startswith("|")
+        right_anchored = pattern.endswith("|")
+        body = pattern.lstrip("|").rstrip("|")
+        tokens = []
+        for match in TOKEN_RE.finditer(body):
+            start, end = match.span()
+            if end - start < MIN_TOKEN_LENGTH:
+                continue
+            before = body[start - 1] if start > 0 else None
+            after = body[end] if end < len(body) else None
+            # A token touching a wildcard, or the unanchored edge of the
+            # pattern, may only be part of a longer token in the URL.
+            if before == "*" or after == "*":
+                continue
+            if before is None and not left_anchored:
+                continue
+            if after is None and not right_anchored:
+                continue
+            tokens.append(match.group())
+        return tokens
+
+
+def pattern_to_regex(pattern: str) -> str:
+    """Translates an ABP network pattern (||, |, *, ^) into a Python regex."""
+    prefix, suffix = "", ""
+    if pattern.startswith("||"):
+        prefix, pattern = HOST_ANCHOR_REGEX, pattern[2:]
+    elif pattern.startswith("|"):
+        prefix, pattern = "^", pattern[1:]
+    if pattern.endswith("|"):
+        suffix, pattern = "$", pattern[:-1]
+    # Leading/trailing wildcards are no-ops for an unanchored search, but cost a full scan
+    if not prefix:
+        pattern = pattern.lstrip("*")
+    if not suffix:
+        pattern = pattern.rstrip("*")
+    parts = []
+    for char in pattern:
+        if char == "*":
+            parts.append(".*")
+        elif char == "^":
+            parts.append(SEPARATOR_REGEX)
+        else:
+            parts.append(re.escape(char))
+    return prefix + "".join(parts) + suffix
+
+
+def parse_network_filter(index: int, rule_string: str) -> NetworkFilter | None:
+    """Parses a network or hosts rule; returns None for rules that never block or cannot be matched."""
+    network_filter = NetworkFilter(index, rule_string)
+    hosts_match = HOSTS_LINE_RE.match(rule_string)
+    if hosts_match:
+        network_filter.pattern = f"||{hosts_match.group(1).lower()}^"
+        network_filter.host = hosts_match.group(1).lower()
+        return network_filter
+
+    rule = rule_string
+    if rule.startswith("@@"):
+        network_filter.is_exception = True
+        rule = rule[2:]
+    options = []
+    regex_match = REGEX_PATTERN_RE.match(rule)
+    if regex_match:
+        network_filter.is_regex = True
+        network_filter.pattern = regex_match.group(1)
+    else:
+        if "$" in rule:
+            dollar = rule.rfind("$")
+            rule, options = rule[:dollar], split_network_options(rule[dollar + 1:])
+        regex_match = REGEX_PATTERN_RE.match(rule)
+        if regex_match:
+            network_filter.is_regex = True
+            network_filter.pattern = regex_match.group(1)
+        else:
+            network_filter.pattern = rule or "*"
+
+    include_types, exclude_types = set(), set()
+    for option in options:
+        option = option.strip()
+        negated = option.startswith("~")
+        name, _, value = option.lstrip("~").partition("=")
+        name = name.lower()
+        if name in NON_BLOCKING_OPTIONS:
+            return None
+        if name in TYPE_OPTIONS:
+            (exclude_types if negated else include_types).add(TYPE_OPTIONS[name])
+        elif name in ("third-party", "3p"):
+            network_filter.third_party = not negated
+        elif name in ("first-party", "1p"):
+            network_filter.third_party = negated
+        elif name in ("domain", "from"):
+            domains = [d.strip().lower() for d in value.split("|") if d.strip()]
+            network_filter.include_domains = tuple(d for d in domains if not d.startswith("~"))
+            network_filter.exclude_domains = tuple(d[1:] for d in domains if d.startswith("~"))
+        elif name == "match-case":
+            network_filter.match_case = True
+        elif name == "important":
+            network_filter.important = True
+        elif name == "badfilter":
+            network_filter.badfilter = True
+        elif name == "all":
+            include_types.update(TYPE_OPTIONS.values())
+        # Other options (redirect=, rewrite=, ...) do not change whether the request is blocked
+    if include_types:
+        network_filter.include_types = frozenset(include_types)
+    network_filter.exclude_types = frozenset(exclude_types) if exclude_types else (
+        DEFAULT_EXCLUDED_TYPES if not include_types else frozenset())
+
+    if not network_filter.is_regex and not network_filter.match_case:
+        host_match = HOST_ONLY_PATTERN_RE.match(network_filter.pattern.lower())
+        if host_match:
+            network_filter.host = host_match.group(1)
+    if network_filter.is_regex or network_filter.host is None:
+        try:
+            network_filter.regex
+        except re.error as e:
+            logger.debug(f"Matcher: Skipping rule with an invalid pattern '{rule_string}': {e}")
+            return None
+    return network_filter
+
+
+class _FilterIndex:
+    """
+    Filters bucketed like adblock-rust's token index: pure hostname rules by
+    host (looked up by walking the request host's suffixes), every other
+    filter by the rarest of its literal tokens across the whole set, and
+    filters without a usable token in a fallback list checked for every
+    request.
+    """
+
+    def __init__(self, filters: list[NetworkFilter], token_counts: Counter):
+        self.by_host: dict[str, list[NetworkFilter]] = {}
+        self.by_token: dict[str, list[NetworkFilter]] = {}
+        self.fallback: list[NetworkFilter] = []
+        for network_filter in filters:
+            if network_filter.host is not None:
+                self.by_host.setdefault(network_filter.host, []).append(network_filter)
+                continue
+            tokens = network_filter.tokens()
+            if not tokens:
+                self.fallback.append(network_filter)
+                continue
+            rarest = min(tokens, key=lambda token: (token_counts[token], -len(token)))
+            self.by_token.setdefault(rarest, []).append(network_filter)
+
+    def candidates(self, hostname: str, url_tokens: set[str]):
+        labels = hostname.split(".")
+        for i in range(len(labels)):
+            bucket = self.by_host.get(".".join(labels[i:]))
+            if bucket:
+                yield from bucket
+        for token in url_tokens:
+            bucket = self.by_token.get(token)
+            if bucket:
+                yield from bucket
+        yield from self.fallback
+
+
+class NetworkMatcher:
+    """
+    In-process matcher for the network (and hosts) rules of an output list.
+
+        matcher = NetworkMatcher(rule_strings)
+        matcher.match("https://ads.example/x.js", "https://news.example/", "script")
+        # {"blocked": True, "filter": "||ads.example^", "exception": None}
+
+    Each request is checked only against the filters in the buckets of its
+    own host suffixes and tokens, plus the token-less fallback filters.
+    With `record_hits`, every matching filter (not only the first) is
+    counted in `hit_counts`, which is what dead-rule detection needs.
+    """
+
+    def __init__(self, rule_strings: list[str]):
+        self.filters: list[NetworkFilter] = []
+        self.skipped: list[str] = []
+        badfiltered = set()
+        parsed = []
+        for rule_string in rule_strings:
+            network_filter = parse_network_filter(len(parsed), rule_string)
+            if network_filter is None:
+                self.skipped.append(rule_string)
+                continue
+            if network_filter.badfilter:
+                badfiltered.add(re.sub(r"[$,]badfilter\b", "", rule_string))
+            parsed.append(network_filter)
+        for network_filter in parsed:
+            if network_filter.badfilter or network_filter.text in badfiltered:
+                self.skipped.append(network_filter.text)
+                continue
+            network_filter.index = len(self.filters)
+            self.filters.append(network_filter)
+
+        token_counts = Counter(token for f in self.filters if f.host is None for token in set(f.tokens()))
+        self.blocking = _FilterIndex([f for f in self.filters if not f.is_exception], token_counts)
+        self.exceptions = _FilterIndex([f for f in self.filters if f.is_exception], token_counts)
+        self.hit_counts = [0] * len(self.filters)
+        logger.info(f"Matcher: Indexed {len(self.filters)} filter(s) ({len(self.blocking.by_host) + len(self.exceptions.by_host)} host bucket(s), "
+                    f"{len(self.blocking.by_token) + len(self.exceptions.by_token)} token bucket(s), "
+                    f"{len(self.blocking.fallback) + len(self.exceptions.fallback)} fallback); {len(self.skipped)} rule(s) not matchable.")
+
+    def _first_match(self, index: _FilterIndex, url, url_lower, hostname, tokens, request_type, third_party, source_host,
+                     record_hits: bool, want_important: bool = False):
+        found = None
+        for network_filter in index.candidates(hostname, tokens):
+            if not network_filter.options_match(request_type, third_party, source_host):
+                continue
+            if not network_filter.pattern_matches(url, url_lower, hostname):
+                continue
+            if record_hits:
+                self.hit_counts[network_filter.index] += 1
+            if found is None or (want_important and network_filter.important and not found.important):
+                found = network_filter
+            if not record_hits and (not want_important or found.important):
+                break
+        return found
+
+    def match(self, url: str, source_url: str = "", request_type: str = "other", record_hits: bool = False) -> dict:
+        url_lower = url.lower()
+        hostname = url_hostname(url_lower)
+        source_host, source_base_domain = _source_context(source_url) if source_url else ("", "")
+        third_party = bool(source_host) and base_domain(hostname) != source_base_domain
+        request_type = REQUEST_TYPE_ALIASES.get(request_type.lower(), "other")
+        tokens = set(TOKEN_RE.findall(url_lower))
+
+        blocking = self._first_match(self.blocking, url, url_lower, hostname, tokens, request_type, third_party,
+                                     source_host, record_hits, want_important=True)
+        exception = None
+        if blocking is not None and (record_hits or not blocking.important):
+            exception = self._first_match(self.exceptions, url, url_lower, hostname, tokens, request_type,
+                                          third_party, source_host, record_hits)
+        elif record_hits:
+            self._first_match(self.exceptions, url, url_lower, hostname, tokens, request_type, third_party,
+                              source_host, record_hits)
+        blocked = blocking is not None and (blocking.important or exception is None)
+        return {
+            "blocked": blocked,
+            "filter": blocking.text if blocking is not None else None,
+            "exception": exception.text if exception is not None and not (blocking and blocking.important) else None,
+        }
+
+
+def iter_corpus(corpus_path: str):
+    """
+    Yields (url, source_url, request_type) from a request corpus. Lines are
+    either JSON objects ({"url", "sourceUrl" | "frameUrl" | "source",
+    "type" | "cpt"}, the format of Brave's requests benchmark) or
+    tab/whitespace separated "url source type". Blank lines and '#'
+    comments are skipped.
+    """
+    with open(corpus_path, "r", encoding="utf-8", errors="replace") as f:
+        for line in f:
+            line = line.strip()
+            if not line or line.startswith("#"):
+                continue
+            if line.startswith("{"):
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError:
+                    continue
+                yield (record.get("url", ""), record.get("sourceUrl") or record.get("frameUrl") or record.get("source") or "",
+                       record.get("type") or record.get("cpt") or "other")
+                continue
+            fields = line.split("\t") if "\t" in line else line.split()
+            if not fields:
+                continue
+            yield fields[0], fields[1] if len(fields) > 1 else "", fields[2] if len(fields) > 2 else "other"
+
+
+def replay_corpus(matcher: NetworkMatcher, corpus_path: str, record_hits: bool = False, verdicts: list | None = None) -> dict:
+    """Matches every request of the corpus; appends each blocked flag to `verdicts` if given."""
+    requests = blocked = 0
+    started = time.perf_counter()
+    for url, source_url, request_type in iter_corpus(corpus_path):
+        result = matcher.match(url, source_url, request_type, record_hits)
+        requests += 1
+        blocked += result["blocked"]
+        if verdicts is not None:
+            verdicts.append(result["blocked"])
+    elapsed = time.perf_counter() - started
+    return {
+        "requests": requests,
+        "blocked": blocked,
+        "seconds": round(elapsed, 3),
+        "requests_per_second": round(requests / elapsed) if elapsed > 0 else None,
+    }
+
+
+def reference_network_rules(rephrased_rules: list[dict]) -> list[str]:
+    """
+    The distinct active network and hosts rules of a rephrase stage result,
+    before the unifier touches them: no canonical deduplication, coverage,
+    cost filtering or budget trimming.
+    """
+    network_types = (RuleType.NETWORK.name, RuleType.HOSTS_RULE.name)
+    reference = {}
+    for rule_obj in rephrased_rules:
+        if rule_obj.get("rule_type") not in network_types or rule_obj.get("brave_validity_status") not in ACTIVE_STATUSES:
+            continue
+        rephrased_rule = rule_obj.get("rephrased_rule_string")
+        rule_str = (rephrased_rule if rephrased_rule is not None else rule_obj.get("original_rule_string", "")).strip()
+        if rule_str:
+            reference[rule_str] = None
+    return list(reference)
+
+
+def verify_unified_rules(
+    unified_rules: dict,
+    corpus_path: str,
+    matcher_config: dict | None = None,
+    reference_rules: list[str] | None = None
+) -> dict:
+    """
+    Replays a request corpus against the network rules of a
+    collect_unified_rules result and returns a report with:
+    - dead_rules: output rules that matched no request of the corpus
+    - equivalence: whether the output rules give the same block/allow
+      verdict as the unoptimised rules on every request, with examples of
+      any differences
+
+    The unoptimised rules are `reference_rules` (see
+    reference_network_rules) when given, which checks every unifier
+    optimisation. Otherwise they are rebuilt from the result itself: every
+    unified network rule, covered or not, plus the rules that cost
+    filtering and the rule budget removed ("removed_rules"); canonical
+    deduplication is then not checked.
+    """
+    if matcher_config is None: matcher_config = {}
+    max_listed = matcher_config.get("max_listed_rules", 500)
+    network_types = (RuleType.NETWORK, RuleType.HOSTS_RULE)
+    if reference_rules is not None:
+        pre_rules, reference = reference_rules, "rephrased rules"
+    else:
+        pre_rules = [r["string"] for r in (*unified_rules["rules"], *unified_rules.get("removed_rules", ())) if r["type"] in network_types]
+        reference = "unified rules before coverage, cost and budget removal"
+    post_rules = select_rules(unified_rules, {"include_rule_types": [t.name for t in network_types], "include_comments": False})
+    origins_by_rule = {r["string"]: r["origins"] for r in unified_rules["rules"]}
+
+    logger.info(f"Matcher: Replaying {corpus_path} against {len(post_rules)} optimised and {len(pre_rules)} unoptimised network rules "
+                f"({reference}).")
+    post_matcher = NetworkMatcher(post_rules)
+    post_verdicts: list[bool] = []
+    post_stats = replay_corpus(post_matcher, corpus_path, record_hits=True, verdicts=post_verdicts)
+
+    dead_rules = [f.text for f, hits in zip(post_matcher.filters, post_matcher.hit_counts) if hits == 0]
+    dead_by_source = Counter(source for rule in dead_rules for source in {o[0] for o in origins_by_rule.get(rule, ())})
+    top_rules = sorted(zip(post_matcher.hit_counts, (f.text for f in post_matcher.filters)), reverse=True)[:25]
+
+    pre_matcher = NetworkMatcher(pre_rules)
+    mismatches = []
+    mismatch_count = 0
+    pre_started = time.perf_counter()
+    for (url, source_url, request_type), post_blocked in zip(iter_corpus(corpus_path), post_verdicts):
+        pre_result = pre_matcher.match(url, source_url, request_type)
+        if pre_result["blocked"] != post_blocked:
+            mismatch_count += 1
+            if len(mismatches) < matcher_config.get("max_listed_mismatches", 50):
+                post_result = post_matcher.match(url, source_url, request_type)
+                mismatches.append({"url": url, "source": source_url, "type": request_type,
+                                   "unoptimised": pre_result, "optimised": post_result})
+    pre_seconds = time.perf_counter() - pre_started
+
+    if mismatch_count:
+        logger.warning(f"Matcher: Optimised and unoptimised rule sets disagree on {mismatch_count} request(s).")
+    logger.info(f"Matcher: {post_stats['requests']} request(s) replayed at {post_stats['requests_per_second']} req/s; "
+                f"{len(dead_rules)} of {len(post_matcher.filters)} output filter(s) never matched.")
+    return {
+        "corpus": corpus_path,
+        "replay": {**post_stats, "unoptimised_seconds": round(pre_seconds, 3)},
+        "dead_rules": {
+            "count": len(dead_rules),
+            "filters": len(post_matcher.filters),
+            "by_source": dict(dead_by_source.most_common()),
+            "rules": dead_rules[:max_listed],
+            "not_matchable": post_matcher.skipped[:max_listed],
+        },
+        "most_matched": [{"rule": rule, "hits": hits} for hits, rule in top_rules if hits],
+        "equivalence": {
+            "equivalent": mismatch_count == 0,
+            "reference": reference,
+            "unoptimised_rules": len(pre_rules),
+            "optimised_rules": len(post_rules),
+            "mismatches": mismatch_count,
+            "examples": mismatches,
+        },
+    }
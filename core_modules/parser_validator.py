@@ -3,6 +3,14 @@
 import re
 import logging
 from enum import Enum, auto
+from typing import Callable
+
+from .line_scanner import MappedListSource, iter_source_lines
+from .preprocessor import (
+    IF_DIRECTIVE, ELSE_DIRECTIVE, ENDIF_DIRECTIVE, INCLUDE_DIRECTIVE,
+    ConditionalBlockTracker, build_env_profile, extract_include_targets,
+    parse_include_directive, resolve_include_target,
+)
 
 logger = logging.getLogger(__name__)
 
@@ -26,6 +34,27 @@ class BraveValidityStatus(Enum):
     REPHRASED_AND_VALID = auto()
     REPHRASE_FAILED_VALIDATION = auto()
 
+def split_network_options(options_str: str) -> list[str]:
+    """
+    Splits the options of a network rule (the part after '$') on commas,
+    except escaped ones: in $removeparam=/a\\,b/ the comma belongs to the value.
+    """
+    if "\\" not in options_str:
+        return options_str.split(",")
+    options, current, escaped = [], [], False
+    for char in options_str:
+        if escaped:
+            escaped = False
+        elif char == "\\":
+            escaped = True
+        elif char == ",":
+            options.append("".join(current))
+            current = []
+            continue
+        current.append(char)
+    options.append("".join(current))
+    return options
+
 
 # --- Mock python-adblock (as defined previously) ---
 class MockPythonAdblock:
@@ -109,18 +138,20 @@ ADGUARD_SPECIFIC_PATTERNS = {
     re.compile(r"\$cookie", re.IGNORECASE),
     re.compile(r"\$jsonprune", re.IGNORECASE),
 }
+STYLE_DISPLAY_NONE_RE = re.compile(r":style\(\s*display\s*:\s*none\s*!important\s*\)", re.IGNORECASE)
 ABP_EXTENDED_CSS_SEPARATOR = "#?#"
+PREPROCESSOR_DIRECTIVES = (IF_DIRECTIVE, ELSE_DIRECTIVE, ENDIF_DIRECTIVE, INCLUDE_DIRECTIVE)
 
 def identify_rule_type(rule_string: str) -> tuple[RuleType, dict]:
     stripped_rule = rule_string.strip()
     if not stripped_rule: return RuleType.COMMENT, {"reason": "Empty line"}
+    if stripped_rule.startswith("[Adblock"): # [Adblock Plus 2.0] and similar version headers
+        return RuleType.METADATA_HEADER, {"subtype": "abp_version_header", "detail": stripped_rule, "action": "discard_from_body"}
     if stripped_rule.startswith("!"):
-        if stripped_rule.startswith("!#") and ("if" in stripped_rule or "include" in stripped_rule) :
+        if stripped_rule.startswith(PREPROCESSOR_DIRECTIVES):
             return RuleType.METADATA_HEADER, {"subtype": "ubo_preprocessor_directive", "detail": stripped_rule}
         if any(stripped_rule.startswith(hdr) for hdr in ["! Title:", "! Version:", "! Expires:", "! Homepage:", "! Description:"]):
             return RuleType.METADATA_HEADER, {"subtype": "standard_header", "detail": stripped_rule}
-        if stripped_rule == "[Adblock Plus 2.0]":
-            return RuleType.METADATA_HEADER, {"subtype": "abp_version_header", "detail": stripped_rule, "action": "discard_from_body"}
         return RuleType.COMMENT, {"detail": stripped_rule}
     if stripped_rule.startswith("#") and not (stripped_rule.startswith("##") or stripped_rule.startswith(ABP_EXTENDED_CSS_SEPARATOR) or stripped_rule.startswith("#@#") or stripped_rule.startswith("#%#")):
         if not re.match(r"^\d{1,3}\.\d{1,3}\.\d{1,3}\.\d{1,3}\s+", stripped_rule):
@@ -135,130 +166,216 @@ def identify_rule_type(rule_string: str) -> tuple[RuleType, dict]:
     if stripped_rule and not stripped_rule.isspace(): return RuleType.NETWORK, {}
     return RuleType.UNKNOWN, {"reason": "Line did not match any known rule pattern"}
 
+def _build_rule_object(
+    original_rule_string: str,
+    line_number: int,
+    source_url: str,
+    rule_id: int,
+    enable_detailed_logging: bool = False
+) -> dict:
+    """Identifies and validates a single list line, returning its rule object."""
+    line_stripped = original_rule_string.strip()
+
+    parsed_rule_obj = {
+        "id": rule_id,
+        "original_rule_string": line_stripped, # Store stripped version
+        "raw_line_string": original_rule_string, # Keep original for reference if needed
+        "source_url": source_url,
+        "line_number": line_number,
+        "rule_type": RuleType.UNKNOWN.name, # Default
+        "brave_validity_status": BraveValidityStatus.VALID.name, # Default
+        "validation_reason": "",
+        "parsed_components": {},
+        "type_identification_info": {}
+    }
+
+    if not line_stripped:
+        parsed_rule_obj.update({
+            "rule_type": RuleType.COMMENT.name,
+            "validation_reason": "Empty line",
+        })
+        return parsed_rule_obj
+
+    rule_type, type_info = identify_rule_type(line_stripped)
+    rule_type_str = rule_type.name
+    parsed_rule_obj["rule_type"] = rule_type_str
+    parsed_rule_obj["type_identification_info"] = type_info
+
+    if rule_type in [RuleType.COMMENT, RuleType.METADATA_HEADER]:
+        if type_info.get("action") == "discard_from_body":
+            # This isn't really a "validity" status for rephrasing,
+            # but a flag for the unifier/generator.
+            # For now, keep it VALID but the unifier will handle the discard.
+            parsed_rule_obj["validation_reason"] = "ABP version header to be discarded from body by unifier."
+        return parsed_rule_obj
+
+    if rule_type == RuleType.UNKNOWN:
+        parsed_rule_obj["brave_validity_status"] = BraveValidityStatus.INVALID_BRAVE_SYNTAX.name
+        parsed_rule_obj["validation_reason"] = type_info.get("reason","Unknown rule format")
+        if enable_detailed_logging: logger.debug(f"Rule ID {rule_id} UNKNOWN: {line_stripped[:100]}")
+        return parsed_rule_obj
+
+    mock_validation_result = mock_adblock_parser.parse_rule(line_stripped)
+    parsed_rule_obj["parsed_components"] = mock_validation_result.get("parsed_components", {})
+
+    if not mock_validation_result["valid_syntax"]:
+        parsed_rule_obj["brave_validity_status"] = BraveValidityStatus.INVALID_BRAVE_SYNTAX.name
+        parsed_rule_obj["validation_reason"] = mock_validation_result.get("error_message", "Core syntax invalid.")
+        logger.warning(f"Rule ID {rule_id} INVALID_BRAVE_SYNTAX by mock: '{line_stripped[:70]}...' | Reason: {parsed_rule_obj['validation_reason']}")
+        return parsed_rule_obj
+
+    current_status = BraveValidityStatus.VALID
+    reason = ""
+
+    # AdGuard specific checks
+    if rule_type == RuleType.SCRIPTLET and type_info.get("syntax_type") == "adguard":
+        current_status = BraveValidityStatus.POTENTIAL_ADGUARD_SPECIFIC
+        reason = "Uses AdGuard native scriptlet syntax (#%#//), needs rephrasing."
+    else:
+        for ag_pattern in ADGUARD_SPECIFIC_PATTERNS:
+            if ag_pattern.search(line_stripped):
+                current_status = BraveValidityStatus.POTENTIAL_ADGUARD_SPECIFIC
+                reason = f"Potential AdGuard-specific feature ({ag_pattern.pattern})."
+                if enable_detailed_logging: logger.debug(f"Rule ID {rule_id} POTENTIAL_ADGUARD_SPECIFIC: {line_stripped[:100]}")
+                break
+
+    if current_status == BraveValidityStatus.VALID: # Only if not already AdGuard specific
+        if rule_type_str == RuleType.NETWORK.name or \
+           (rule_type_str == RuleType.SCRIPTLET.name and parsed_rule_obj["parsed_components"].get("type") == "network"):
+            options_str = parsed_rule_obj["parsed_components"].get("options_string", "")
+            if options_str:
+                options_present = [opt.strip().split("=")[0] for opt in split_network_options(options_str)] # Get option name before =
+                for unsupported_opt in UNSUPPORTED_NETWORK_OPTIONS:
+                    if unsupported_opt in options_present:
+                        current_status = BraveValidityStatus.UNSUPPORTED_BRAVE_FEATURE
+                        reason = f"Uses unsupported network option: {unsupported_opt}."
+                        if enable_detailed_logging: logger.debug(f"Rule ID {rule_id} UNSUPPORTED (Net Opt): {line_stripped[:100]}")
+                        break
+                if current_status == BraveValidityStatus.VALID:
+                     for unsup_pattern in UNSUPPORTED_NETWORK_OPTION_PATTERNS:
+                        if unsup_pattern.search(options_str):
+                            current_status = BraveValidityStatus.UNSUPPORTED_BRAVE_FEATURE
+                            reason = f"Uses potentially unsupported network option pattern: {unsup_pattern.pattern}."
+                            if enable_detailed_logging: logger.debug(f"Rule ID {rule_id} UNSUPPORTED (Net Opt Pat): {line_stripped[:100]}")
+                            break
+        elif rule_type_str == RuleType.COSMETIC.name:
+            selector_str = parsed_rule_obj["parsed_components"].get("selector", "")
+            if parsed_rule_obj["parsed_components"].get("abp_extended_syntax"):
+                current_status = BraveValidityStatus.NEEDS_REPHRASING
+                reason = "Uses ABP extended CSS syntax (#?#), requires conversion."
+                if enable_detailed_logging: logger.debug(f"Rule ID {rule_id} NEEDS_REPHRASING (ABP Cosmetic): {line_stripped[:100]}")
+            else:
+                for unsup_sel_pattern in UNSUPPORTED_COSMETIC_SELECTORS_PATTERNS:
+                    if unsup_sel_pattern.search(selector_str):
+                        current_status = BraveValidityStatus.UNSUPPORTED_BRAVE_FEATURE
+                        reason = f"Uses potentially unsupported cosmetic selector pattern: {unsup_sel_pattern.pattern}."
+                        if enable_detailed_logging: logger.debug(f"Rule ID {rule_id} UNSUPPORTED (Cosmetic Sel): {line_stripped[:100]}")
+                        break
+                if current_status == BraveValidityStatus.VALID and ":style(" in selector_str \
+                   and not STYLE_DISPLAY_NONE_RE.search(selector_str):
+                    current_status = BraveValidityStatus.UNSUPPORTED_BRAVE_FEATURE
+                    reason = "Uses direct CSS style injection via :style() not for display:none."
+                    if enable_detailed_logging: logger.debug(f"Rule ID {rule_id} UNSUPPORTED (Cosmetic Style): {line_stripped[:100]}")
+
+    parsed_rule_obj["brave_validity_status"] = current_status.name
+    if reason:
+        parsed_rule_obj["validation_reason"] = reason
+    return parsed_rule_obj
+
 def parse_and_validate_rules(
-    raw_lists_data: dict[str, str],
-    parser_config: dict = None
+    raw_lists_data: dict[str, str | MappedListSource],
+    parser_config: dict = None,
+    top_level_sources: list[str] | None = None,
+    reuse_line: Callable[[str, str], dict | None] | None = None,
+    keep_comments: bool = True
 ) -> list[dict]:
+    """
+    Parses and validates every line of the downloaded lists.
+
+    `!#if`/`!#else`/`!#endif` blocks are evaluated in a single streaming pass
+    against a Brave/Chromium environment profile (overridable through
+    parser_config["preprocessor_env"]); lines in inactive blocks are dropped.
+    `!#include` directives in active blocks are expanded inline from
+    raw_lists_data (the downloader fetches include targets alongside the
+    top-level lists). Sources that are only reachable through an include are
+    not parsed a second time as top-level lists.
+
+    `reuse_line(source_url, raw_line)` may return the rule object of an
+    identical line from a previous build; a copy of it (with this build's
+    id and line number) is emitted instead of parsing the line again.
+
+    Without keep_comments, comment lines are skipped before parsing (at the
+    byte level for mapped local lists); `!#` directives are still read.
+    """
     all_processed_rules = []
     rule_id_counter = 0
-    enable_detailed_logging = parser_config.get("enable_detailed_logging", False) if parser_config else False
+    if parser_config is None: parser_config = {}
+    enable_detailed_logging = parser_config.get("enable_detailed_logging", False)
+    env_profile = build_env_profile(parser_config.get("preprocessor_env"))
 
-    for source_url, list_content_str in raw_lists_data.items():
-        lines = list_content_str.splitlines()
-        logger.info(f"Parser: Processing {len(lines)} lines from {source_url}...")
+    if top_level_sources is None:
+        included_sources = set()
+        for source_url, list_content_str in raw_lists_data.items():
+            included_sources.update(
+                target for target in extract_include_targets(source_url, list_content_str) if target != source_url)
+        top_level_sources = [source_url for source_url in raw_lists_data if source_url not in included_sources]
 
-        for line_num, original_rule_string in enumerate(lines):
-            rule_id_counter += 1
-            line_stripped = original_rule_string.strip()
+    def build_rule_object(original_rule_string: str, line_number: int, source_url: str) -> dict:
+        nonlocal rule_id_counter
+        rule_id_counter += 1
+        if reuse_line is not None:
+            previous = reuse_line(source_url, original_rule_string)
+            if previous is not None:
+                return {**previous, "id": rule_id_counter, "line_number": line_number}
+        return _build_rule_object(original_rule_string, line_number, source_url, rule_id_counter, enable_detailed_logging)
 
-            parsed_rule_obj = {
-                "id": rule_id_counter,
-                "original_rule_string": line_stripped, # Store stripped version
-                "raw_line_string": original_rule_string, # Keep original for reference if needed
-                "source_url": source_url,
-                "line_number": line_num + 1,
-                "rule_type": RuleType.UNKNOWN.name, # Default
-                "brave_validity_status": BraveValidityStatus.VALID.name, # Default
-                "validation_reason": "",
-                "parsed_components": {},
-                "type_identification_info": {}
-            }
-            
-            if not line_stripped:
-                parsed_rule_obj.update({
-                    "rule_type": RuleType.COMMENT.name,
-                    "validation_reason": "Empty line",
-                })
-                all_processed_rules.append(parsed_rule_obj)
-                continue
+    def process_source(source_url: str, list_content, include_stack: tuple):
+        if isinstance(list_content, MappedListSource):
+            logger.info(f"Parser: Scanning {list_content.size} bytes of mapped local list {source_url}...")
+        else:
+            logger.info(f"Parser: Processing {list_content.count(chr(10)) + 1} lines from {source_url}...")
+        block_tracker = ConditionalBlockTracker(env_profile)
+        skipped_inactive = 0
 
-            rule_type, type_info = identify_rule_type(line_stripped)
-            parsed_rule_obj["rule_type"] = rule_type.name
-            parsed_rule_obj["type_identification_info"] = type_info
-
-            if rule_type in [RuleType.COMMENT, RuleType.METADATA_HEADER]:
-                if type_info.get("action") == "discard_from_body":
-                    # This isn't really a "validity" status for rephrasing,
-                    # but a flag for the unifier/generator.
-                    # For now, keep it VALID but the unifier will handle the discard.
-                    parsed_rule_obj["validation_reason"] = "ABP version header to be discarded from body by unifier."
-                all_processed_rules.append(parsed_rule_obj)
-                continue
-            
-            if rule_type == RuleType.UNKNOWN:
-                parsed_rule_obj["brave_validity_status"] = BraveValidityStatus.INVALID_BRAVE_SYNTAX.name
-                parsed_rule_obj["validation_reason"] = type_info.get("reason","Unknown rule format")
-                all_processed_rules.append(parsed_rule_obj)
-                if enable_detailed_logging: logger.debug(f"Rule ID {rule_id_counter} UNKNOWN: {line_stripped[:100]}")
+        for line_number, original_rule_string in iter_source_lines(list_content, keep_comments):
+            line_stripped = original_rule_string.strip()
+            if line_stripped.startswith("!#"):
+                was_active = block_tracker.active
+                if block_tracker.feed_directive(line_stripped):
+                    if not was_active and not block_tracker.active:
+                        continue # Directives nested inside an inactive block are dropped too
+                    all_processed_rules.append(build_rule_object(original_rule_string, line_number, source_url))
+                    continue
+            if not block_tracker.active:
+                skipped_inactive += 1
                 continue
 
-            mock_validation_result = mock_adblock_parser.parse_rule(line_stripped)
-            parsed_rule_obj["parsed_components"] = mock_validation_result.get("parsed_components", {})
+            all_processed_rules.append(build_rule_object(original_rule_string, line_number, source_url))
 
-            if not mock_validation_result["valid_syntax"]:
-                parsed_rule_obj["brave_validity_status"] = BraveValidityStatus.INVALID_BRAVE_SYNTAX.name
-                parsed_rule_obj["validation_reason"] = mock_validation_result.get("error_message", "Core syntax invalid.")
-                logger.warning(f"Rule ID {rule_id_counter} INVALID_BRAVE_SYNTAX by mock: '{line_stripped[:70]}...' | Reason: {parsed_rule_obj['validation_reason']}")
-                all_processed_rules.append(parsed_rule_obj)
-                continue
+            include_target = parse_include_directive(line_stripped)
+            if include_target:
+                resolved = resolve_include_target(source_url, include_target)
+                if not resolved:
+                    continue
+                if resolved in include_stack or resolved == source_url:
+                    logger.warning(f"Parser: Include cycle detected: {source_url} -> {resolved}. Skipping.")
+                    continue
+                included_content = raw_lists_data.get(resolved)
+                if included_content is None:
+                    logger.warning(f"Parser: !#include target '{resolved}' (from {source_url}) was not downloaded. Skipping.")
+                    continue
+                process_source(resolved, included_content, include_stack + (source_url,))
 
-            current_status = BraveValidityStatus.VALID
-            reason = ""
+        if block_tracker.depth:
+            logger.warning(f"Parser: {block_tracker.depth} unterminated !#if block(s) at end of {source_url}.")
+        if skipped_inactive:
+            logger.info(f"Parser: Dropped {skipped_inactive} lines inside inactive !#if blocks in {source_url}.")
 
-            # AdGuard specific checks
-            if rule_type == RuleType.SCRIPTLET.name and type_info.get("syntax_type") == "adguard":
-                current_status = BraveValidityStatus.POTENTIAL_ADGUARD_SPECIFIC
-                reason = "Uses AdGuard native scriptlet syntax (#%#//), needs rephrasing."
-            else:
-                for ag_pattern in ADGUARD_SPECIFIC_PATTERNS:
-                    if ag_pattern.search(line_stripped):
-                        current_status = BraveValidityStatus.POTENTIAL_ADGUARD_SPECIFIC
-                        reason = f"Potential AdGuard-specific feature ({ag_pattern.pattern})."
-                        if enable_detailed_logging: logger.debug(f"Rule ID {rule_id_counter} POTENTIAL_ADGUARD_SPECIFIC: {line_stripped[:100]}")
-                        break
-            
-            if current_status == BraveValidityStatus.VALID: # Only if not already AdGuard specific
-                if rule_type_str == RuleType.NETWORK.name or \
-                   (rule_type_str == RuleType.SCRIPTLET.name and parsed_rule_obj["parsed_components"].get("type") == "network"):
-                    options_str = parsed_rule_obj["parsed_components"].get("options_string", "")
-                    if options_str:
-                        options_present = [opt.strip().split("=")[0] for opt in options_str.split(',')] # Get option name before =
-                        for unsupported_opt in UNSUPPORTED_NETWORK_OPTIONS:
-                            if unsupported_opt in options_present:
-                                current_status = BraveValidityStatus.UNSUPPORTED_BRAVE_FEATURE
-                                reason = f"Uses unsupported network option: {unsupported_opt}."
-                                if enable_detailed_logging: logger.debug(f"Rule ID {rule_id_counter} UNSUPPORTED (Net Opt): {line_stripped[:100]}")
-                                break
-                        if current_status == BraveValidityStatus.VALID:
-                             for unsup_pattern in UNSUPPORTED_NETWORK_OPTION_PATTERNS:
-                                if unsup_pattern.search(options_str):
-                                    current_status = BraveValidityStatus.UNSUPPORTED_BRAVE_FEATURE
-                                    reason = f"Uses potentially unsupported network option pattern: {unsup_pattern.pattern}."
-                                    if enable_detailed_logging: logger.debug(f"Rule ID {rule_id_counter} UNSUPPORTED (Net Opt Pat): {line_stripped[:100]}")
-                                    break
-                elif rule_type_str == RuleType.COSMETIC.name:
-                    selector_str = parsed_rule_obj["parsed_components"].get("selector", "")
-                    if parsed_rule_obj["parsed_components"].get("abp_extended_syntax"):
-                        current_status = BraveValidityStatus.NEEDS_REPHRASING
-                        reason = "Uses ABP extended CSS syntax (#?#), requires conversion."
-                        if enable_detailed_logging: logger.debug(f"Rule ID {rule_id_counter} NEEDS_REPHRASING (ABP Cosmetic): {line_stripped[:100]}")
-                    else:
-                        for unsup_sel_pattern in UNSUPPORTED_COSMETIC_SELECTORS_PATTERNS:
-                            if unsup_sel_pattern.search(selector_str):
-                                current_status = BraveValidityStatus.UNSUPPORTED_BRAVE_FEATURE
-                                reason = f"Uses potentially unsupported cosmetic selector pattern: {unsup_sel_pattern.pattern}."
-                                if enable_detailed_logging: logger.debug(f"Rule ID {rule_id_counter} UNSUPPORTED (Cosmetic Sel): {line_stripped[:100]}")
-                                break
-                        if current_status == BraveValidityStatus.VALID and ":style(" in selector_str \
-                           and not re.search(r":style\(\s*display\s*:\s*none\s*!important\s*\)", selector_str, re.IGNORECASE):
-                            current_status = BraveValidityStatus.UNSUPPORTED_BRAVE_FEATURE
-                            reason = "Uses direct CSS style injection via :style() not for display:none."
-                            if enable_detailed_logging: logger.debug(f"Rule ID {rule_id_counter} UNSUPPORTED (Cosmetic Style): {line_stripped[:100]}")
-            
-            parsed_rule_obj["brave_validity_status"] = current_status.name
-            if reason:
-                parsed_rule_obj["validation_reason"] = reason
-            all_processed_rules.append(parsed_rule_obj)
+    for source_url in top_level_sources:
+        list_content_str = raw_lists_data.get(source_url)
+        if list_content_str is None:
+            continue # Download failed; already reported by the downloader
+        process_source(source_url, list_content_str, ())
 
     logger.info(f"Parser: Finished processing. Total lines/rules analyzed: {len(all_processed_rules)}.")
     return all_processed_rules
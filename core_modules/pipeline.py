@@ -0,0 +1,235 @@
+# core_modules/pipeline.py
+
+import asyncio
+import logging
+import pathlib
+import threading
+import time
+from collections import OrderedDict
+from typing import Iterator
+
+from .config_loader import load_brave_scriptlet_metadata, load_configuration
+from .generator import build_header_lines, resolve_output_variants
+from .incremental import IncrementalRuleCache
+from .preprocessor import extract_include_targets
+from .sources import normalize_source_entries
+from .unifier_optimizer import UnifiedRuleSet, select_rules
+
+logger = logging.getLogger(__name__)
+
+
+class Pipeline:
+    """
+    Embeddable, long-lived pipeline for building lists in-process. The
+    configuration and the Brave scriptlet metadata are loaded once; every
+    source that a build needs is downloaded, parsed and rephrased once and
+    kept warm, as in `serve` mode: its per-line results in an
+    IncrementalRuleCache and its rules as one group of a UnifiedRuleSet.
+    A build then only selects and renders a variant:
+
+        pipeline = Pipeline("config.json")
+        for line in pipeline.build("network"):
+            ...
+        pipeline.build({"name": "customer-a", "filter_list_urls": [...],
+                        "exclude_rule_types": ["COSMETIC"]}, output_path="customer-a.txt")
+
+    A variant spec is the name of a configured output variant, or a dict
+    with the output_variants filters (see unifier_optimizer.select_rules),
+    an optional `generator_header` and an optional `filter_list_urls` list
+    of sources to build from instead of the configured ones.
+
+    Cached sources are refreshed once they are older than
+    `source_ttl_seconds` (pipeline_options); beyond `max_cached_sources`,
+    the least recently used ones are evicted. build() may be called from
+    several threads: downloads run one batch at a time, and the shared
+    state is only touched under a lock, so each build renders from a
+    consistent snapshot. build() runs its downloads with asyncio.run, so it
+    must not be called from a thread that is running an event loop.
+    """
+
+    def __init__(self, config: dict | str | pathlib.Path = "config.json", brave_scriptlets_data: dict | None = None):
+        if not isinstance(config, dict):
+            loaded = load_configuration(str(config))
+            if loaded is None:
+                raise ValueError(f"Configuration file not found: {config}")
+            config = loaded
+        self.config = config
+        pipeline_config = config.get("pipeline_options", {})
+        self.max_cached_sources = pipeline_config.get("max_cached_sources", 64)
+        self.source_ttl = pipeline_config.get("source_ttl_seconds", 3600)
+        if brave_scriptlets_data is None:
+            load_metadata = config.get("rephraser_options", {}).get("load_brave_metadata", True)
+            brave_scriptlets_data = load_brave_scriptlet_metadata(config) if load_metadata else {}
+        self.brave_scriptlets_data = brave_scriptlets_data
+        self.variants = {variant["name"]: variant for variant in resolve_output_variants(config)}
+
+        self.rule_cache = IncrementalRuleCache()
+        self.unified_set = UnifiedRuleSet(config.get("unifier_optimizer_options", {}))
+        # Top-level source url -> {"urls": the source and its include targets, "loaded": time.monotonic()}, LRU first
+        self._sources: OrderedDict[str, dict] = OrderedDict()
+        self._unified: dict | None = None # Scored result of unified_set, until a group changes
+        self._lock = threading.RLock()
+        self._download_lock = threading.Lock()
+
+    # --- Source state -------------------------------------------------------
+
+    def _stale_sources(self, sources: list[dict], refresh: bool) -> list[dict]:
+        now = time.monotonic()
+        with self._lock:
+            return [source for source in sources if refresh or source["url"] not in self._sources
+                    or (self.source_ttl is not None and now - self._sources[source["url"]]["loaded"] > self.source_ttl)]
+
+    def _load_sources(self, sources: list[dict], refresh: bool):
+        """Downloads, parses and rephrases the sources of `sources` that are missing or stale."""
+        if not self._stale_sources(sources, refresh):
+            return
+        with self._download_lock:
+            # Another thread may have loaded them while this one waited
+            stale = self._stale_sources(sources, refresh)
+            if not stale:
+                return
+            from .downloader import download_filter_lists
+            raw_lists_data = asyncio.run(download_filter_lists(stale, self.config.get("downloader_options", {})))
+            with self._lock:
+                for source in stale:
+                    self._replace_source(source["url"], self._source_documents(source["url"], raw_lists_data))
+
+    def _source_documents(self, url: str, raw_lists_data: dict) -> dict:
+        """The documents of one top-level source: itself and, transitively, the lists it includes."""
+        documents = {}
+        pending = [url]
+        while pending:
+            document_url = pending.pop()
+            if document_url in documents or document_url not in raw_lists_data:
+                continue
+            documents[document_url] = raw_lists_data[document_url]
+            pending.extend(extract_include_targets(document_url, documents[document_url]))
+        return documents
+
+    def _replace_source(self, url: str, documents: dict):
+        previous = self._sources.pop(url, None)
+        if not documents:
+            logger.error(f"Pipeline: {url} could not be fetched; {'keeping its previous rules' if previous else 'building without it'}.")
+            if previous:
+                self._sources[url] = previous
+            return
+        rules = self.rule_cache.parse_and_rephrase(
+            documents,
+            self.config.get("parser_validator_options", {}),
+            self.brave_scriptlets_data,
+            self.config.get("rephraser_options", {}),
+            top_level_sources=[url]
+        )
+        if previous:
+            self.rule_cache.forget(previous["urls"] - documents.keys() - self._urls_in_use(exclude=url))
+        self.unified_set.replace_group(url, rules)
+        self._sources[url] = {"urls": set(documents), "loaded": time.monotonic()}
+        self._unified = None
+
+    def _urls_in_use(self, exclude: str | None = None) -> set[str]:
+        # An included list shared by two sources stays cached while either one is
+        return {document_url for url, state in self._sources.items() if url != exclude for document_url in state["urls"]}
+
+    def evict(self, source_urls: list[str] | None = None):
+        """Drops the cached state of the given top-level sources (default: all of them)."""
+        with self._lock:
+            for url in list(self._sources) if source_urls is None else source_urls:
+                state = self._sources.pop(url, None)
+                if state is None:
+                    continue
+                self.rule_cache.forget(state["urls"] - self._urls_in_use())
+                self.unified_set.remove_group(url)
+                self._unified = None
+                logger.info(f"Pipeline: Evicted cached state of {url}.")
+
+    def _evict_over_limit(self, keep: set[str]):
+        if self.max_cached_sources is None:
+            return
+        excess = len(self._sources) - self.max_cached_sources
+        if excess > 0:
+            self.evict([url for url in self._sources if url not in keep][:excess]) # Least recently used first
+
+    @property
+    def cached_sources(self) -> list[str]:
+        with self._lock:
+            return list(self._sources)
+
+    # --- Building -----------------------------------------------------------
+
+    def resolve_variant(self, variant_spec: str | dict | None = None) -> dict:
+        """A configured variant by name (default: the first one), or a custom spec merged over the global header."""
+        if variant_spec is None:
+            return next(iter(self.variants.values()))
+        if isinstance(variant_spec, str):
+            if variant_spec not in self.variants:
+                raise ValueError(f"Output variant '{variant_spec}' is not configured.")
+            return self.variants[variant_spec]
+        variant = dict(variant_spec)
+        variant.setdefault("name", "custom")
+        variant["generator_header"] = {**self.config.get("generator_header", {}), **variant_spec.get("generator_header", {})}
+        return variant
+
+    def _unified_rules(self) -> dict:
+        if self._unified is None:
+            unified_rules = self.unified_set.result()
+            rule_cost_config = self.config.get("rule_cost_options", {})
+            if rule_cost_config.get("enabled", True):
+                from .rule_cost import score_unified_rules
+                score_unified_rules(unified_rules, rule_cost_config)
+            self._unified = unified_rules
+        return self._unified
+
+    def select_lines(self, variant: dict, refresh: bool = False) -> list[str]:
+        """Loads what the variant's sources need and returns its rule and comment lines (no header)."""
+        filter_list_urls = variant.get("filter_list_urls", self.config.get("filter_list_urls", []))
+        sources = normalize_source_entries(filter_list_urls)
+        self._load_sources(sources, refresh)
+        with self._lock:
+            for source in sources:
+                if source["url"] in self._sources:
+                    self._sources.move_to_end(source["url"])
+            unified_rules = self._unified_rules()
+            build_urls = {document_url for source in sources for document_url in self._sources.get(source["url"], {}).get("urls", ())}
+            if build_urls != self._urls_in_use():
+                # Only the rules of this build's sources; the budget below must not count the others
+                unified_rules = {
+                    **unified_rules,
+                    "rules": [r for r in unified_rules["rules"] if any(origin[0] in build_urls for origin in r["origins"])],
+                    "comments": [c for c in unified_rules["comments"] if any(origin[0] in build_urls for origin in c["origins"])],
+                }
+            budget_config = self.config.get("rule_budget_options", {})
+            if budget_config.get("enabled", False):
+                from .rule_budget import apply_rule_budget
+                unified_rules = dict(unified_rules) # apply_rule_budget replaces "rules"; keep the cached result whole
+                apply_rule_budget(unified_rules, filter_list_urls, budget_config)
+            lines = select_rules(unified_rules, variant)
+            self._evict_over_limit(keep={source["url"] for source in sources})
+        return lines
+
+    def build(
+        self,
+        variant_spec: str | dict | None = None,
+        output_path: str | pathlib.Path | None = None,
+        refresh: bool = False
+    ) -> Iterator[str] | pathlib.Path:
+        """
+        Builds one variant. Returns an iterator over its lines (header
+        included, no line endings), or writes them to `output_path` and
+        returns that path. With refresh, every source of the variant is
+        downloaded again even if its cached state is still fresh.
+        """
+        variant = self.resolve_variant(variant_spec)
+        started = time.perf_counter()
+        lines = self.select_lines(variant, refresh)
+        header_lines = build_header_lines(variant["generator_header"])
+        logger.info(f"Pipeline: Built variant '{variant['name']}' ({len(lines)} lines) in {time.perf_counter() - started:.3f}s.")
+        if output_path is None:
+            return iter(header_lines + lines)
+        output_path = pathlib.Path(output_path)
+        output_path.parent.mkdir(parents=True, exist_ok=True)
+        with open(output_path, "w", encoding="utf-8") as f:
+            for line in header_lines:
+                f.write(line + "\n")
+            for line in lines:
+                f.write(line + "\n")
+        return output_path
@@ -0,0 +1,221 @@
+# core_modules/preprocessor.py
+
+import re
+import logging
+import posixpath
+from functools import lru_cache
+from urllib.parse import urljoin, urlparse
+
+from .line_scanner import MappedListSource, iter_source_lines
+
+logger = logging.getLogger(__name__)
+
+# uBO-style preprocessor directives (https://github.com/gorhill/uBlock/wiki/Static-filter-syntax#if-condition)
+IF_DIRECTIVE = "!#if"
+ELSE_DIRECTIVE = "!#else"
+ENDIF_DIRECTIVE = "!#endif"
+INCLUDE_DIRECTIVE = "!#include"
+
+# Environment tokens as Brave (Chromium-based, adblock-rust engine) would answer them.
+# Tokens not listed here (env_firefox, env_safari, adguard_app_*, ...) evaluate to False.
+DEFAULT_BRAVE_ENV_PROFILE = {
+    "env_chromium": True,
+    "ext_ublock": True,           # adblock-rust understands uBO filter syntax
+    "cap_user_stylesheet": True,
+    "cap_html_filtering": False,
+    "env_mobile": False,
+    "env_mv3": False,
+    "false": False,
+}
+
+_EXPRESSION_TOKEN_RE = re.compile(r"\s*(&&|\|\||!|\(|\)|[\w.-]+)")
+
+
+def build_env_profile(overrides: dict | None = None) -> dict:
+    """Returns the Brave environment profile with optional per-config overrides applied."""
+    env = dict(DEFAULT_BRAVE_ENV_PROFILE)
+    if overrides:
+        env.update({str(k): bool(v) for k, v in overrides.items()})
+    return env
+
+
+def _tokenize_expression(expression: str) -> list[str]:
+    tokens = []
+    pos = 0
+    expression = expression.rstrip()
+    while pos < len(expression):
+        match = _EXPRESSION_TOKEN_RE.match(expression, pos)
+        if not match:
+            raise ValueError(f"Unexpected character at position {pos}")
+        tokens.append(match.group(1))
+        pos = match.end()
+    return tokens
+
+
+@lru_cache(maxsize=256)
+def _compile_expression(expression: str):
+    """
+    Compiles an `!#if` condition into a nested tuple tree so repeated
+    conditions (very common across lists) are only parsed once.
+    Grammar: or := and ('||' and)* ; and := unary ('&&' unary)* ;
+             unary := '!' unary | '(' or ')' | token
+    """
+    tokens = _tokenize_expression(expression)
+    pos = 0
+
+    def peek():
+        return tokens[pos] if pos < len(tokens) else None
+
+    def parse_or():
+        nonlocal pos
+        node = parse_and()
+        while peek() == "||":
+            pos += 1
+            node = ("or", node, parse_and())
+        return node
+
+    def parse_and():
+        nonlocal pos
+        node = parse_unary()
+        while peek() == "&&":
+            pos += 1
+            node = ("and", node, parse_unary())
+        return node
+
+    def parse_unary():
+        nonlocal pos
+        token = peek()
+        if token is None:
+            raise ValueError("Unexpected end of expression")
+        pos += 1
+        if token == "!":
+            return ("not", parse_unary())
+        if token == "(":
+            node = parse_or()
+            if peek() != ")":
+                raise ValueError("Missing closing parenthesis")
+            pos += 1
+            return node
+        if token in ("&&", "||", ")"):
+            raise ValueError(f"Unexpected operator '{token}'")
+        return ("token", token)
+
+    tree = parse_or()
+    if pos != len(tokens):
+        raise ValueError(f"Trailing tokens: {tokens[pos:]}")
+    return tree
+
+
+def _evaluate_tree(node, env: dict) -> bool:
+    kind = node[0]
+    if kind == "token":
+        return bool(env.get(node[1], False))
+    if kind == "not":
+        return not _evaluate_tree(node[1], env)
+    if kind == "and":
+        return _evaluate_tree(node[1], env) and _evaluate_tree(node[2], env)
+    return _evaluate_tree(node[1], env) or _evaluate_tree(node[2], env)
+
+
+def evaluate_if_expression(expression: str, env: dict) -> bool:
+    """
+    Evaluates the condition of an `!#if` directive against an environment profile.
+    Malformed conditions evaluate to False, matching uBO's behaviour.
+    """
+    try:
+        tree = _compile_expression(expression.strip())
+    except ValueError as e:
+        logger.warning(f"Preprocessor: Malformed !#if condition '{expression.strip()}': {e}. Treating as false.")
+        return False
+    return _evaluate_tree(tree, env)
+
+
+class ConditionalBlockTracker:
+    """
+    Streaming `!#if`/`!#else`/`!#endif` evaluator. Lines are fed one at a time;
+    only a stack of (parent_active, condition, in_else) frames is kept, never
+    the lines of a block.
+    """
+
+    def __init__(self, env: dict):
+        self.env = env
+        self._stack: list[list] = []
+        self.active = True
+
+    def _recompute(self):
+        if not self._stack:
+            self.active = True
+        else:
+            parent_active, condition, in_else = self._stack[-1]
+            self.active = parent_active and (condition != in_else)
+
+    def feed_directive(self, line_stripped: str) -> bool:
+        """
+        Consumes a conditional directive line. Returns True if the line was an
+        `!#if`, `!#else` or `!#endif` directive, False otherwise.
+        """
+        if not line_stripped.startswith("!#"):
+            return False
+        if line_stripped.startswith(IF_DIRECTIVE) and (len(line_stripped) == len(IF_DIRECTIVE) or line_stripped[len(IF_DIRECTIVE)].isspace()):
+            condition = evaluate_if_expression(line_stripped[len(IF_DIRECTIVE):], self.env)
+            self._stack.append([self.active, condition, False])
+        elif line_stripped.startswith(ELSE_DIRECTIVE):
+            if not self._stack:
+                logger.debug("Preprocessor: '!#else' without matching '!#if' ignored.")
+            else:
+                self._stack[-1][2] = True
+        elif line_stripped.startswith(ENDIF_DIRECTIVE):
+            if not self._stack:
+                logger.debug("Preprocessor: '!#endif' without matching '!#if' ignored.")
+            else:
+                self._stack.pop()
+        else:
+            return False
+        self._recompute()
+        return True
+
+    @property
+    def depth(self) -> int:
+        return len(self._stack)
+
+
+def parse_include_directive(line_stripped: str) -> str | None:
+    """Returns the target of an `!#include <target>` line, or None."""
+    if not line_stripped.startswith(INCLUDE_DIRECTIVE):
+        return None
+    target = line_stripped[len(INCLUDE_DIRECTIVE):].strip()
+    return target or None
+
+
+def resolve_include_target(parent_source: str, target: str) -> str | None:
+    """
+    Resolves an `!#include` target relative to the including source.
+    Like uBO, only targets on the same origin as the parent list are allowed.
+    """
+    parent_parsed = urlparse(parent_source)
+    if parent_parsed.scheme in ("http", "https", "file"):
+        resolved = urljoin(parent_source, target)
+        resolved_parsed = urlparse(resolved)
+        if (resolved_parsed.scheme, resolved_parsed.netloc) != (parent_parsed.scheme, parent_parsed.netloc):
+            logger.warning(f"Preprocessor: Refusing cross-origin !#include '{target}' from {parent_source}.")
+            return None
+        return resolved
+    # Local filesystem path
+    return posixpath.normpath(posixpath.join(posixpath.dirname(parent_source), target))
+
+
+def extract_include_targets(source: str, content) -> list[str]:
+    """Returns the resolved `!#include` targets referenced by a list body (str or MappedListSource)."""
+    if isinstance(content, MappedListSource):
+        if not content.contains(INCLUDE_DIRECTIVE.encode("ascii")):
+            return []
+    elif INCLUDE_DIRECTIVE not in content:
+        return []
+    targets = []
+    for _, line in iter_source_lines(content):
+        target = parse_include_directive(line.strip())
+        if target:
+            resolved = resolve_include_target(source, target)
+            if resolved and resolved not in targets:
+                targets.append(resolved)
+    return targets
@@ -0,0 +1,256 @@
+# core_modules/profiling.py
+
+import cProfile
+import importlib
+import json
+import logging
+import os
+import pathlib
+import pstats
+import re
+import time
+import tracemalloc
+from contextlib import contextmanager
+
+logger = logging.getLogger(__name__)
+
+# Modules whose module-level compiled patterns (single patterns or
+# sets/lists/tuples of them) are counted by instrument_patterns()
+INSTRUMENTED_PATTERN_MODULES = ("core_modules.parser_validator", "core_modules.rephraser")
+
+class RegexCounters:
+    """Per-stage evaluation / match / time counters, keyed by pattern name."""
+
+    def __init__(self):
+        self.current_stage = None
+        self.by_stage: dict[str, dict[str, list]] = {}
+
+    def record(self, name: str, matched: bool, seconds: float):
+        counters = self.by_stage.setdefault(self.current_stage or "unstaged", {}).setdefault(name, [0, 0, 0.0])
+        counters[0] += 1
+        if matched: counters[1] += 1
+        counters[2] += seconds
+
+    def report(self, stage: str) -> list[dict]:
+        """Patterns of one stage, most expensive first."""
+        rows = [
+            {"pattern": name, "evaluations": evaluations, "matches": matches, "seconds": round(seconds, 6),
+             "match_rate": round(matches / evaluations, 4) if evaluations else 0.0}
+            for name, (evaluations, matches, seconds) in self.by_stage.get(stage, {}).items()
+        ]
+        rows.sort(key=lambda row: row["seconds"], reverse=True)
+        return rows
+
+class CountingPattern:
+    """
+    Stands in for a compiled pattern and counts how often search / match /
+    fullmatch / sub / split are evaluated versus how often they match. Any
+    other attribute (pattern, flags, groups, ...) is the wrapped pattern's.
+    """
+
+    def __init__(self, name: str, pattern: re.Pattern, counters: RegexCounters):
+        self.name = name
+        self.wrapped = pattern
+        self.counters = counters
+
+    def __getattr__(self, attribute):
+        return getattr(self.wrapped, attribute)
+
+    def _timed(self, method, *args):
+        started = time.perf_counter()
+        result = method(*args)
+        return result, time.perf_counter() - started
+
+    def search(self, *args):
+        result, seconds = self._timed(self.wrapped.search, *args)
+        self.counters.record(self.name, result is not None, seconds)
+        return result
+
+    def match(self, *args):
+        result, seconds = self._timed(self.wrapped.match, *args)
+        self.counters.record(self.name, result is not None, seconds)
+        return result
+
+    def fullmatch(self, *args):
+        result, seconds = self._timed(self.wrapped.fullmatch, *args)
+        self.counters.record(self.name, result is not None, seconds)
+        return result
+
+    def sub(self, repl, string, count=0):
+        (result, substitutions), seconds = self._timed(self.wrapped.subn, repl, string, count)
+        self.counters.record(self.name, substitutions > 0, seconds)
+        return result
+
+    def split(self, string, maxsplit=0):
+        result, seconds = self._timed(self.wrapped.split, string, maxsplit)
+        self.counters.record(self.name, len(result) > 1, seconds)
+        return result
+
+def _wrap_value(module_name: str, attribute: str, value, counters: RegexCounters):
+    short_module = module_name.rsplit(".", 1)[-1]
+    if isinstance(value, re.Pattern):
+        return CountingPattern(f"{short_module}.{attribute}", value, counters)
+    if isinstance(value, (set, frozenset, list, tuple)) and value and all(isinstance(item, re.Pattern) for item in value):
+        wrapped = [CountingPattern(f"{short_module}.{attribute}[{item.pattern}]", item, counters) for item in value]
+        return type(value)(wrapped)
+    return None
+
+@contextmanager
+def instrument_patterns(counters: RegexCounters, module_names: tuple[str, ...] = INSTRUMENTED_PATTERN_MODULES):
+    """Swaps the modules' compiled patterns for counting ones for the duration of the block."""
+    originals = []
+    for module_name in module_names:
+        module = importlib.import_module(module_name)
+        for attribute, value in list(vars(module).items()):
+            if attribute.startswith("__"): continue
+            wrapped = _wrap_value(module_name, attribute, value, counters)
+            if wrapped is not None:
+                originals.append((module, attribute, value))
+                setattr(module, attribute, wrapped)
+    logger.debug(f"Profiling: Counting {len(originals)} module-level pattern(s).")
+    try:
+        yield counters
+    finally:
+        for module, attribute, value in originals:
+            setattr(module, attribute, value)
+
+def _frame_label(function: tuple) -> str:
+    filename, line, name = function
+    if filename == "~": # Built-ins
+        return name.replace(";", ":")
+    return f"{os.path.basename(filename)}:{name}:{line}".replace(";", ":")
+
+def write_collapsed_stacks(stats: pstats.Stats, output_path: pathlib.Path, max_depth: int = 64) -> int:
+    """
+    Writes cProfile data as collapsed stacks ("a;b;c <microseconds>" lines,
+    the input format of flamegraph.pl / speedscope / inferno). cProfile only
+    records caller -> callee edges, so a function's time is split across its
+    call paths in proportion to the cumulative time each caller edge
+    accounts for. Returns the number of stack lines written.
+    """
+    raw_stats = stats.stats
+    callees: dict[tuple, list[tuple]] = {}
+    for function, (_, _, _, _, callers) in raw_stats.items():
+        for caller in callers:
+            callees.setdefault(caller, []).append(function)
+    roots = [function for function, entry in raw_stats.items() if not entry[4]]
+
+    collapsed: dict[str, float] = {}
+    def walk(function: tuple, share: float, path: list[str], on_path: set):
+        _, _, inline_time, cumulative_time, _ = raw_stats[function]
+        path.append(_frame_label(function))
+        on_path.add(function)
+        fraction = share / cumulative_time if cumulative_time else 0.0
+        stack = ";".join(path)
+        collapsed[stack] = collapsed.get(stack, 0.0) + inline_time * fraction
+        if len(path) < max_depth:
+            for callee in callees.get(function, ()):
+                if callee in on_path: continue # Recursion is folded into the outer frame
+                edge_cumulative = raw_stats[callee][4][function][3]
+                if edge_cumulative * fraction > 0:
+                    walk(callee, edge_cumulative * fraction, path, on_path)
+        path.pop()
+        on_path.discard(function)
+
+    for root in roots:
+        walk(root, raw_stats[root][3], [], set())
+
+    line_count = 0
+    with open(output_path, "w", encoding="utf-8") as f:
+        for stack, seconds in collapsed.items():
+            microseconds = int(seconds * 1_000_000)
+            if microseconds > 0:
+                f.write(f"{stack} {microseconds}\n")
+                line_count += 1
+    return line_count
+
+class PipelineProfiler:
+    """
+    Profiles each pipeline stage run inside `stage(name)`: a cProfile dump
+    (<stage>.pstats), collapsed stacks for flame graphs (<stage>.collapsed),
+    the top tracemalloc allocation sites the stage added (and optionally the
+    snapshot itself, <stage>.tracemalloc) and the per-pattern regex counters.
+    `write_summary()` collects everything in profile_summary.json.
+
+    Options (profile_options in config.json): top_allocations,
+    tracemalloc_frames, dump_tracemalloc_snapshots, top_functions,
+    top_patterns, collapsed_max_depth.
+    """
+
+    def __init__(self, output_dir: str | pathlib.Path, profile_config: dict | None = None):
+        self.output_dir = pathlib.Path(output_dir)
+        self.config = profile_config or {}
+        self.counters = RegexCounters()
+        self.stage_reports: dict[str, dict] = {}
+
+    @contextmanager
+    def stage(self, stage_name: str):
+        self.output_dir.mkdir(parents=True, exist_ok=True)
+        started_tracemalloc = not tracemalloc.is_tracing()
+        if started_tracemalloc:
+            tracemalloc.start(self.config.get("tracemalloc_frames", 1))
+        tracemalloc.reset_peak()
+        before_snapshot = tracemalloc.take_snapshot()
+        before_current, _ = tracemalloc.get_traced_memory()
+        self.counters.current_stage = stage_name
+        profile = cProfile.Profile()
+        started = time.perf_counter()
+        profile.enable()
+        try:
+            yield self
+        finally:
+            profile.disable()
+            elapsed = time.perf_counter() - started
+            self.counters.current_stage = None
+            after_snapshot = tracemalloc.take_snapshot()
+            after_current, peak = tracemalloc.get_traced_memory()
+            if started_tracemalloc:
+                tracemalloc.stop()
+            self._record_stage(stage_name, elapsed, profile, before_snapshot, after_snapshot, after_current - before_current, peak)
+
+    def _record_stage(self, stage_name, elapsed, profile, before_snapshot, after_snapshot, memory_delta, peak):
+        pstats_path = self.output_dir / f"{stage_name}.pstats"
+        collapsed_path = self.output_dir / f"{stage_name}.collapsed"
+        profile.dump_stats(pstats_path)
+        stats = pstats.Stats(profile)
+        write_collapsed_stacks(stats, collapsed_path, self.config.get("collapsed_max_depth", 64))
+
+        top_functions = sorted(stats.stats.items(), key=lambda item: item[1][3], reverse=True)[:self.config.get("top_functions", 15)]
+        ignore_own_frames = (tracemalloc.Filter(False, tracemalloc.__file__), tracemalloc.Filter(False, __file__))
+        allocation_diff = after_snapshot.filter_traces(ignore_own_frames).compare_to(
+            before_snapshot.filter_traces(ignore_own_frames), "lineno")
+        top_allocations = [
+            {"site": str(stat.traceback), "size_diff_bytes": stat.size_diff, "count_diff": stat.count_diff, "size_bytes": stat.size}
+            for stat in allocation_diff[:self.config.get("top_allocations", 15)]
+        ]
+        snapshot_path = None
+        if self.config.get("dump_tracemalloc_snapshots", False):
+            snapshot_path = self.output_dir / f"{stage_name}.tracemalloc"
+            after_snapshot.dump(str(snapshot_path))
+
+        self.stage_reports[stage_name] = {
+            "seconds": round(elapsed, 4),
+            "memory_delta_bytes": memory_delta,
+            "memory_peak_bytes": peak,
+            "pstats": str(pstats_path),
+            "collapsed_stacks": str(collapsed_path),
+            "tracemalloc_snapshot": str(snapshot_path) if snapshot_path else None,
+            "top_functions_cumulative": [
+                {"function": _frame_label(function), "calls": entry[1], "tottime": round(entry[2], 6), "cumtime": round(entry[3], 6)}
+                for function, entry in top_functions
+            ],
+            "top_allocations": top_allocations,
+            "regex_counters": self.counters.report(stage_name)[:self.config.get("top_patterns", 50)],
+        }
+        logger.info(f"Profiling: Stage '{stage_name}' took {elapsed:.2f}s, peak traced memory {peak / 1_048_576:.1f} MiB; "
+                    f"profile written to {pstats_path}.")
+        for row in self.stage_reports[stage_name]["regex_counters"][:5]:
+            logger.info(f"Profiling:   {row['pattern']}: {row['evaluations']} evaluation(s), {row['matches']} match(es), {row['seconds']:.4f}s")
+
+    def write_summary(self) -> pathlib.Path:
+        self.output_dir.mkdir(parents=True, exist_ok=True)
+        summary_path = self.output_dir / "profile_summary.json"
+        with open(summary_path, "w", encoding="utf-8") as f:
+            json.dump({"stages": self.stage_reports}, f, indent=2)
+        logger.info(f"Profiling: Summary written to {summary_path.resolve()}.")
+        return summary_path
@@ -0,0 +1,341 @@
+# core_modules/provenance_index.py
+
+import argparse
+import hashlib
+import logging
+import mmap
+import pathlib
+import struct
+import sys
+import time
+
+# Only the standard library is imported at module level: the lookup CLI
+# opens an index without loading the parser or any other pipeline module.
+
+logger = logging.getLogger(__name__)
+
+# Provenance index of one generated list, all integers little-endian:
+#   header   magic(8) version(u32) header_lines(u32) line_count(u32) source_count(u32) host_count(u32)
+#            lines_offset(u64) sources_offset(u64) hosts_offset(u64) hashes_offset(u64)
+#   records  per output line: varint(len) + line, varint(provenance count), then per
+#            provenance varint(source id) + varint(line number) + varint(len + 1) + original
+#            (a length of 0 means the original is the output line itself)
+#   sources  per source: varint(len) + url
+#   hosts    host blob (per host: varint(len) + key, varint(count) + delta-coded line
+#            indexes), then host_count x (u64 key offset) sorted by key
+#   lines    line_count x u64 record offsets
+#   hashes   line_count x (u64 line hash, u32 line index) sorted by hash
+# Host keys have their labels reversed ("ads.example.com" -> "com.example.ads"),
+# so a host's subdomains are a contiguous range of keys. A rule is indexed
+# under the host it blocks (||host^, hosts files) and under the domains it is
+# restricted to ($domain=, cosmetic and scriptlet domain lists); generic rules
+# have no host.
+INDEX_MAGIC = b"BPLPROV\x00"
+INDEX_VERSION = 1
+INDEX_HEADER = struct.Struct("<8sIIIIIQQQQ")
+INDEX_OFFSET = struct.Struct("<Q")
+INDEX_HASH_ENTRY = struct.Struct("<QI")
+COSMETIC_SEPARATORS = ("#@#", "#?#", "#$#", "##")
+
+
+def _write_varint(buffer: bytearray, value: int):
+    while True:
+        byte = value & 0x7F
+        value >>= 7
+        if value:
+            buffer.append(byte | 0x80)
+        else:
+            buffer.append(byte)
+            return
+
+
+def _read_varint(buf, pos: int) -> tuple[int, int]:
+    value = shift = 0
+    while True:
+        byte = buf[pos]
+        pos += 1
+        value |= (byte & 0x7F) << shift
+        if not byte & 0x80:
+            return value, pos
+        shift += 7
+
+
+def _line_hash(line: str) -> int:
+    return int.from_bytes(hashlib.blake2b(line.encode("utf-8"), digest_size=8).digest(), "little")
+
+
+def _host_key(host: str) -> bytes:
+    return ".".join(reversed(host.lower().rstrip(".").split("."))).encode("utf-8")
+
+
+def _domain_list_hosts(domains: str, separator: str) -> list[str]:
+    return [d.strip() for d in domains.split(separator) if d.strip() and not d.strip().startswith(("~", "/"))]
+
+
+def rule_hosts(rule_str: str, rule_type_name: str) -> set[str]:
+    """Hostnames a rule is indexed under: the host it targets and the domains it is restricted to."""
+    from .parser_validator import split_network_options
+    from .unifier_optimizer import get_domain_from_network_rule
+    hosts = set()
+    if rule_type_name == "HOSTS_RULE":
+        hosts.update(rule_str.split("#", 1)[0].split()[1:])
+    elif rule_type_name in ("COSMETIC", "SCRIPTLET") and any(sep in rule_str for sep in COSMETIC_SEPARATORS):
+        for separator in COSMETIC_SEPARATORS:
+            if separator in rule_str:
+                hosts.update(_domain_list_hosts(rule_str.split(separator, 1)[0], ","))
+                break
+    elif rule_type_name in ("NETWORK", "SCRIPTLET"):
+        domain = get_domain_from_network_rule(rule_str)
+        if domain: hosts.add(domain)
+        if "$" in rule_str:
+            for option in split_network_options(rule_str.rsplit("$", 1)[1]):
+                name, _, value = option.partition("=")
+                if name.strip().lower() in ("domain", "from"):
+                    hosts.update(_domain_list_hosts(value, "|"))
+    return {host.lower() for host in hosts if "." in host or host == "localhost"}
+
+
+def write_provenance_index(unified_rules: dict, variant_lines: list[str], header_line_count: int,
+                           output_path: str | pathlib.Path) -> int:
+    """
+    Writes the provenance index (format above) for one generated list whose
+    body is `variant_lines`, preceded by `header_line_count` header lines.
+    Every line is mapped to the (source, line number, original string) of
+    each upstream rule that produced it. Returns the number of hosts indexed.
+    """
+    records = {rule_data["string"]: rule_data for rule_data in unified_rules["rules"]}
+    records.update((comment["string"], comment) for comment in unified_rules["comments"])
+
+    source_ids: dict[str, int] = {}
+    host_lines: dict[bytes, list[int]] = {}
+    body = bytearray()
+    line_offsets = []
+    hashes = []
+    for line_index, line in enumerate(variant_lines):
+        line_offsets.append(len(body))
+        encoded = line.encode("utf-8")
+        _write_varint(body, len(encoded))
+        body += encoded
+        record = records.get(line, {})
+        provenance = record.get("provenance", [])
+        _write_varint(body, len(provenance))
+        for source_url, line_number, original in provenance:
+            _write_varint(body, source_ids.setdefault(source_url or "", len(source_ids)))
+            _write_varint(body, line_number or 0)
+            if original == line:
+                _write_varint(body, 0)
+            else:
+                encoded_original = original.encode("utf-8")
+                _write_varint(body, len(encoded_original) + 1)
+                body += encoded_original
+        hashes.append((_line_hash(line), line_index))
+        if "type" in record:
+            for host in rule_hosts(line, record["type"].name):
+                host_lines.setdefault(_host_key(host), []).append(line_index)
+
+    output_path = pathlib.Path(output_path)
+    output_path.parent.mkdir(parents=True, exist_ok=True)
+    with open(output_path, "wb") as f:
+        f.write(INDEX_HEADER.pack(INDEX_MAGIC, INDEX_VERSION, 0, 0, 0, 0, 0, 0, 0, 0)) # Patched at the end
+        records_offset = f.tell()
+        f.write(body)
+
+        sources_offset = f.tell()
+        sources_blob = bytearray()
+        for source_url in source_ids: # Insertion order is id order
+            encoded = source_url.encode("utf-8")
+            _write_varint(sources_blob, len(encoded))
+            sources_blob += encoded
+        f.write(sources_blob)
+
+        host_blob = bytearray()
+        host_key_offsets = []
+        blob_offset = f.tell()
+        for key in sorted(host_lines):
+            host_key_offsets.append(blob_offset + len(host_blob))
+            _write_varint(host_blob, len(key))
+            host_blob += key
+            indexes = host_lines[key]
+            _write_varint(host_blob, len(indexes))
+            previous = 0
+            for line_index in indexes: # Ascending, so deltas are small
+                _write_varint(host_blob, line_index - previous)
+                previous = line_index
+        f.write(host_blob)
+        hosts_offset = f.tell()
+        f.write(b"".join(INDEX_OFFSET.pack(offset) for offset in host_key_offsets))
+
+        lines_offset = f.tell()
+        f.write(b"".join(INDEX_OFFSET.pack(records_offset + offset) for offset in line_offsets))
+        hashes_offset = f.tell()
+        f.write(b"".join(INDEX_HASH_ENTRY.pack(*entry) for entry in sorted(hashes)))
+
+        f.seek(0)
+        f.write(INDEX_HEADER.pack(INDEX_MAGIC, INDEX_VERSION, header_line_count, len(variant_lines), len(source_ids),
+                                  len(host_key_offsets), lines_offset, sources_offset, hosts_offset, hashes_offset))
+    return len(host_key_offsets)
+
+
+class ProvenanceIndex:
+    """
+    Reader for a provenance index: memory-maps the file and answers lookups
+    by output line number, by exact line text and by hostname with binary
+    searches, decoding only the records it returns.
+    """
+
+    def __init__(self, path: str | pathlib.Path):
+        self._file = open(path, "rb")
+        self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        (magic, version, self.header_lines, self.line_count, source_count, self.host_count,
+         self._lines_offset, sources_offset, self._hosts_offset, self._hashes_offset) = INDEX_HEADER.unpack_from(self._map, 0)
+        if magic != INDEX_MAGIC or version != INDEX_VERSION:
+            self.close()
+            raise ValueError(f"{path} is not a version {INDEX_VERSION} provenance index.")
+        self.sources = []
+        pos = sources_offset
+        for _ in range(source_count):
+            length, pos = _read_varint(self._map, pos)
+            self.sources.append(self._map[pos:pos + length].decode("utf-8"))
+            pos += length
+
+    def close(self):
+        if not self._map.closed: self._map.close()
+        self._file.close()
+
+    def __enter__(self) -> "ProvenanceIndex":
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    def _record(self, line_index: int) -> dict:
+        pos = INDEX_OFFSET.unpack_from(self._map, self._lines_offset + line_index * INDEX_OFFSET.size)[0]
+        length, pos = _read_varint(self._map, pos)
+        line = self._map[pos:pos + length].decode("utf-8")
+        pos += length
+        count, pos = _read_varint(self._map, pos)
+        provenance = []
+        for _ in range(count):
+            source_id, pos = _read_varint(self._map, pos)
+            line_number, pos = _read_varint(self._map, pos)
+            length, pos = _read_varint(self._map, pos)
+            original = line
+            if length:
+                original = self._map[pos:pos + length - 1].decode("utf-8")
+                pos += length - 1
+            provenance.append({"source_url": self.sources[source_id], "line_number": line_number, "original": original})
+        return {"output_line": self.header_lines + line_index + 1, "line": line, "provenance": provenance}
+
+    def line(self, output_line: int) -> dict | None:
+        """The record of a 1-based line number of the generated list (None for header lines)."""
+        line_index = output_line - self.header_lines - 1
+        if not 0 <= line_index < self.line_count:
+            return None
+        return self._record(line_index)
+
+    def find_line(self, line: str) -> dict | None:
+        """The record of an exact output line."""
+        target = _line_hash(line.strip())
+        low, high = 0, self.line_count
+        while low < high: # First hash entry >= target
+            mid = (low + high) // 2
+            if INDEX_HASH_ENTRY.unpack_from(self._map, self._hashes_offset + mid * INDEX_HASH_ENTRY.size)[0] < target:
+                low = mid + 1
+            else:
+                high = mid
+        while low < self.line_count:
+            line_hash, line_index = INDEX_HASH_ENTRY.unpack_from(self._map, self._hashes_offset + low * INDEX_HASH_ENTRY.size)
+            if line_hash != target:
+                return None
+            record = self._record(line_index)
+            if record["line"] == line.strip():
+                return record
+            low += 1
+        return None
+
+    def _host_entry(self, position: int) -> tuple[bytes, int]:
+        pos = INDEX_OFFSET.unpack_from(self._map, self._hosts_offset + position * INDEX_OFFSET.size)[0]
+        length, pos = _read_varint(self._map, pos)
+        return self._map[pos:pos + length], pos + length
+
+    def _lower_bound(self, key: bytes) -> int:
+        low, high = 0, self.host_count
+        while low < high:
+            mid = (low + high) // 2
+            if self._host_entry(mid)[0] < key:
+                low = mid + 1
+            else:
+                high = mid
+        return low
+
+    def _postings(self, pos: int) -> list[int]:
+        count, pos = _read_varint(self._map, pos)
+        indexes, current = [], 0
+        for _ in range(count):
+            delta, pos = _read_varint(self._map, pos)
+            current += delta
+            indexes.append(current)
+        return indexes
+
+    def host_lines(self, host: str, include_subdomains: bool = False) -> list[int]:
+        """
+        Indexes of the lines indexed under `host` or one of its parent
+        domains (rules for example.com also apply to www.example.com), and
+        with `include_subdomains` under any of its subdomains as well.
+        """
+        labels = host.lower().rstrip(".").split(".")
+        line_indexes = set()
+        for i in range(len(labels)):
+            key = _host_key(".".join(labels[i:]))
+            position = self._lower_bound(key)
+            if position < self.host_count:
+                found_key, pos = self._host_entry(position)
+                if found_key == key:
+                    line_indexes.update(self._postings(pos))
+        if include_subdomains:
+            prefix = _host_key(host) + b"."
+            position = self._lower_bound(prefix)
+            while position < self.host_count:
+                found_key, pos = self._host_entry(position)
+                if not found_key.startswith(prefix):
+                    break
+                line_indexes.update(self._postings(pos))
+                position += 1
+        return sorted(line_indexes)
+
+    def rules_for_host(self, host: str, include_subdomains: bool = False) -> list[dict]:
+        return [self._record(line_index) for line_index in self.host_lines(host, include_subdomains)]
+
+
+def _print_record(record: dict):
+    print(f"{record['output_line']}: {record['line']}")
+    for entry in record["provenance"]:
+        rephrased = "" if entry["original"] == record["line"] else f"  (originally: {entry['original']})"
+        print(f"    {entry['source_url']}:{entry['line_number']}{rephrased}")
+
+
+if __name__ == "__main__":
+    arg_parser = argparse.ArgumentParser(description="Query the provenance index written next to a generated list.")
+    arg_parser.add_argument("index", help="Index file (e.g. BravePowerList.txt.index)")
+    query = arg_parser.add_subparsers(dest="query", required=True)
+    host_parser = query.add_parser("host", help="Rules that apply to a hostname")
+    host_parser.add_argument("hostname")
+    host_parser.add_argument("--subdomains", action="store_true", help="Also list rules for its subdomains")
+    line_parser = query.add_parser("line", help="Where a line of the generated list came from")
+    line_parser.add_argument("line_number", type=int)
+    rule_parser = query.add_parser("rule", help="Where an exact rule of the generated list came from")
+    rule_parser.add_argument("rule")
+    args = arg_parser.parse_args()
+
+    started = time.perf_counter()
+    with ProvenanceIndex(args.index) as index:
+        if args.query == "host":
+            results = index.rules_for_host(args.hostname, args.subdomains)
+        else:
+            record = index.line(args.line_number) if args.query == "line" else index.find_line(args.rule)
+            results = [record] if record else []
+        for record in results:
+            _print_record(record)
+    print(f"{len(results)} result(s) in {(time.perf_counter() - started) * 1000:.2f} ms", file=sys.stderr)
+    if not results:
+        sys.exit(1)
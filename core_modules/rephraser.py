@@ -11,6 +11,21 @@ from .parser_validator import RuleType, BraveValidityStatus
 
 logger = logging.getLogger(__name__)
 
+# Compiled once at import; profiling.instrument_patterns() counts their evaluations and matches.
+SCRIPTLET_RULE_RE = re.compile(r"^(.*?)##\+js\((.*?)\)$")
+POPUP_OPTION_RE = re.compile(r",?\$popup(?:=[^,]+)?")
+POPUNDER_OPTION_RE = re.compile(r",?\$popunder(?:=[^,]+)?")
+TRAILING_OPTION_SEPARATORS_RE = re.compile(r",[,\s]*$")
+ABP_CONTAINS_RE = re.compile(r":-abp-contains\((['\"])(.*?)\1\)")
+ABP_SNIPPET_CALL_RE = re.compile(r"^([\w-]+)\s*\((.*)\)$")
+ADGUARD_SCRIPTLET_MARKER_RE = re.compile(r"#%#//scriptlet|#@%#//scriptlet")
+ADGUARD_SCRIPTLET_CALL_RE = re.compile(r"^\((?:['\"])([\w.-]+)(?:['\"]),?(.*)\)$")
+APP_OPTION_RE = re.compile(r",?\$app=[^,]+")
+NETWORK_PATTERN_START_RE = re.compile(r"(\|\||\||\/)")
+JSONPRUNE_OPTION_RE = re.compile(r"^(.*?)\$jsonprune=(.*)$")
+SIMPLE_XPATH_RE = re.compile(r":xpath\((//(\w+)(?:\[@id=['\"]([^'\"]+)['\"]\])?(?:\[@class=['\"]([^'\"]+)['\"]\])?)\)")
+HAS_TEXT_RE = re.compile(r"(:has-text\((['\"])(.*?)\2\))")
+
 # --- Mock python-adblock re-validator (as defined previously) ---
 class MockPythonAdblockRevalidator:
     def is_rule_valid_for_brave(self, rule_string: str) -> tuple[bool, str, dict]:
@@ -21,7 +36,7 @@ class MockPythonAdblockRevalidator:
         
         parsed_components = {} # Simulate parsing of rephrased rule
         if "##+js" in rule_string:
-            match = re.match(r"^(.*?)##\+js\((.*?)\)$", rule_string)
+            match = SCRIPTLET_RULE_RE.match(rule_string)
             if match:
                 domain = match.group(1).strip() if match.group(1) else ""
                 scriptlet_call = match.group(2).split(',', 1)
@@ -98,9 +113,9 @@ def rephrase_rules(
 
         # --- Rephrasing Strategies ---
         if "$popup" in original_rule_str or "$popunder" in original_rule_str:
-            temp_rephrased = re.sub(r",?\$popup(?:=[^,]+)?", "", original_rule_str)
-            temp_rephrased = re.sub(r",?\$popunder(?:=[^,]+)?", "", temp_rephrased)
-            temp_rephrased = re.sub(r",[,\s]*$", "", temp_rephrased).rstrip("$")
+            temp_rephrased = POPUP_OPTION_RE.sub("", original_rule_str)
+            temp_rephrased = POPUNDER_OPTION_RE.sub("", temp_rephrased)
+            temp_rephrased = TRAILING_OPTION_SEPARATORS_RE.sub("", temp_rephrased).rstrip("$")
             if not "$" in temp_rephrased and temp_rephrased.startswith("||") and not temp_rephrased.endswith("^"):
                  temp_rephrased += "^"
             if temp_rephrased != original_rule_str:
@@ -118,7 +133,7 @@ def rephrase_rules(
                 rephrase_strategy_applied = "Converted ABP :-abp-has() to :has()."
                 needs_revalidation = True
             elif ":-abp-contains(" in selector:
-                match = re.search(r":-abp-contains\((['\"])(.*?)\1\)", selector)
+                match = ABP_CONTAINS_RE.search(selector)
                 if match:
                     text = json.dumps(match.group(2))
                     base_sel = selector[:match.start()] + selector[match.end():] or 'div'
@@ -142,7 +157,7 @@ def rephrase_rules(
         elif rule_type_enum == RuleType.SCRIPTLET and "#$#" in original_rule_str: # ABP Snippet
             domain_part, snippet_call = original_rule_str.split("#$#", 1)
             domain = domain_part.strip()
-            match = re.match(r"^([\w-]+)\s*\((.*)\)$", snippet_call.strip())
+            match = ABP_SNIPPET_CALL_RE.match(snippet_call.strip())
             if match:
                 name, args_str = match.group(1), match.group(2)
                 if name == "log":
@@ -157,9 +172,9 @@ def rephrase_rules(
 
         elif rule_type_enum == RuleType.SCRIPTLET and current_status_enum == BraveValidityStatus.POTENTIAL_ADGUARD_SPECIFIC and \
              ("#%#//scriptlet" in original_rule_str or "#@%#//scriptlet" in original_rule_str):
-            domain_part, ag_call = re.split(r"#%#//scriptlet|#@%#//scriptlet", original_rule_str, 1)
+            domain_part, ag_call = ADGUARD_SCRIPTLET_MARKER_RE.split(original_rule_str, 1)
             domain = domain_part.strip()
-            match = re.match(r"^\((?:['\"])([\w.-]+)(?:['\"]),?(.*)\)$", ag_call.strip())
+            match = ADGUARD_SCRIPTLET_CALL_RE.match(ag_call.strip())
             if match:
                 ag_name, ag_args = match.group(1), match.group(2).strip()
                 ubo_equiv = active_ag_to_ubo_map.get(ag_name)
@@ -173,14 +188,14 @@ def rephrase_rules(
         
         elif rule_type_enum == RuleType.NETWORK and current_status_enum == BraveValidityStatus.POTENTIAL_ADGUARD_SPECIFIC:
             if "$app=" in original_rule_str:
-                rephrased_rule_str = re.sub(r",?\$app=[^,]+", "", original_rule_str).rstrip(",$")
-                if not rephrased_rule_str or "$" not in rephrased_rule_str and not re.match(r"(\|\||\||\/)", rephrased_rule_str):
+                rephrased_rule_str = APP_OPTION_RE.sub("", original_rule_str).rstrip(",$")
+                if not rephrased_rule_str or "$" not in rephrased_rule_str and not NETWORK_PATTERN_START_RE.match(rephrased_rule_str):
                      new_status_enum = BraveValidityStatus.CANNOT_REPHRASE
                 else:
                     rephrase_strategy_applied = "Removed AdGuard $app."
                     needs_revalidation = True
             elif "$jsonprune=" in original_rule_str:
-                match = re.match(r"^(.*?)\$jsonprune=(.*)$", original_rule_str)
+                match = JSONPRUNE_OPTION_RE.match(original_rule_str)
                 if match and "json-prune.js" in active_brave_scriptlets: # Check by .js name
                     base_pattern, args = match.group(1), match.group(2)
                     domain_for_scriptlet = base_pattern.replace("||","").split("/")[0].replace("^","").split("$")[0]
@@ -193,17 +208,18 @@ def rephrase_rules(
             selector = parsed_components.get("selector", "")
             domain = parsed_components.get("domain", "")
             if ":xpath(" in selector: # Simplified conversion
-                match = re.search(r":xpath\((//(\w+)(?:\[@id=['\"]([^'\"]+)['\"]\])?(?:\[@class=['\"]([^'\"]+)['\"]\])?)\)", selector)
+                match = SIMPLE_XPATH_RE.search(selector)
                 if match:
-                    tag, id_val, class_val = match.group(2), match.group(4), match.group(6)
-                    css = f"{tag}{f'#{id_val}' if id_val else ''}{f'.{class_val.replace(" ", ".")}' if class_val else ''}"
+                    tag, id_val, class_val = match.group(2), match.group(3), match.group(4)
+                    class_css = "." + class_val.replace(" ", ".") if class_val else ""
+                    css = f"{tag}{f'#{id_val}' if id_val else ''}{class_css}"
                     base_sel = selector[:match.start()]
                     rephrased_rule_str = f"{domain}##{base_sel}{css}" if domain else f"##{base_sel}{css}"
                     rephrase_strategy_applied = "Simple :xpath() to CSS."
                     needs_revalidation = True
                 else: new_status_enum = BraveValidityStatus.CANNOT_REPHRASE
             elif ":has-text(" in selector:
-                match = re.search(r"(:has-text\((['\"])(.*?)\2\))", selector)
+                match = HAS_TEXT_RE.search(selector)
                 if match:
                     text = json.dumps(match.group(3))
                     base_sel = selector.replace(match.group(1), "").strip() or 'div'
@@ -0,0 +1,167 @@
+# core_modules/rule_budget.py
+
+import heapq
+import json
+import logging
+import pathlib
+from datetime import datetime
+
+from .sources import normalize_source_entries
+
+logger = logging.getLogger(__name__)
+
+
+def _source_settings(filter_list_urls: list, default_priority: float) -> tuple[dict[str, float], dict[str, int]]:
+    priorities, caps = {}, {}
+    for source in normalize_source_entries(filter_list_urls):
+        priorities[source["url"]] = source.get("priority", default_priority)
+        if source.get("max_rules") is not None:
+            caps[source["url"]] = source["max_rules"]
+    return priorities, caps
+
+
+def _rule_priorities(rules: list[dict], priorities: dict[str, float], default_priority: float) -> dict[int, float]:
+    """
+    Priority of each rule (by index): the highest priority among the sources
+    that contributed it. A covering rule is raised to the priority of the
+    rules it covers, since trimming it would bring them back.
+    """
+    rule_priority = {
+        index: max(priorities.get(source_url, default_priority) for source_url, _ in rule_data["origins"])
+        for index, rule_data in enumerate(rules)
+    }
+    index_by_string = {rule_data["string"]: index for index, rule_data in enumerate(rules)}
+    for index, rule_data in enumerate(rules):
+        for coverer in rule_data.get("covered_by") or ():
+            coverer_index = index_by_string.get(coverer)
+            if coverer_index is not None and rule_priority[coverer_index] < rule_priority[index]:
+                rule_priority[coverer_index] = rule_priority[index]
+    return rule_priority
+
+
+def _least_valuable(indexes: list[int], excess: int, value_key) -> list[int]:
+    """The `excess` least valuable of `indexes`, selecting whichever side of the cut is smaller."""
+    keep = len(indexes) - excess
+    if excess <= keep:
+        return heapq.nsmallest(excess, indexes, key=value_key)
+    kept = set(heapq.nlargest(keep, indexes, key=value_key))
+    return [index for index in indexes if index not in kept]
+
+
+def apply_rule_budget(unified_rules: dict, filter_list_urls: list, budget_config: dict | None = None) -> dict:
+    """
+    Trims a collect_unified_rules result to the per-source caps (`max_rules`
+    on a filter_list_urls entry) and the global per-type budget
+    (`max_rules_by_type`, RuleType name -> maximum), removing the trimmed
+    rules from unified_rules["rules"].
+
+    Least valuable goes first: lowest priority, then fewest contributing
+    sources, then highest cost (when rule_cost has scored the rules). Only
+    rules that reach the output count against a budget; a rule made
+    redundant by a covering rule is trimmed together with its last coverer.
+    The k rules to drop out of n are picked with heapq.nsmallest, or the
+    n - k to keep with heapq.nlargest when fewer, so a budget costs
+    O(n log min(k, n - k)) rather than a full sort. Sources not listed in
+    filter_list_urls (such as !#include targets) get `default_priority`.
+    Exception rules (@@, #@#) are never trimmed and do not count against
+    any budget: trimming an allow rule would only make blocking broader.
+
+    Returns the budget report: a summary and the trimmed rules with reasons.
+    """
+    if budget_config is None: budget_config = {}
+    default_priority = budget_config.get("default_priority", 0)
+    max_rules_by_type = {name: limit for name, limit in (budget_config.get("max_rules_by_type") or {}).items() if limit is not None}
+    max_listed = budget_config.get("report_max_listed", 1000)
+    priorities, caps = _source_settings(filter_list_urls, default_priority)
+
+    rules = unified_rules["rules"]
+    rule_priority = _rule_priorities(rules, priorities, default_priority)
+    source_count = {index: len({origin[0] for origin in rule_data["origins"]}) for index, rule_data in enumerate(rules)}
+
+    def value_key(index: int) -> tuple:
+        # Ascending: the least valuable rule sorts first
+        return (rule_priority[index], source_count[index], -rules[index].get("cost", 0.0), rules[index]["string"])
+
+    # Rules that reach the output; a covered rule follows its coverers. Exceptions are exempt.
+    counted = [index for index, rule_data in enumerate(rules) if not rule_data.get("covered_by") and not rule_data["is_exception"]]
+    exempt_exceptions = sum(1 for rule_data in rules if rule_data["is_exception"])
+    trimmed_reasons: dict[int, str] = {}
+
+    # Per-source caps: a rule is trimmed once every source that contributed it has cut it
+    if caps:
+        cut_by: dict[int, set] = {}
+        by_source: dict[str, list[int]] = {}
+        for index in counted:
+            for source_url in {origin[0] for origin in rules[index]["origins"]}:
+                if source_url in caps:
+                    by_source.setdefault(source_url, []).append(index)
+        for source_url, indexes in by_source.items():
+            excess = len(indexes) - caps[source_url]
+            if excess <= 0: continue
+            for index in _least_valuable(indexes, excess, value_key):
+                cut_by.setdefault(index, set()).add(source_url)
+            logger.info(f"RuleBudget: {source_url} contributes {len(indexes)} rules; cut {excess} over max_rules={caps[source_url]}.")
+        for index, cutting_sources in cut_by.items():
+            if cutting_sources == {origin[0] for origin in rules[index]["origins"]}:
+                trimmed_reasons[index] = f"source cap: {', '.join(sorted(cutting_sources))}"
+
+    # Global per-type budget over what the caps left
+    for type_name, limit in max_rules_by_type.items():
+        candidates = [index for index in counted if index not in trimmed_reasons and rules[index]["type"].name == type_name]
+        excess = len(candidates) - limit
+        if excess <= 0: continue
+        for index in _least_valuable(candidates, excess, value_key):
+            trimmed_reasons[index] = f"global budget: {type_name} max {limit}"
+        logger.info(f"RuleBudget: {len(candidates)} {type_name} rules over a budget of {limit}; trimmed {excess}.")
+
+    if trimmed_reasons:
+        trimmed_strings = {rules[index]["string"] for index in trimmed_reasons}
+        for index, rule_data in enumerate(rules):
+            covered_by = rule_data.get("covered_by")
+            if covered_by and index not in trimmed_reasons and all(c in trimmed_strings for c in covered_by):
+                trimmed_reasons[index] = "covering rule trimmed"
+        unified_rules["rules"] = [rule_data for index, rule_data in enumerate(rules) if index not in trimmed_reasons]
+        # Kept for verify, which checks the output against the rules before trimming
+        unified_rules.setdefault("removed_rules", []).extend(rules[index] for index in trimmed_reasons)
+
+    by_reason: dict[str, int] = {}
+    by_source_trimmed: dict[str, int] = {}
+    for index, reason in trimmed_reasons.items():
+        by_reason[reason] = by_reason.get(reason, 0) + 1
+        for source_url in {origin[0] for origin in rules[index]["origins"]}:
+            by_source_trimmed[source_url] = by_source_trimmed.get(source_url, 0) + 1
+    listed = heapq.nsmallest(max_listed, trimmed_reasons, key=value_key) if max_listed else []
+    logger.info(f"RuleBudget: Trimmed {len(trimmed_reasons)} of {len(rules)} rules; "
+                f"{exempt_exceptions} exception rules are exempt from the budget.")
+    return {
+        "generated": datetime.now().isoformat(timespec="seconds"),
+        "max_rules_by_type": max_rules_by_type,
+        "source_caps": caps,
+        "summary": {
+            "rules_before": len(rules),
+            "rules_after": len(rules) - len(trimmed_reasons),
+            "trimmed": len(trimmed_reasons),
+            "exceptions_exempt": exempt_exceptions,
+            "by_reason": dict(sorted(by_reason.items(), key=lambda item: item[1], reverse=True)),
+            "by_source": dict(sorted(by_source_trimmed.items(), key=lambda item: item[1], reverse=True)),
+        },
+        "trimmed": [
+            {"rule": rules[index]["string"], "type": rules[index]["type"].name, "reason": trimmed_reasons[index],
+             "priority": rule_priority[index], "sources": sorted({origin[0] for origin in rules[index]["origins"]}),
+             "cost": rules[index].get("cost")}
+            for index in listed
+        ],
+    }
+
+
+def write_budget_report(report: dict, report_path: str) -> bool:
+    path = pathlib.Path(report_path)
+    try:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+        logger.info(f"RuleBudget: Wrote budget report to {path.resolve()}.")
+        return True
+    except OSError as e:
+        logger.error(f"RuleBudget: Failed to write budget report to {path.resolve()}: {e}")
+        return False
@@ -0,0 +1,586 @@
+# core_modules/rule_cost.py
+
+import json
+import logging
+import multiprocessing
+import pathlib
+import re
+import string
+import time
+from datetime import datetime
+from functools import lru_cache
+
+try:
+    import re._parser as sre_parse # Python 3.11+
+    import re._constants as sre_constants
+except ImportError:
+    import sre_parse
+    import sre_constants
+
+from .parser_validator import RuleType, split_network_options
+
+logger = logging.getLogger(__name__)
+
+# Relative cost of one rule for the browser's matcher. Network rules with a
+# literal token are hash-indexed and nearly free; regex rules and rules
+# without a usable token are tried against every request; generic cosmetic
+# rules apply on every page, and procedural selectors re-run on DOM mutations.
+DEFAULT_COST_WEIGHTS = {
+    "hosts": 0.5,
+    "network": 1.0,
+    "network_no_token": 8.0,        # no literal run of >= 3 characters to index on
+    "network_generic_pattern": 4.0, # no hostname anchor (||, |http) and no $domain=
+    "network_regex": 20.0,
+    "network_expensive_option": 2.0,
+    "cosmetic_specific": 1.0,
+    "cosmetic_generic": 5.0,
+    "cosmetic_attribute_substring": 3.0, # [attr*=], [attr^=], [attr$=], [attr~=]
+    "cosmetic_procedural": 15.0,         # :has-text(), :xpath(), :upward(), :matches-css() ...
+    "cosmetic_has": 15.0,
+    "cosmetic_generic_multiplier": 4.0,  # generic procedural/:has() rules run on every page
+    "scriptlet_specific": 3.0,
+    "scriptlet_generic": 12.0,
+    "regex_backreference": 50.0,
+    "regex_polynomial": 150.0,
+    "regex_exponential": 500.0,
+    "regex_probe_timeout": 1000.0,
+    "regex_uncompilable": 30.0,
+    "regex_probe_passed_factor": 0.2, # static risk weight kept when the probe finished in time
+}
+
+REGEX_NETWORK_RULE_RE = re.compile(r"^(?:@@)?/(.+)/(?:\$([^/]*))?$")
+LITERAL_TOKEN_RE = re.compile(r"[A-Za-z0-9%]{3,}")
+ATTRIBUTE_SUBSTRING_RE = re.compile(r"\[[^\]]*[*^$~|]=")
+PROCEDURAL_OPERATORS = (":has-text(", ":-abp-contains(", ":contains(", ":xpath(", ":upward(", ":matches-css(",
+                        ":matches-css-before(", ":matches-css-after(", ":matches-attr(", ":matches-path(",
+                        ":min-text-length(", ":watch-attr(", ":-abp-properties(", ":nth-ancestor(", ":remove()")
+EXPENSIVE_NETWORK_OPTIONS = ("removeparam", "csp", "redirect", "redirect-rule", "replace", "header")
+COSMETIC_SEPARATORS = ("#@#", "#?#", "##")
+
+# Characters the static analysis and the probe reason about: enough to tell
+# overlapping character classes apart and to build adversarial inputs.
+_PROBE_ALPHABET = string.ascii_letters + string.digits + " ./-_?=&%:#!\t"
+_UNBOUNDED = sre_constants.MAXREPEAT
+# Probe results by (pattern, flags, payload length, timeout); serve mode re-scores on every rebuild
+_PROBE_RESULTS: dict[tuple, dict] = {}
+_REPEAT_OPS = tuple(op for op in (getattr(sre_constants, name, None) for name in
+                                  ("MAX_REPEAT", "MIN_REPEAT", "POSSESSIVE_REPEAT")) if op is not None)
+
+
+# --- Static regex analysis -------------------------------------------------
+
+def _in_class(char: str, items) -> bool:
+    code = ord(char)
+    negate = False
+    matched = False
+    for op, av in items:
+        if op is sre_constants.NEGATE:
+            negate = True
+        elif op is sre_constants.LITERAL:
+            matched = matched or code == av
+        elif op is sre_constants.RANGE:
+            matched = matched or av[0] <= code <= av[1]
+        elif op is sre_constants.CATEGORY:
+            name = str(av)
+            if "NOT_DIGIT" in name: matched = matched or not char.isdigit()
+            elif "DIGIT" in name: matched = matched or char.isdigit()
+            elif "NOT_WORD" in name: matched = matched or not (char.isalnum() or char == "_")
+            elif "WORD" in name: matched = matched or char.isalnum() or char == "_"
+            elif "NOT_SPACE" in name: matched = matched or not char.isspace()
+            elif "SPACE" in name: matched = matched or char.isspace()
+    return matched != negate
+
+
+def _first_chars(items) -> set[str]:
+    """Characters of the probe alphabet that can start a match of `items` (an over-approximation)."""
+    first: set[str] = set()
+    for op, av in items:
+        if op is sre_constants.AT:
+            continue # Anchors consume nothing
+        if op is sre_constants.LITERAL:
+            first.add(chr(av))
+        elif op is sre_constants.NOT_LITERAL:
+            first.update(c for c in _PROBE_ALPHABET if ord(c) != av)
+        elif op is sre_constants.ANY:
+            first.update(_PROBE_ALPHABET)
+        elif op is sre_constants.IN:
+            first.update(c for c in _PROBE_ALPHABET if _in_class(c, av))
+        elif op is sre_constants.SUBPATTERN:
+            first.update(_first_chars(av[-1]))
+        elif op is sre_constants.BRANCH:
+            for branch in av[1]:
+                first.update(_first_chars(branch))
+        elif op in _REPEAT_OPS:
+            first.update(_first_chars(av[2]))
+            if av[0] == 0:
+                continue # Optional: what follows can start the match too
+        elif op in (sre_constants.ASSERT, sre_constants.ASSERT_NOT):
+            continue
+        else:
+            first.update(_PROBE_ALPHABET) # Group references and the like: assume anything
+        return first
+    return first
+
+
+def _contains_unbounded_repeat(items) -> bool:
+    for op, av in items:
+        if op in _REPEAT_OPS:
+            if av[1] == _UNBOUNDED or _contains_unbounded_repeat(av[2]):
+                return True
+        elif op is sre_constants.SUBPATTERN:
+            if _contains_unbounded_repeat(av[-1]):
+                return True
+        elif op is sre_constants.BRANCH:
+            if any(_contains_unbounded_repeat(branch) for branch in av[1]):
+                return True
+    return False
+
+
+def _flatten_sequence(items) -> list:
+    """The items of a sequence with groups unwrapped (repeats and branches are kept whole)."""
+    flat = []
+    for op, av in items:
+        if op is sre_constants.SUBPATTERN:
+            flat.extend(_flatten_sequence(av[-1]))
+        else:
+            flat.append((op, av))
+    return flat
+
+
+def _has_ambiguous_branch(body, body_first: set[str]) -> bool:
+    # sre factors common prefixes out of alternations, so (a|aa)* arrives as
+    # (a(?:|a))*: an empty alternative next to one that can restart the body.
+    for op, av in _flatten_sequence(body):
+        if op is not sre_constants.BRANCH:
+            continue
+        branches = av[1]
+        branch_firsts = [_first_chars(branch) for branch in branches]
+        for i, left in enumerate(branch_firsts):
+            if any(left & right for right in branch_firsts[i + 1:]):
+                return True
+        if any(len(branch) == 0 for branch in branches) and any(first & body_first for first in branch_firsts):
+            return True
+    return False
+
+
+def _walk_regex(items, findings: dict, pump_chars: set[str]):
+    previous_repeat_first: set[str] | None = None
+    for op, av in items:
+        if op in _REPEAT_OPS:
+            _, max_count, body = av
+            if max_count == _UNBOUNDED:
+                body_first = _first_chars(body)
+                pump_chars.update(sorted(body_first)[:3])
+                if _contains_unbounded_repeat(body):
+                    findings["nested_quantifier"] = True
+                if _has_ambiguous_branch(body, body_first):
+                    findings["overlapping_alternation"] = True
+                if previous_repeat_first is not None and previous_repeat_first & body_first:
+                    findings["adjacent_overlapping_repeats"] = True
+                previous_repeat_first = body_first
+            elif av[0] > 0:
+                previous_repeat_first = None
+            _walk_regex(body, findings, pump_chars)
+        elif op is sre_constants.SUBPATTERN:
+            _walk_regex(av[-1], findings, pump_chars)
+        elif op is sre_constants.BRANCH:
+            for branch in av[1]:
+                _walk_regex(branch, findings, pump_chars)
+        elif op in (sre_constants.ASSERT, sre_constants.ASSERT_NOT):
+            _walk_regex(av[1], findings, pump_chars)
+        elif op is sre_constants.GROUPREF or op is getattr(sre_constants, "GROUPREF_EXISTS", None):
+            findings["backreference"] = True
+        elif op is sre_constants.AT:
+            continue
+        else:
+            previous_repeat_first = None
+
+
+@lru_cache(maxsize=8192)
+def analyze_regex(pattern: str, flags: int = re.IGNORECASE) -> dict:
+    """
+    Statically analyses a regex for super-linear backtracking:
+    - nested unbounded quantifiers, e.g. (a+)+ or (\\w+\\.)*  -> exponential
+    - an unbounded quantifier over an alternation whose branches can start
+      with the same character, e.g. (a|aa)*                   -> exponential
+    - adjacent unbounded quantifiers over overlapping classes,
+      e.g. \\d+\\d+ or \\w*\\d+                               -> polynomial
+    - backreferences (not supported by non-backtracking engines)
+
+    Returns {"pattern", "compiles", "error", "risk", "findings", "pump_chars"}
+    where risk is "none", "polynomial" or "exponential".
+    """
+    result = {"pattern": pattern, "compiles": True, "error": None, "risk": "none", "findings": [], "pump_chars": []}
+    try:
+        parsed = sre_parse.parse(pattern, flags)
+    except (re.error, OverflowError, RecursionError) as e:
+        result.update({"compiles": False, "error": str(e)})
+        return result
+
+    findings: dict[str, bool] = {}
+    pump_chars: set[str] = set()
+    try:
+        _walk_regex(list(parsed), findings, pump_chars)
+    except RecursionError:
+        findings["nested_quantifier"] = True
+    result["findings"] = sorted(findings)
+    result["pump_chars"] = sorted(pump_chars)[:6] or ["a"]
+    if findings.get("nested_quantifier") or findings.get("overlapping_alternation"):
+        result["risk"] = "exponential"
+    elif findings.get("adjacent_overlapping_repeats"):
+        result["risk"] = "polynomial"
+    return result
+
+
+# --- Time-boxed probe ------------------------------------------------------
+
+def _probe_worker(connection):
+    """Runs in a child process: compiles and searches each pattern sent over the pipe."""
+    while True:
+        item = connection.recv()
+        if item is None:
+            return
+        pattern, flags, payloads = item
+        started = time.perf_counter()
+        try:
+            compiled = re.compile(pattern, flags)
+            for payload in payloads:
+                compiled.search(payload)
+            connection.send(("ok", time.perf_counter() - started, None))
+        except (re.error, OverflowError, RecursionError) as e:
+            connection.send(("error", time.perf_counter() - started, str(e)))
+
+
+class RegexProbe:
+    """
+    Runs regexes against adversarial inputs in a child process that is
+    killed when a probe exceeds its time box, so a catastrophic pattern
+    can never hang the pipeline. The worker is reused across probes and
+    restarted after a kill. Python's `re` is a backtracking engine, so a
+    timeout here marks patterns that blow up on backtracking matchers.
+
+        with RegexProbe(timeout_seconds=0.5) as probe:
+            probe.probe(r"(a+)+$", re.IGNORECASE, ["a" * 2048 + "!"])
+    """
+
+    def __init__(self, timeout_seconds: float = 0.5):
+        self.timeout_seconds = timeout_seconds
+        self._context = multiprocessing.get_context("spawn") # Safe alongside threads (serve mode)
+        self._process = None
+        self._connection = None
+        self._warm = False
+
+    def _ensure_worker(self):
+        if self._process is not None and self._process.is_alive():
+            return
+        parent_connection, child_connection = self._context.Pipe()
+        self._process = self._context.Process(target=_probe_worker, args=(child_connection,), daemon=True,
+                                              name="regex-probe")
+        self._process.start()
+        child_connection.close()
+        self._connection = parent_connection
+
+    def _kill_worker(self):
+        if self._process is not None and self._process.pid is not None:
+            self._process.kill()
+            self._process.join()
+        if self._connection is not None:
+            self._connection.close()
+        self._process = None
+        self._connection = None
+        self._warm = False
+
+    def probe(self, pattern: str, flags: int, payloads: list[str]) -> dict:
+        """Returns {"status": "ok" | "timeout" | "error", "seconds", "error"}."""
+        self._ensure_worker()
+        self._connection.send((pattern, flags, payloads))
+        # The first probe also waits for the spawned interpreter to start up
+        if self._connection.poll(self.timeout_seconds + (0.0 if self._warm else 2.0)):
+            try:
+                status, seconds, error = self._connection.recv()
+            except EOFError: # The worker died (e.g. out of memory on a pathological pattern)
+                self._kill_worker()
+                return {"status": "error", "seconds": 0.0, "error": "probe worker exited"}
+            self._warm = True
+            return {"status": status, "seconds": round(seconds, 4), "error": error}
+        self._kill_worker()
+        return {"status": "timeout", "seconds": self.timeout_seconds, "error": None}
+
+    def close(self):
+        if self._connection is not None and self._process is not None and self._process.is_alive():
+            try:
+                self._connection.send(None)
+                self._process.join(timeout=1.0)
+            except (OSError, BrokenPipeError):
+                pass
+        self._kill_worker()
+
+    def __enter__(self) -> "RegexProbe":
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+
+def build_probe_payloads(analysis: dict, payload_length: int = 2048) -> list[str]:
+    """Adversarial inputs: long runs of the characters the quantifiers consume, ending in a mismatch."""
+    payloads = []
+    for char in analysis["pump_chars"]:
+        run = char * payload_length
+        payloads.append(run + "\x00!")
+        payloads.append("https://example.com/" + run + "\x00")
+    return payloads
+
+
+# --- Rule scoring ----------------------------------------------------------
+
+def split_regex_network_rule(rule_string: str) -> tuple[str, int] | None:
+    """Returns (pattern, re flags) for a /regex/ network rule, or None for other rules."""
+    match = REGEX_NETWORK_RULE_RE.match(rule_string)
+    if not match:
+        return None
+    options = split_network_options(match.group(2) or "")
+    flags = 0 if "match-case" in options else re.IGNORECASE
+    return match.group(1), flags
+
+
+def _network_options(rule_string: str) -> list[str]:
+    pattern = rule_string[2:] if rule_string.startswith("@@") else rule_string
+    if "$" not in pattern:
+        return []
+    return [option.strip().lstrip("~").split("=")[0] for option in split_network_options(pattern.rsplit("$", 1)[1])]
+
+
+def score_rule(rule_string: str, rule_type: RuleType, weights: dict, regex_verdicts: dict | None = None) -> tuple[float, list[str]]:
+    """
+    Returns (cost, factors) for one active rule. `regex_verdicts` maps a
+    regex rule to its static analysis and probe result (see
+    score_unified_rules); regex rules without a verdict are scored on
+    their kind only.
+    """
+    factors = []
+    if rule_type == RuleType.HOSTS_RULE:
+        return weights["hosts"], ["hosts"]
+
+    if rule_type == RuleType.NETWORK:
+        regex_rule = split_regex_network_rule(rule_string)
+        options = _network_options(rule_string)
+        if regex_rule is not None:
+            cost = weights["network_regex"]
+            factors.append("regex")
+            verdict = (regex_verdicts or {}).get(rule_string)
+            if verdict:
+                analysis, probe = verdict["analysis"], verdict.get("probe")
+                # The static analysis over-approximates (e.g. ([a-z]+-)+ is not
+                # ambiguous); a probe that finished in time discounts it.
+                risk_factor = weights["regex_probe_passed_factor"] if probe and probe["status"] == "ok" else 1.0
+                if not analysis["compiles"]:
+                    cost += weights["regex_uncompilable"]
+                    factors.append("regex_uncompilable")
+                if analysis["risk"] == "exponential":
+                    cost += weights["regex_exponential"] * risk_factor
+                    factors.append("regex_exponential:" + "+".join(analysis["findings"]))
+                elif analysis["risk"] == "polynomial":
+                    cost += weights["regex_polynomial"] * risk_factor
+                    factors.append("regex_polynomial")
+                if "backreference" in analysis["findings"]:
+                    cost += weights["regex_backreference"]
+                    factors.append("regex_backreference")
+                if probe and probe["status"] == "timeout":
+                    cost += weights["regex_probe_timeout"]
+                    factors.append("regex_probe_timeout")
+        else:
+            cost = weights["network"]
+            pattern = rule_string[2:] if rule_string.startswith("@@") else rule_string
+            pattern = pattern.split("$", 1)[0]
+            if not LITERAL_TOKEN_RE.search(pattern.replace("*", " ").replace("^", " ")):
+                cost += weights["network_no_token"]
+                factors.append("no_token")
+            if not (pattern.startswith("||") or pattern.startswith("|http")) and "domain" not in options:
+                cost += weights["network_generic_pattern"]
+                factors.append("generic_pattern")
+        expensive = [option for option in options if option in EXPENSIVE_NETWORK_OPTIONS]
+        if expensive:
+            cost += weights["network_expensive_option"] * len(expensive)
+            factors.append("options:" + ",".join(expensive))
+        return cost, factors
+
+    if rule_type == RuleType.SCRIPTLET:
+        domains = rule_string.split("#", 1)[0].strip()
+        if domains:
+            return weights["scriptlet_specific"], ["scriptlet"]
+        return weights["scriptlet_generic"], ["scriptlet", "generic"]
+
+    if rule_type == RuleType.COSMETIC:
+        domains, selector = "", rule_string
+        for separator in COSMETIC_SEPARATORS:
+            if separator in rule_string:
+                domains, selector = rule_string.split(separator, 1)
+                break
+        generic = not domains.strip() or all(d.strip().startswith("~") for d in domains.split(","))
+        cost = weights["cosmetic_generic"] if generic else weights["cosmetic_specific"]
+        factors.append("generic" if generic else "specific")
+        selector_lower = selector.lower()
+        heavy = 0.0
+        if ":has(" in selector_lower:
+            heavy += weights["cosmetic_has"]
+            factors.append(":has()")
+        procedural = [op for op in PROCEDURAL_OPERATORS if op in selector_lower]
+        if procedural:
+            heavy += weights["cosmetic_procedural"] * len(procedural)
+            factors.append("procedural:" + ",".join(op.strip(":(") for op in procedural))
+        if ATTRIBUTE_SUBSTRING_RE.search(selector):
+            cost += weights["cosmetic_attribute_substring"]
+            factors.append("attribute_substring")
+        if heavy and generic:
+            heavy *= weights["cosmetic_generic_multiplier"]
+        return cost + heavy, factors
+
+    return weights["network"], ["unknown"]
+
+
+def _regex_verdicts(rules: list[dict], rule_cost_config: dict) -> dict:
+    verdicts = {}
+    regex_rules = []
+    for rule_data in rules:
+        if rule_data["type"] != RuleType.NETWORK:
+            continue
+        regex_rule = split_regex_network_rule(rule_data["string"])
+        if regex_rule is not None:
+            regex_rules.append((rule_data["string"], *regex_rule))
+    if not regex_rules:
+        return verdicts
+
+    probe_enabled = rule_cost_config.get("probe_regexes", True)
+    payload_length = rule_cost_config.get("probe_payload_length", 2048)
+    timeout_seconds = rule_cost_config.get("probe_timeout_seconds", 0.5)
+    probe = None
+    try:
+        for rule_string, pattern, flags in regex_rules:
+            analysis = analyze_regex(pattern, flags)
+            verdict = {"analysis": analysis, "probe": None}
+            if probe_enabled and analysis["compiles"]:
+                cache_key = (pattern, flags, payload_length, timeout_seconds)
+                if cache_key not in _PROBE_RESULTS:
+                    if probe is None:
+                        probe = RegexProbe(timeout_seconds) # Started lazily: nothing to probe, no child process
+                    _PROBE_RESULTS[cache_key] = probe.probe(pattern, flags, build_probe_payloads(analysis, payload_length))
+                verdict["probe"] = _PROBE_RESULTS[cache_key]
+                if verdict["probe"]["status"] == "timeout":
+                    logger.warning(f"RuleCost: Regex rule timed out under probe ({analysis['risk']} risk): {rule_string[:120]}")
+            verdicts[rule_string] = verdict
+    finally:
+        if probe is not None:
+            probe.close()
+    logger.info(f"RuleCost: Analysed {len(regex_rules)} regex rule(s)"
+                f"{' with time-boxed probes' if probe_enabled else ''}.")
+    return verdicts
+
+
+def score_unified_rules(unified_rules: dict, rule_cost_config: dict | None = None) -> dict:
+    """
+    Scores every active rule of a collect_unified_rules result, annotating
+    each record with "cost" and "cost_factors". Rules above
+    `max_rule_cost` (if set) are removed from unified_rules["rules"], except
+    exception rules (dropping an allow rule turns it into a block) and rules
+    that a kept rule lists in its `covered_by`. Those are scored, kept and
+    reported under "over_budget_kept".
+
+    Returns the cost report: a summary, the dropped rules, and per source
+    the total cost and the `report_top_n` most expensive rules.
+    """
+    if rule_cost_config is None: rule_cost_config = {}
+    weights = {**DEFAULT_COST_WEIGHTS, **rule_cost_config.get("weights", {})}
+    max_rule_cost = rule_cost_config.get("max_rule_cost")
+    top_n = rule_cost_config.get("report_top_n", 25)
+
+    rules = unified_rules["rules"]
+    verdicts = _regex_verdicts(rules, rule_cost_config)
+
+    entries = {}
+    over_budget = {}
+    over_budget_kept = []
+    for rule_data in rules:
+        cost, factors = score_rule(rule_data["string"], rule_data["type"], weights, verdicts)
+        rule_data["cost"] = round(cost, 2)
+        rule_data["cost_factors"] = factors
+        entries[id(rule_data)] = {"rule": rule_data["string"], "type": rule_data["type"].name, "cost": rule_data["cost"], "factors": factors}
+        if max_rule_cost is not None and cost > max_rule_cost:
+            if rule_data["is_exception"]:
+                over_budget_kept.append(entries[id(rule_data)])
+            else:
+                over_budget[rule_data["string"]] = rule_data
+
+    # A kept rule's coverers stay, and so do the coverers of a coverer kept that way
+    exempt = set()
+    pending = [rule_data for rule_data in rules if rule_data["string"] not in over_budget]
+    while pending:
+        rule_data = pending.pop()
+        for covering_rule in rule_data.get("covered_by") or ():
+            if covering_rule in over_budget and covering_rule not in exempt:
+                exempt.add(covering_rule)
+                pending.append(over_budget[covering_rule])
+    over_budget_kept.extend(entries[id(over_budget[rule_string])] for rule_string in exempt)
+
+    kept, dropped = [], []
+    per_source: dict[str, dict] = {}
+    cost_by_type: dict[str, float] = {}
+    for rule_data in rules:
+        entry = entries[id(rule_data)]
+        if rule_data["string"] in over_budget and rule_data["string"] not in exempt:
+            dropped.append(entry)
+            continue
+        kept.append(rule_data)
+        cost_by_type[rule_data["type"].name] = cost_by_type.get(rule_data["type"].name, 0.0) + entry["cost"]
+        for source_url in {origin[0] for origin in rule_data["origins"]}:
+            source_report = per_source.setdefault(source_url, {"rules": 0, "total_cost": 0.0, "entries": []})
+            source_report["rules"] += 1
+            source_report["total_cost"] += entry["cost"]
+            source_report["entries"].append(entry)
+
+    if dropped:
+        unified_rules["rules"] = kept
+        # Kept for verify, which checks the output against the rules before this drop
+        unified_rules.setdefault("removed_rules", []).extend(
+            rule_data for rule_data in rules if rule_data["string"] in over_budget and rule_data["string"] not in exempt)
+        logger.info(f"RuleCost: Dropped {len(dropped)} rule(s) above max_rule_cost={max_rule_cost}.")
+    if over_budget_kept:
+        logger.info(f"RuleCost: Kept {len(over_budget_kept)} exception or covering rule(s) above max_rule_cost={max_rule_cost}.")
+
+    for source_report in per_source.values():
+        entries = source_report.pop("entries")
+        entries.sort(key=lambda e: e["cost"], reverse=True)
+        source_report["top"] = entries[:top_n]
+        source_report["total_cost"] = round(source_report["total_cost"], 1)
+
+    regex_verdicts = list(verdicts.values())
+    return {
+        "generated": datetime.now().isoformat(timespec="seconds"),
+        "max_rule_cost": max_rule_cost,
+        "summary": {
+            "rules_scored": len(rules),
+            "rules_kept": len(kept),
+            "regex_rules": len(regex_verdicts),
+            "regex_exponential": sum(1 for v in regex_verdicts if v["analysis"]["risk"] == "exponential"),
+            "regex_polynomial": sum(1 for v in regex_verdicts if v["analysis"]["risk"] == "polynomial"),
+            "regex_probe_timeouts": sum(1 for v in regex_verdicts if v["probe"] and v["probe"]["status"] == "timeout"),
+            "total_cost": round(sum(cost_by_type.values()), 1),
+            "cost_by_type": {name: round(total, 1) for name, total in sorted(cost_by_type.items())},
+        },
+        "dropped": sorted(dropped, key=lambda e: e["cost"], reverse=True),
+        "over_budget_kept": sorted(over_budget_kept, key=lambda e: e["cost"], reverse=True),
+        "per_source": dict(sorted(per_source.items(), key=lambda item: item[1]["total_cost"], reverse=True)),
+    }
+
+
+def write_cost_report(report: dict, report_path: str) -> bool:
+    path = pathlib.Path(report_path)
+    try:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+        logger.info(f"RuleCost: Wrote cost report to {path.resolve()}.")
+        return True
+    except OSError as e:
+        logger.error(f"RuleCost: Failed to write cost report to {path.resolve()}: {e}")
+        return False
@@ -0,0 +1,230 @@
+# core_modules/source_scheduler.py
+
+import asyncio
+import logging
+import pathlib
+import threading
+import time
+from collections import deque
+
+from .downloader import SourceFetcher, create_session
+from .generator import variants_include_comments
+from .line_scanner import MappedListSource, is_local_source, local_source_path
+from .parser_validator import parse_and_validate_rules
+from .preprocessor import extract_include_targets
+from .rephraser import rephrase_rules
+from .sources import normalize_source_entries
+from .unifier_optimizer import UnifiedRuleSet
+
+try:
+    import resource # Unix only: peak RSS in the summary
+except ImportError:
+    resource = None
+
+logger = logging.getLogger(__name__)
+
+MIB = 1024 * 1024
+
+
+class MemoryBudget:
+    """
+    Bytes of raw list bodies allowed in memory at once. A fetch reserves an
+    estimate before it starts and settles on the real size once the body is
+    in; the bytes are released when the source has been reduced into the
+    unified rule set. A source larger than the whole budget still runs,
+    alone.
+    """
+
+    def __init__(self, limit_bytes: int):
+        self.limit = limit_bytes
+        self.in_use = 0
+        self.peak = 0
+        self._condition = asyncio.Condition()
+
+    async def acquire(self, size: int):
+        async with self._condition:
+            await self._condition.wait_for(lambda: self.in_use == 0 or self.in_use + size <= self.limit)
+            self.in_use += size
+            self.peak = max(self.peak, self.in_use)
+
+    async def settle(self, reserved: int, actual: int):
+        """Replaces a reservation by the real size; going over the limit only holds back later fetches."""
+        async with self._condition:
+            self.in_use += actual - reserved
+            self.peak = max(self.peak, self.in_use)
+            self._condition.notify_all()
+
+    async def release(self, size: int):
+        async with self._condition:
+            self.in_use -= size
+            self._condition.notify_all()
+
+
+def _document_bytes(content) -> int:
+    # A memory-mapped local list lives in the page cache, not on the heap
+    return 0 if isinstance(content, MappedListSource) else len(content)
+
+
+class SourceScheduler:
+    """
+    Downloads and processes sources one at a time through a bounded
+    pipeline, for configurations with hundreds of sources:
+
+        fetch workers (max_concurrent_downloads)
+            -> parse queue (parse_queue_size sources)
+            -> processing worker: parse, rephrase, UnifiedRuleSet.replace_group
+
+    A fetch worker reserves memory_budget_mb before it starts a download and
+    blocks on the full parse queue once it has one, so fetching stops while
+    processing is behind. Each source (with the lists it includes) is
+    reduced to its deduplicated contributions to the UnifiedRuleSet as soon
+    as it is processed; its body and rule objects are dropped right after,
+    so peak memory is the budget plus one source's rule objects plus the
+    unified set, which grows with the unique rules rather than with the
+    number of sources. A list included by several sources is fetched once
+    per source, like in serve mode.
+
+    A source that fails to download or process is logged and left out;
+    the others are unaffected. Per-source results are in `self.results`.
+    """
+
+    def __init__(self, config: dict, brave_scriptlets_data: dict, unified_set: UnifiedRuleSet | None = None):
+        self.config = config
+        self.brave_scriptlets_data = brave_scriptlets_data
+        self.downloader_config = config.get("downloader_options", {})
+        scheduler_config = config.get("scheduler_options", {})
+        self.max_downloads = max(1, scheduler_config.get("max_concurrent_downloads", 8))
+        self.queue_size = max(1, scheduler_config.get("parse_queue_size", 4))
+        self.estimated_source_bytes = int(scheduler_config.get("estimated_source_mb", 2) * MIB)
+        self.budget = MemoryBudget(int(scheduler_config.get("memory_budget_mb", 256) * MIB))
+        self.resolve_includes = self.downloader_config.get("resolve_includes", True)
+        self.max_include_depth = self.downloader_config.get("max_include_depth", 3)
+        self.unified_set = unified_set or UnifiedRuleSet(config.get("unifier_optimizer_options", {}))
+        self.keep_comments = variants_include_comments(config)
+        self.results: dict[str, dict] = {}
+        self._unify_lock = threading.Lock()
+
+    async def _fetch_document(self, fetcher: SourceFetcher, source: dict):
+        if is_local_source(source["url"]):
+            path = local_source_path(source["url"])
+            try:
+                with open(path, "rb"):
+                    pass
+            except OSError as e:
+                logger.error(f"Scheduler: Cannot open local filter list {path}: {e}")
+                return None
+            return MappedListSource(path)
+        return await fetcher.fetch(source)
+
+    async def _fetch_group(self, fetcher: SourceFetcher, source: dict) -> dict:
+        """Fetches a source and, level by level, the lists it includes."""
+        documents: dict = {}
+        seen = {source["url"]}
+        level = [source]
+        depth = 0
+        while level:
+            bodies = await asyncio.gather(*(self._fetch_document(fetcher, entry) for entry in level))
+            next_level = []
+            for entry, body in zip(level, bodies):
+                if body is None:
+                    continue
+                documents[entry["url"]] = body
+                if not self.resolve_includes or depth >= self.max_include_depth:
+                    continue
+                for target in extract_include_targets(entry["url"], body):
+                    if target in seen:
+                        continue
+                    seen.add(target)
+                    if target.startswith("http://") or target.startswith("https://") or is_local_source(target):
+                        next_level.append({"url": target, "mirrors": []})
+            level = next_level
+            depth += 1
+        return documents
+
+    async def _fetch_worker(self, fetcher: SourceFetcher, pending: deque, queue: asyncio.Queue):
+        while pending:
+            source = pending.popleft()
+            await self.budget.acquire(self.estimated_source_bytes)
+            started = time.perf_counter()
+            try:
+                documents = await self._fetch_group(fetcher, source)
+            except Exception as e:
+                documents = {}
+                logger.error(f"Scheduler: Fetching {source['url']} failed: {e}", exc_info=True)
+            if source["url"] not in documents:
+                await self.budget.release(self.estimated_source_bytes)
+                self.results[source["url"]] = {"status": "download_failed"}
+                continue
+            size = sum(_document_bytes(content) for content in documents.values())
+            await self.budget.settle(self.estimated_source_bytes, size)
+            self.results[source["url"]] = {"status": "queued", "bytes": size, "fetch_seconds": round(time.perf_counter() - started, 3)}
+            await queue.put((source["url"], documents, size)) # Blocks while the parse queue is full
+
+    def _process(self, url: str, documents: dict) -> int:
+        rephrased = rephrase_rules(
+            parse_and_validate_rules(documents, self.config.get("parser_validator_options", {}), top_level_sources=[url],
+                                     keep_comments=self.keep_comments),
+            self.brave_scriptlets_data,
+            self.config.get("rephraser_options", {})
+        )
+        with self._unify_lock:
+            self.unified_set.replace_group(url, rephrased)
+        return len(rephrased)
+
+    async def _process_worker(self, queue: asyncio.Queue):
+        while True:
+            item = await queue.get()
+            if item is None:
+                return
+            url, documents, size = item
+            del item
+            started = time.perf_counter()
+            try:
+                # In a thread, so the fetch workers keep the event loop busy meanwhile
+                rule_count = await asyncio.to_thread(self._process, url, documents)
+                self.results[url].update(status="ok", rule_objects=rule_count, process_seconds=round(time.perf_counter() - started, 3))
+            except Exception as e:
+                logger.error(f"Scheduler: Processing {url} failed: {e}", exc_info=True)
+                self.results[url]["status"] = "process_failed"
+                with self._unify_lock:
+                    self.unified_set.remove_group(url)
+            finally:
+                del documents
+                await self.budget.release(size)
+
+    async def run(self) -> dict:
+        """Processes every configured source; returns the unified rules (collect_unified_rules format)."""
+        sources = normalize_source_entries(self.config.get("filter_list_urls", []))
+        pending = deque()
+        for source in sources:
+            if source["url"].startswith("http://") or source["url"].startswith("https://") or is_local_source(source["url"]):
+                pending.append(source)
+            else:
+                logger.warning(f"Scheduler: Skipping URL that is neither HTTP/S nor an existing local file: {source['url']}")
+                self.results[source["url"]] = {"status": "skipped"}
+        logger.info(f"Scheduler: Processing {len(pending)} source(s) with {self.max_downloads} concurrent download(s), "
+                    f"a parse queue of {self.queue_size} and a {self.budget.limit / MIB:g} MiB body budget.")
+
+        temp_download_path = pathlib.Path(self.downloader_config.get("temp_dir", "./temp_downloads/"))
+        temp_download_path.mkdir(parents=True, exist_ok=True)
+        started = time.perf_counter()
+        queue: asyncio.Queue = asyncio.Queue(maxsize=self.queue_size)
+        async with create_session(self.downloader_config) as session:
+            fetcher = SourceFetcher(session, self.downloader_config, temp_download_path)
+            processor = asyncio.create_task(self._process_worker(queue))
+            try:
+                await asyncio.gather(*(self._fetch_worker(fetcher, pending, queue) for _ in range(min(self.max_downloads, len(pending)))))
+                await queue.put(None)
+                await processor
+            finally:
+                processor.cancel()
+
+        failed = sorted(url for url, result in self.results.items() if result["status"] != "ok")
+        peak_rss = f"; peak RSS {resource.getrusage(resource.RUSAGE_SELF).ru_maxrss // 1024} MiB" if resource else ""
+        logger.info(f"Scheduler: {len(self.results) - len(failed)} of {len(self.results)} source(s) processed in "
+                    f"{time.perf_counter() - started:.1f}s; peak body memory {self.budget.peak / MIB:.1f} MiB{peak_rss}.")
+        if failed:
+            logger.warning(f"Scheduler: Left out {len(failed)} source(s): "
+                           + ", ".join(f"{url} ({self.results[url]['status']})" for url in failed))
+        with self._unify_lock:
+            return self.unified_set.result()
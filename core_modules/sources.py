@@ -0,0 +1,54 @@
+# core_modules/sources.py
+
+import logging
+
+logger = logging.getLogger(__name__)
+
+def normalize_source_entries(filter_list_urls: list) -> list[dict]:
+    """
+    Normalizes the entries of `filter_list_urls` into dictionaries.
+
+    An entry is either a plain string (URL, file:// URL or local path) or a
+    dictionary such as:
+        {
+            "url": "https://easylist.to/easylist/easylist.txt",
+            "mirrors": ["https://mirror.example/easylist.txt"],
+            "priority": 10,
+            "max_rules": 20000
+        }
+    `priority` (a number, higher is kept longer) and `max_rules` (a cap on
+    the rules the source contributes) feed the rule budget, see
+    rule_budget.py. Invalid entries are logged and skipped; duplicate URLs
+    are dropped.
+    """
+    normalized: list[dict] = []
+    seen_urls: set[str] = set()
+    for entry in filter_list_urls or []:
+        if isinstance(entry, str):
+            entry = {"url": entry}
+        if not isinstance(entry, dict) or not isinstance(entry.get("url"), str) or not entry["url"]:
+            logger.warning(f"Skipping invalid filter list entry: {entry}")
+            continue
+        url = entry["url"]
+        if url in seen_urls:
+            continue
+        seen_urls.add(url)
+        mirrors = entry.get("mirrors") or []
+        if not isinstance(mirrors, list):
+            logger.warning(f"Ignoring non-list 'mirrors' for {url}.")
+            mirrors = []
+        source = dict(entry)
+        source["mirrors"] = [m for m in mirrors if isinstance(m, str) and m and m != url]
+        if "priority" in source and (isinstance(source["priority"], bool) or not isinstance(source["priority"], (int, float))):
+            logger.warning(f"Ignoring non-numeric 'priority' for {url}.")
+            del source["priority"]
+        max_rules = source.get("max_rules")
+        if max_rules is not None and (isinstance(max_rules, bool) or not isinstance(max_rules, int) or max_rules < 0):
+            logger.warning(f"Ignoring invalid 'max_rules' for {url} (expected a non-negative integer).")
+            del source["max_rules"]
+        normalized.append(source)
+    return normalized
+
+def source_urls(filter_list_urls: list) -> list[str]:
+    """Returns the primary URL of every valid `filter_list_urls` entry, in order."""
+    return [source["url"] for source in normalize_source_entries(filter_list_urls)]
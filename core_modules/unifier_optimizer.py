@@ -1,137 +1,496 @@
 # core_modules/unifier_optimizer.py
 
+import bisect
 import logging
 import re
-from urllib.parse import urlparse # Not strictly used in current simple domain parsing but good for future
+import time
 # Assuming RuleType and BraveValidityStatus enums are defined in parser_validator
-from .parser_validator import RuleType, BraveValidityStatus
+from .parser_validator import RuleType, BraveValidityStatus, split_network_options
+from .canonical_form import canonical_key
 
 logger = logging.getLogger(__name__)
 
+ACTIVE_STATUSES = (BraveValidityStatus.VALID.name, BraveValidityStatus.REPHRASED_AND_VALID.name)
+# Separators of cosmetic and scriptlet exception rules (network exceptions start with @@)
+EXCEPTION_SEPARATORS = ("#@#", "#@?#", "#@$#", "#@%#")
+METADATA_COMMENT_PREFIXES = ("! title:", "! version:", "! expires:", "! homepage:", "! description:", "[adblock plus")
+# ||domain.tld^ with no options or only simple options
+DOMAIN_BLOCK_RULE_RE = re.compile(r"\|\|([\w.-]+)\^(\$[A-Za-z0-9,-_]+)?$")
+# Options that only narrow where a rule applies. A rule restricted by these is
+# covered by an option-less block of its domain; any other option (important,
+# badfilter, redirect, popup, ...) changes what the rule does.
+NARROWING_OPTIONS = {
+    "script", "image", "stylesheet", "css", "xmlhttprequest", "xhr", "subdocument", "frame", "font", "media",
+    "object", "ping", "websocket", "other", "third-party", "3p", "first-party", "1p", "domain", "from", "match-case",
+}
+
 def get_domain_from_network_rule(rule_string: str) -> str | None:
     rule_clean = rule_string.split("$")[0].strip()
     if rule_clean.startswith("@@"): rule_clean = rule_clean[2:]
-    
+
     match = re.match(r"\|\|([\w.-]+)(?:[\^/].*)?", rule_clean)
     if match: return match.group(1)
-    
+
     match = re.match(r"\|https?://([\w.-]+)(?:[/].*)?", rule_clean)
     if match: return match.group(1)
-    
+
     if "/" not in rule_clean and "." in rule_clean and not rule_clean.startswith("*") and not rule_clean.endswith("*"):
         if re.match(r"^([\w*-]+\.)+[\w-]+$", rule_clean):
             return rule_clean[2:] if rule_clean.startswith("*.") else rule_clean
     return None
 
+def _rule_options(rule_str: str) -> str:
+    return rule_str.split("$", 1)[1] if "$" in rule_str else ""
+
+def _blocked_domain(rule_str: str) -> str | None:
+    """The domain of a full domain block rule (||domain.tld^), else None."""
+    match = DOMAIN_BLOCK_RULE_RE.match(rule_str)
+    if match and "/" not in match.group(1): # Ensure it's a domain, not a path starting with ||
+        return match.group(1)
+    return None
+
+def _parent_domain_names(domain: str) -> list[str]:
+    labels = domain.split(".")
+    return [".".join(labels[i:]) for i in range(1, len(labels))]
+
+def collect_domain_block_rules(network_rules: list[dict]) -> dict[str, dict[str, str]]:
+    """Maps domain -> {options string: rule string} for every full domain block rule (||domain.tld^)."""
+    domain_block_rules: dict[str, dict[str, str]] = {}
+    for rule in network_rules:
+        rule_str = rule["string"]
+        domain = _blocked_domain(rule_str)
+        if domain:
+            domain_block_rules.setdefault(domain, {})[_rule_options(rule_str)] = rule_str
+    return domain_block_rules
+
+def find_covering_rules(rule_str: str, domain_block_rules: dict[str, dict[str, str]]) -> list[str]:
+    """
+    Returns the full domain block rules that make a network rule redundant:
+    a block of the same domain when the rule only adds a path, or a block of
+    any parent domain. A coverer must carry the same options as the rule,
+    or none at all when the rule's options only narrow where it applies
+    (||example.com^$image does not cover ||ads.example.com^). Walks the
+    rule's parent domains instead of scanning every blocked domain.
+    """
+    current_rule_domain = get_domain_from_network_rule(rule_str)
+    if not current_rule_domain:
+        return []
+    rule_options = _rule_options(rule_str)
+    option_names = {option.strip().lstrip("~").split("=")[0].lower() for option in split_network_options(rule_options) if option.strip()}
+    acceptable_options = {rule_options}
+    if option_names <= NARROWING_OPTIONS:
+        acceptable_options.add("")
+
+    def coverers_for(domain: str) -> list[str]:
+        by_options = domain_block_rules.get(domain, {})
+        return [by_options[options] for options in acceptable_options if options in by_options and by_options[options] != rule_str]
+
+    covering = []
+    if "/" in rule_str.split("$")[0]:
+        covering.extend(coverers_for(current_rule_domain))
+    labels = current_rule_domain.split(".")
+    for i in range(1, len(labels)):
+        covering.extend(coverers_for(".".join(labels[i:])))
+    return covering
+
+class UnifiedRuleSet:
+    """
+    The deduplicated multiset of active rules and preserved comments behind
+    collect_unified_rules, kept between builds. Rule objects are added in
+    groups (a source together with the lists it includes); replacing a
+    group removes its previous contributions and adds the new ones, and only
+    the dedup entries it touches are recomputed. A rule object's canonical
+    key is cached on the object ("canonical_key"), so objects carried over
+    from the previous build (see incremental.py) are not canonicalised again.
+
+    The network optimisation state (the full domain block rules, and which
+    rules sit under each domain) and the sorted output are kept up to date
+    per changed entry as well, so result() after a group replacement
+    re-optimises and re-sorts only the rules the change touched.
+
+    Rules are deduplicated on a hash of their canonical form (see
+    canonical_form.py) unless `canonical_deduplication` is false; of several
+    spellings of one rule, the first that is already canonical is kept, else
+    the first seen, in group order.
+    """
+
+    def __init__(self, unifier_config: dict | None = None):
+        self.config = unifier_config or {}
+        self.canonical_dedup = self.config.get("canonical_deduplication", True)
+        self.optimize_network = self.config.get("perform_network_optimization", True)
+        self.sort_output = self.config.get("sort_output", True)
+        self._group_order: dict = {}
+        self._group_keys: dict = {} # group -> (rule keys, comment keys) it contributed to
+        self._rule_entries: dict[str | bytes, dict] = {}
+        self._comment_entries: dict[str, dict] = {}
+        self._dirty_rules: set = set()
+        self._dirty_comments: set = set()
+        self._removed_records: list[dict] = [] # Rule records of deleted entries, not yet taken out of the output
+        self._removed_comments: list[dict] = []
+        self._spelling_total = 0 # Sum of every entry's spelling_count
+        # Output, in sort order when sort_output is set: records and, for bisect, their strings
+        self._rule_strings: list[str] = []
+        self._rule_records: list[dict] = []
+        self._comment_strings: list[str] = []
+        self._comment_records: list[dict] = []
+        # Network optimisation: the full domain block rules (domain -> {options: rule string}),
+        # each non-exception network rule's domain, the rules under every domain (the domain
+        # itself and its subdomains), and the records of the rules with covering rules
+        self._domain_block_rules: dict[str, dict[str, str]] = {}
+        self._network_records: dict[str, dict] = {}
+        self._rule_domains: dict[str, str | None] = {}
+        self._rules_under_domain: dict[str, set[str]] = {}
+        self._redundant: set[str] = set()
+
+    def _dedup_key(self, rule_obj: dict, effective_rule_str: str, rule_type: RuleType) -> tuple[str | bytes, bool, bool]:
+        """(key, is canonical spelling, computed now)"""
+        if not self.canonical_dedup:
+            return effective_rule_str, True, False
+        cached = rule_obj.get("canonical_key")
+        if cached is not None:
+            return cached[0], cached[1], False
+        digest, canonical = canonical_key(effective_rule_str, rule_type)
+        rule_obj["canonical_key"] = (digest, canonical == effective_rule_str)
+        return digest, canonical == effective_rule_str, True
+
+    def _detach_group(self, group) -> tuple:
+        """Takes the contributions of `group` off its entries, leaving emptied entries in place; returns its keys."""
+        rule_keys, comment_keys = self._group_keys.pop(group, ((), ()))
+        for entries, keys, dirty in ((self._rule_entries, rule_keys, self._dirty_rules),
+                                     (self._comment_entries, comment_keys, self._dirty_comments)):
+            for key in keys:
+                del entries[key]["contributions"][group]
+                dirty.add(key)
+        return rule_keys, comment_keys
+
+    def _drop_unused(self, rule_keys, comment_keys):
+        """Deletes the entries among the given keys that no group contributes to any more."""
+        for entries, keys, dirty, removed in ((self._rule_entries, rule_keys, self._dirty_rules, self._removed_records),
+                                              (self._comment_entries, comment_keys, self._dirty_comments, self._removed_comments)):
+            for key in keys:
+                entry = entries[key]
+                if entry["contributions"]:
+                    continue
+                del entries[key]
+                dirty.discard(key)
+                if entry["record"] is not None:
+                    removed.append(entry["record"])
+                    self._spelling_total -= entry.get("spelling_count", 0)
+
+    def remove_group(self, group):
+        self._drop_unused(*self._detach_group(group))
+
+    def replace_group(self, group, processed_rule_objects: list[dict]):
+        """Replaces every contribution of `group` with those of `processed_rule_objects`."""
+        # Entries only this group contributed to are dropped after the new contributions are in,
+        # so a rule the group still has keeps its record, output position and coverage
+        previous_rule_keys, previous_comment_keys = self._detach_group(group)
+        self._group_order.setdefault(group, len(self._group_order))
+        logger.info(f"Unifier: Starting with {len(processed_rule_objects)} processed rule objects.")
+
+        rule_keys, comment_keys = set(), set()
+        active_rule_count = 0
+        comment_count = 0
+        canonicalised_count = 0
+        canonical_seconds = 0.0
+
+        for rule_obj in processed_rule_objects:
+            status_str = rule_obj.get("brave_validity_status")
+            rule_type_str = rule_obj.get("rule_type")
+            original_rule = rule_obj.get("original_rule_string", "")
+            rephrased_rule = rule_obj.get("rephrased_rule_string")
+            effective_rule_str = (rephrased_rule if rephrased_rule is not None else original_rule).strip()
+            origin = (rule_obj.get("source_url"), status_str)
+            provenance = (rule_obj.get("source_url"), rule_obj.get("line_number"), original_rule)
+
+            if not effective_rule_str: continue
+
+            if rule_type_str == RuleType.METADATA_HEADER.name:
+                continue # List-specific metadata and preprocessor directives never reach the output
+            if rule_type_str != RuleType.COMMENT.name and status_str in ACTIVE_STATUSES:
+                active_rule_count += 1
+                rule_type = RuleType[rule_type_str] if rule_type_str in RuleType.__members__ else RuleType.UNKNOWN
+                started = time.perf_counter()
+                dedup_key, is_canonical, computed = self._dedup_key(rule_obj, effective_rule_str, rule_type)
+                if computed:
+                    canonicalised_count += 1
+                    canonical_seconds += time.perf_counter() - started
+                # If multiple identical strings had different types (unlikely from parser), this keeps the first.
+                entry = self._rule_entries.setdefault(dedup_key, {"type": rule_type, "contributions": {}, "record": None})
+                entry["contributions"].setdefault(group, []).append((origin, provenance, effective_rule_str, is_canonical))
+                rule_keys.add(dedup_key)
+            elif rule_type_str == RuleType.COMMENT.name:
+                # PRD: preserve general informational comments, drop list-specific metadata
+                # Parser should flag metadata for discard (e.g. with "action": "discard_from_body")
+                # For now, simple check based on common metadata prefixes
+                if not effective_rule_str.lower().startswith(METADATA_COMMENT_PREFIXES):
+                     if rule_obj.get("type_identification_info", {}).get("action") != "discard_from_body":
+                        comment_count += 1
+                        entry = self._comment_entries.setdefault(effective_rule_str, {"contributions": {}, "record": None})
+                        entry["contributions"].setdefault(group, []).append((origin, provenance))
+                        comment_keys.add(effective_rule_str)
+
+        self._group_keys[group] = (rule_keys, comment_keys)
+        self._drop_unused(set(previous_rule_keys) - rule_keys, set(previous_comment_keys) - comment_keys)
+        self._dirty_rules |= rule_keys
+        self._dirty_comments |= comment_keys
+        logger.info(f"Unifier: Collected {active_rule_count} active rules and {comment_count} general comments.")
+        if canonicalised_count:
+            logger.info(f"Unifier: Canonical forms cost {canonical_seconds / canonicalised_count * 1_000_000:.2f} µs "
+                        f"per rule ({canonical_seconds:.2f}s for {canonicalised_count} rules; "
+                        f"{active_rule_count - canonicalised_count} keys reused).")
+
+    def _ordered_contributions(self, entry: dict) -> list:
+        contributions = entry["contributions"]
+        if len(contributions) == 1:
+            return next(iter(contributions.values()))
+        groups = sorted(contributions, key=self._group_order.__getitem__)
+        return [contribution for group in groups for contribution in contributions[group]]
+
+    def _patch_output(self, strings: list[str], records: list[dict], removed: list[dict], added: list[dict]):
+        """
+        Takes `removed` out of and puts `added` into an output list, in place.
+        A small diff is applied with bisect; a large one (such as the first
+        build) by one filtering pass and a sort.
+        """
+        if not removed and not added:
+            return
+        if len(removed) + len(added) > 64 + len(records) // 16:
+            removed_ids = {id(record) for record in removed}
+            records[:] = [record for record in records if id(record) not in removed_ids] + added
+            if self.sort_output:
+                records.sort(key=lambda r: r["string"]) # Stable, and mostly sorted already
+            strings[:] = [record["string"] for record in records]
+            return
+        for record in removed:
+            if self.sort_output:
+                position = bisect.bisect_left(strings, record["string"])
+                while records[position] is not record: # Equal strings sit next to each other
+                    position += 1
+            else:
+                position = next(i for i, candidate in enumerate(records) if candidate is record)
+            del strings[position], records[position]
+        for record in added:
+            position = bisect.bisect_right(strings, record["string"]) if self.sort_output else len(strings)
+            strings.insert(position, record["string"])
+            records.insert(position, record)
+
+    def _network_remove(self, record: dict, changed_domains: set):
+        rule_str = record["string"]
+        if self._network_records.pop(rule_str, None) is None:
+            return
+        domain = self._rule_domains.pop(rule_str)
+        if domain is not None:
+            for suffix in (domain, *_parent_domain_names(domain)):
+                under = self._rules_under_domain[suffix]
+                under.discard(rule_str)
+                if not under: del self._rules_under_domain[suffix]
+        self._redundant.discard(rule_str)
+        blocked_domain = _blocked_domain(rule_str)
+        if blocked_domain:
+            by_options = self._domain_block_rules[blocked_domain]
+            del by_options[_rule_options(rule_str)]
+            if not by_options: del self._domain_block_rules[blocked_domain]
+            changed_domains.add(blocked_domain)
+
+    def _network_add(self, record: dict, changed_domains: set):
+        rule_str = record["string"]
+        self._network_records[rule_str] = record
+        domain = get_domain_from_network_rule(rule_str)
+        self._rule_domains[rule_str] = domain
+        if domain is not None:
+            for suffix in (domain, *_parent_domain_names(domain)):
+                self._rules_under_domain.setdefault(suffix, set()).add(rule_str)
+        blocked_domain = _blocked_domain(rule_str)
+        if blocked_domain:
+            self._domain_block_rules.setdefault(blocked_domain, {})[_rule_options(rule_str)] = rule_str
+            changed_domains.add(blocked_domain)
+
+    def _refresh_records(self) -> tuple[set[str], set[str]]:
+        """
+        Rebuilds the records of changed entries and patches the output and the
+        network indexes with them. Returns (network rules added or changed,
+        domains whose full domain block rules changed).
+        """
+        changed_rules, changed_domains = set(), set()
+        removed, added = list(self._removed_records), []
+        if self.optimize_network:
+            for record in self._removed_records:
+                self._network_remove(record, changed_domains)
+        for key in self._dirty_rules:
+            entry = self._rule_entries[key]
+            contributions = self._ordered_contributions(entry)
+            preferred = next((c[2] for c in contributions if c[3]), contributions[0][2]) # Prefer the canonical spelling
+            record = entry["record"]
+            if record is not None:
+                self._spelling_total -= entry["spelling_count"]
+            entry["spelling_count"] = len({c[2] for c in contributions})
+            self._spelling_total += entry["spelling_count"]
+            if record is not None and record["string"] == preferred:
+                # Same rule, new contributors or line numbers: its output position and coverage stand
+                record["origins"] = {c[0] for c in contributions}
+                record["provenance"] = [c[1] for c in contributions]
+                continue
+            if record is not None:
+                removed.append(record)
+                if self.optimize_network: self._network_remove(record, changed_domains)
+            entry["record"] = {
+                "string": preferred,
+                "type": entry["type"],
+                "is_exception": preferred.startswith("@@") if entry["type"] == RuleType.NETWORK
+                                else any(separator in preferred for separator in EXCEPTION_SEPARATORS),
+                "origins": {c[0] for c in contributions},
+                "provenance": [c[1] for c in contributions],
+                "covered_by": None,
+            }
+            added.append(entry["record"])
+        # Indexed after every removal, so a rule string that moved between entries is not dropped again
+        if self.optimize_network:
+            for record in added:
+                if record["type"] == RuleType.NETWORK and not record["is_exception"]:
+                    self._network_add(record, changed_domains)
+                    changed_rules.add(record["string"])
+        self._patch_output(self._rule_strings, self._rule_records, removed, added)
+
+        removed, added = self._removed_comments, []
+        for key in self._dirty_comments:
+            entry = self._comment_entries[key]
+            contributions = self._ordered_contributions(entry)
+            if entry["record"] is not None: # The key is the comment itself, so its position stands
+                entry["record"]["origins"] = {c[0] for c in contributions}
+                entry["record"]["provenance"] = [c[1] for c in contributions]
+                continue
+            entry["record"] = {"string": key, "origins": {c[0] for c in contributions}, "provenance": [c[1] for c in contributions]}
+            added.append(entry["record"])
+        self._patch_output(self._comment_strings, self._comment_records, removed, added)
+
+        self._dirty_rules.clear()
+        self._dirty_comments.clear()
+        self._removed_records.clear()
+        self._removed_comments.clear()
+        return changed_rules, changed_domains
+
+    def _optimize_network_rules(self, changed_rules: set[str], changed_domains: set[str]) -> int:
+        """
+        Sets `covered_by` on the network rules whose covering rules may have
+        changed: new or rebuilt rules, and the rules on or under a domain
+        whose full domain block rules changed. Every other rule keeps its
+        previous answer. Returns how many rules are redundant.
+        """
+        affected = set(changed_rules)
+        for domain in changed_domains:
+            affected |= self._rules_under_domain.get(domain, set())
+        for rule_str in affected:
+            covering = find_covering_rules(rule_str, self._domain_block_rules)
+            self._network_records[rule_str]["covered_by"] = covering or None
+            if covering:
+                self._redundant.add(rule_str)
+                logger.debug(f"Optimizer: Rule '{rule_str}' redundant by '{covering[0]}'.")
+            else:
+                self._redundant.discard(rule_str)
+        if affected:
+            logger.debug(f"Unifier: Re-optimised {len(affected)} network rule(s); "
+                         f"{len(self._domain_block_rules)} full domain block rules.")
+        return len(self._redundant)
+
+    def result(self) -> dict:
+        """The current unified rules, in the collect_unified_rules format."""
+        changed_rules, changed_domains = self._refresh_records()
+        count_after_deduplication = len(self._rule_entries)
+        logger.info(f"Unifier: After deduplication: {count_after_deduplication} unique active rules.")
+        if self.canonical_dedup:
+            merged_spelling_count = self._spelling_total - count_after_deduplication
+            logger.info(f"Unifier: Canonical deduplication removed {merged_spelling_count} alternative spellings of identical rules.")
+
+        if self.optimize_network:
+            redundant_count = self._optimize_network_rules(changed_rules, changed_domains)
+            logger.info(f"Unifier: After network optimization: {count_after_deduplication - redundant_count} active rules.")
+        else:
+            logger.info("Unifier: Network optimization skipped by config.")
+
+        # Copies, so callers may trim or reorder them; the order is kept up to date
+        # per change, and variant selection preserves it
+        return {"rules": list(self._rule_records), "comments": list(self._comment_records), "sorted": self.sort_output}
+
+def collect_unified_rules(
+    processed_rule_objects: list[dict],
+    unifier_config: dict = None
+) -> dict:
+    """
+    Does the shared, variant-independent part of unification once:
+    collects active rules and general comments, deduplicates them (see
+    UnifiedRuleSet) while remembering every (source_url, validity status)
+    that contributed each one, and runs the network optimisation. Redundant
+    rules are not dropped here but annotated with `covered_by` (the rules
+    that make them redundant), so each output variant can decide whether its
+    own selection still contains a covering rule.
+
+    Returns:
+        {"rules": [{"string", "type", "is_exception", "origins", "provenance", "covered_by"}, ...],
+         "comments": [{"string", "origins", "provenance"}, ...],
+         "sorted": bool}
+    where "provenance" lists every contributing (source_url, line_number,
+    original rule string before rephrasing).
+    """
+    unified_set = UnifiedRuleSet(unifier_config)
+    unified_set.replace_group(None, processed_rule_objects)
+    return unified_set.result()
+
+def _origin_selected(origins: set, variant: dict) -> bool:
+    include_sources = variant.get("include_sources")
+    exclude_sources = variant.get("exclude_sources") or ()
+    include_statuses = variant.get("include_statuses")
+    exclude_statuses = variant.get("exclude_statuses") or ()
+    for source_url, status in origins:
+        if include_sources is not None and source_url not in include_sources: continue
+        if source_url in exclude_sources: continue
+        if include_statuses is not None and status not in include_statuses: continue
+        if status in exclude_statuses: continue
+        return True
+    return False
+
+def select_rules(unified: dict, variant: dict | None = None, keep_covered: bool = False) -> list[str]:
+    """
+    Produces the final lines for one output variant from the shared result of
+    collect_unified_rules. Variant filters (all optional):
+        include_rule_types / exclude_rule_types: RuleType names
+        include_sources / exclude_sources: source URLs
+        include_statuses / exclude_statuses: BraveValidityStatus names
+        include_comments: keep preserved comments (default True)
+    A rule is kept if at least one contributing (source, status) passes the
+    filters. A redundant rule is dropped only if one of its covering rules
+    is itself part of the variant, and never with `keep_covered`.
+    """
+    variant = variant or {}
+    include_types = variant.get("include_rule_types")
+    exclude_types = variant.get("exclude_rule_types") or ()
+    filter_origins = any(variant.get(key) for key in ("include_sources", "exclude_sources", "include_statuses", "exclude_statuses"))
+
+    selected = []
+    for rule_data in unified["rules"]:
+        type_name = rule_data["type"].name
+        if include_types is not None and type_name not in include_types: continue
+        if type_name in exclude_types: continue
+        if filter_origins and not _origin_selected(rule_data["origins"], variant): continue
+        selected.append(rule_data)
+
+    selected_strings = {rule_data["string"] for rule_data in selected}
+    final_active_rule_strings = [
+        rule_data["string"] for rule_data in selected
+        if keep_covered or not rule_data["covered_by"] or not any(c in selected_strings for c in rule_data["covered_by"])
+    ]
+
+    comment_strings = []
+    if variant.get("include_comments", True):
+        comment_strings = [c["string"] for c in unified["comments"]
+                           if not filter_origins or _origin_selected(c["origins"], variant)]
+    return comment_strings + final_active_rule_strings
+
 def unify_and_optimize_rules(
     processed_rule_objects: list[dict],
     unifier_config: dict = None
 ) -> list[str]:
-    if unifier_config is None: unifier_config = {}
-    initial_rule_count = len(processed_rule_objects)
-    logger.info(f"Unifier: Starting with {initial_rule_count} processed rule objects.")
-
-    valid_rules_for_unification = []
-    preserved_comments = []
-
-    for rule_obj in processed_rule_objects:
-        status_str = rule_obj.get("brave_validity_status")
-        rule_type_str = rule_obj.get("rule_type")
-        original_rule = rule_obj.get("original_rule_string", "")
-        rephrased_rule = rule_obj.get("rephrased_rule_string")
-        effective_rule_str = (rephrased_rule if rephrased_rule is not None else original_rule).strip()
-
-        if not effective_rule_str: continue
-
-        if status_str in [BraveValidityStatus.VALID.name, BraveValidityStatus.REPHRASED_AND_VALID.name]:
-            valid_rules_for_unification.append({
-                "string": effective_rule_str,
-                "type": RuleType[rule_type_str] if rule_type_str in RuleType.__members__ else RuleType.UNKNOWN,
-                "is_exception": effective_rule_str.startswith("@@")
-            })
-        elif rule_type_str == RuleType.COMMENT.name:
-            # PRD: preserve general informational comments, drop list-specific metadata
-            # Parser should flag metadata for discard (e.g. with "action": "discard_from_body")
-            # For now, simple check based on common metadata prefixes
-            if not any(effective_rule_str.lower().startswith(hdr_prefix) for hdr_prefix in [
-                "! title:", "! version:", "! expires:", "! homepage:", "! description:", "[adblock plus"
-            ]):
-                 if rule_obj.get("type_identification_info", {}).get("action") != "discard_from_body":
-                    preserved_comments.append(effective_rule_str)
-    
-    logger.info(f"Unifier: Collected {len(valid_rules_for_unification)} active rules and {len(preserved_comments)} general comments.")
-
-    # Deduplication of active rules
-    # Store rule string to its data to keep type information for optimization
-    # If multiple identical strings had different types (unlikely from parser), this keeps the first.
-    unique_active_rules_map = {rule_data["string"]: rule_data for rule_data in reversed(valid_rules_for_unification)}
-    unique_rules_with_type = list(unique_active_rules_map.values())
-    
-    count_after_deduplication = len(unique_rules_with_type)
-    logger.info(f"Unifier: After deduplication: {count_after_deduplication} unique active rules.")
-
-    optimized_rules_data = [] # Will store rule data dicts
-    if unifier_config.get("perform_network_optimization", True):
-        network_rules = [r for r in unique_rules_with_type if r["type"] == RuleType.NETWORK and not r["is_exception"]]
-        other_rules = [r for r in unique_rules_with_type if r["type"] != RuleType.NETWORK or r["is_exception"]]
-        
-        domain_block_rules = {} # domain -> full_rule_string for ||domain.tld^
-        for rule in network_rules:
-            rule_str = rule["string"]
-            # A simple check for full domain block: ||domain.tld^ (no options or only simple options)
-            match = re.match(r"\|\|([\w.-]+)\^(\$[A-Za-z0-9,-_]+)?$", rule_str) # Allow simple options
-            if match and "/" not in match.group(1): # Ensure it's a domain, not a path starting with ||
-                domain_block_rules[match.group(1)] = rule_str
-        
-        if domain_block_rules: logger.debug(f"Unifier: Found {len(domain_block_rules)} full domain block rules for optimization.")
-
-        final_network_rules_data = []
-        for rule_data in network_rules:
-            rule_str = rule_data["string"]
-            is_redundant = False
-            current_rule_domain = get_domain_from_network_rule(rule_str)
-
-            if current_rule_domain:
-                for blocked_domain, blocking_rule_str in domain_block_rules.items():
-                    if rule_str == blocking_rule_str: continue # Don't mark self as redundant
-
-                    # If current rule is for the same domain but more specific (has path)
-                    if current_rule_domain == blocked_domain and "/" in rule_str.split("$")[0]:
-                        is_redundant = True
-                        logger.debug(f"Optimizer: Rule '{rule_str}' redundant by '{blocking_rule_str}' (path on domain).")
-                        break
-                    # If current rule is for a subdomain of a blocked domain
-                    if current_rule_domain.endswith("." + blocked_domain):
-                        is_redundant = True
-                        logger.debug(f"Optimizer: Rule '{rule_str}' redundant by '{blocking_rule_str}' (subdomain).")
-                        break
-            if not is_redundant:
-                final_network_rules_data.append(rule_data)
-        
-        optimized_rules_data.extend(final_network_rules_data)
-        optimized_rules_data.extend(other_rules)
-        logger.info(f"Unifier: After network optimization: {len(optimized_rules_data)} active rules.")
-    else:
-        optimized_rules_data.extend(unique_rules_with_type)
-        logger.info("Unifier: Network optimization skipped by config.")
-
-    # Final list of strings
-    final_active_rule_strings = [r["string"] for r in optimized_rules_data]
-    
-    # Deduplicate comments and combine
-    # Using dict.fromkeys preserves order and deduplicates comments
-    unique_preserved_comments = list(dict.fromkeys(preserved_comments))
-    
-    final_list_for_generator = unique_preserved_comments + final_active_rule_strings
-
-    if unifier_config.get("sort_output", True):
-        # Separate comments from rules for sorting, then recombine
-        comments_to_sort = [line for line in final_list_for_generator if line.startswith("!")]
-        rules_to_sort = [line for line in final_list_for_generator if not line.startswith("!")]
-        comments_to_sort.sort()
-        rules_to_sort.sort()
-        final_list_for_generator = comments_to_sort + rules_to_sort
-        logger.info("Unifier: Final list sorted.")
-    
+    """Unifies all rules into a single list (no variant filtering)."""
+    final_list_for_generator = select_rules(collect_unified_rules(processed_rule_objects, unifier_config))
     logger.info(f"Unifier: Finished. Final list contains {len(final_list_for_generator)} lines.")
     return final_list_for_generator
@@ -0,0 +1,420 @@
+# core_modules/webkit_exporter.py
+
+import json
+import logging
+import pathlib
+import re
+import time
+from datetime import datetime
+
+from .parser_validator import RuleType, split_network_options
+from .rule_cost import PROCEDURAL_OPERATORS
+from .unifier_optimizer import select_rules
+
+logger = logging.getLogger(__name__)
+
+# WebKit content blockers (Safari, WKContentRuleList) compile a JSON array of
+# {"trigger": {...}, "action": {...}} rules. A trigger's url-filter is a
+# restricted regex: '.', '*', '+', '?', character classes, groups and the
+# anchors '^'/'$' only -- no alternation, counted repetition or shorthand
+# classes -- and it must be ASCII.
+HOST_ANCHOR_REGEX = "^[^:]+://+([^:/]+\\.)?"
+SEPARATOR_REGEX = "[^a-z0-9_.%-]"
+URL_FILTER_SPECIAL_CHARS = set(".+?()[]{}\\$^|")
+UNSUPPORTED_REGEX_RE = re.compile(r"\||\{|\(\?|\\[dDwWsSbB1-9]")
+REGEX_RULE_RE = re.compile(r"^/(.+)/$")
+HOSTS_LINE_RE = re.compile(r"^\s*\d{1,3}\.\d{1,3}\.\d{1,3}\.\d{1,3}\s+(.+)$")
+HOSTS_IGNORED_NAMES = {"localhost", "localhost.localdomain", "local", "broadcasthost", "0.0.0.0"}
+
+NETWORK_OPTION_ALIASES = {"3p": "third-party", "1p": "~third-party", "first-party": "~third-party",
+                          "css": "stylesheet", "xhr": "xmlhttprequest", "frame": "subdocument", "doc": "document",
+                          "beacon": "ping", "from": "domain"}
+RESOURCE_TYPES = {
+    "script": "script",
+    "image": "image",
+    "stylesheet": "style-sheet",
+    "font": "font",
+    "media": "media",
+    "xmlhttprequest": "fetch",
+    "websocket": "websocket",
+    "ping": "ping",
+    "popup": "popup",
+    "other": "other",
+}
+# Options that do not change what a block or allow rule matches in WebKit
+IGNORED_OPTIONS = {"important", "all"}
+# Procedural and uBO-only selector syntax a WebKit stylesheet would reject
+UNSUPPORTED_SELECTOR_SYNTAX = PROCEDURAL_OPERATORS + (":style(", ":remove(", ":-abp-has(", ":if(", ":if-not(",
+                                                      ":matches-media(", ":others(", ":not-has-text(")
+
+
+class Untranslatable(Exception):
+    """A rule with no WebKit equivalent; the message is the reason counted in the export report."""
+
+
+def _url_filter_from_pattern(pattern: str, match_case: bool) -> str:
+    """Translates an ABP-style network pattern into a WebKit url-filter."""
+    regex_match = REGEX_RULE_RE.match(pattern)
+    if regex_match:
+        body = regex_match.group(1)
+        if UNSUPPORTED_REGEX_RE.search(body):
+            raise Untranslatable("regex uses alternation, counted repetition or shorthand classes")
+        return body
+
+    out = []
+    if pattern.startswith("||"):
+        out.append(HOST_ANCHOR_REGEX)
+        pattern = pattern[2:]
+    elif pattern.startswith("|"):
+        out.append("^")
+        pattern = pattern[1:]
+    end_anchor = pattern.endswith("|")
+    if end_anchor:
+        pattern = pattern[:-1]
+    for char in pattern if match_case else pattern.lower():
+        if char == "*":
+            out.append(".*")
+        elif char == "^":
+            out.append(SEPARATOR_REGEX)
+        elif char in URL_FILTER_SPECIAL_CHARS:
+            out.append("\\" + char)
+        else:
+            out.append(char)
+    if end_anchor:
+        out.append("$")
+    url_filter = "".join(out)
+    return url_filter or ".*"
+
+
+def _webkit_domains(domains: list[str]) -> list[str]:
+    """WebKit domain list entries; a leading '*' also matches subdomains, as ABP domains do."""
+    result = []
+    for domain in domains:
+        domain = domain.strip().lower()
+        if not domain.isascii():
+            raise Untranslatable("non-ASCII domain")
+        if domain.endswith(".*"):
+            raise Untranslatable("entity domain (example.*)")
+        if domain.startswith("/"):
+            raise Untranslatable("regex domain")
+        result.append("*" + domain)
+    return result
+
+
+def _split_domain_list(domains: list[str]) -> tuple[list[str], list[str]]:
+    included = [domain for domain in domains if domain and not domain.startswith("~")]
+    excluded = [domain[1:] for domain in domains if domain.startswith("~")]
+    if included and excluded:
+        raise Untranslatable("domain list mixes included and excluded domains")
+    return included, excluded
+
+
+def translate_network_rule(rule_str: str) -> dict:
+    """
+    Translates one network rule into a WebKit rule. Exceptions become
+    ignore-previous-rules; `@@...$document` with domains (or `@@||host^$document`)
+    becomes a whole-site allow rule. Raises Untranslatable.
+    """
+    is_exception = rule_str.startswith("@@")
+    rule = rule_str[2:] if is_exception else rule_str
+    pattern, option_str = rule, ""
+    if "$" in rule and not REGEX_RULE_RE.match(rule):
+        dollar = rule.rfind("$")
+        pattern, option_str = rule[:dollar], rule[dollar + 1:]
+
+    trigger: dict = {}
+    resource_types, excluded_types = [], []
+    subdocument = document = match_case = False
+    for option in (o.strip() for o in split_network_options(option_str) if o.strip()):
+        name, _, value = option.partition("=")
+        negated = name.startswith("~")
+        name = NETWORK_OPTION_ALIASES.get(name.lstrip("~").lower(), name.lstrip("~").lower())
+        if name.startswith("~"):
+            name, negated = name[1:], not negated
+        if name in IGNORED_OPTIONS:
+            continue
+        if name == "third-party":
+            trigger["load-type"] = ["first-party" if negated else "third-party"]
+        elif name == "match-case":
+            match_case = True
+        elif name == "domain":
+            included, excluded = _split_domain_list(value.split("|"))
+            if included: trigger["if-domain"] = _webkit_domains(included)
+            if excluded: trigger["unless-domain"] = _webkit_domains(excluded)
+        elif name == "subdocument" and not negated:
+            subdocument = True
+        elif name == "document" and not negated:
+            document = True
+        elif name in RESOURCE_TYPES:
+            (excluded_types if negated else resource_types).append(RESOURCE_TYPES[name])
+        else:
+            raise Untranslatable(f"unsupported option ${name}")
+
+    if document:
+        if not is_exception or resource_types or subdocument:
+            raise Untranslatable("$document outside a site allow rule")
+        # Allow everything on the pages of the matched site
+        host_match = re.match(r"^\|\|([^/^*|]+)\^?$", pattern)
+        if "if-domain" not in trigger and host_match:
+            trigger["if-domain"] = _webkit_domains([host_match.group(1)])
+        elif "if-domain" not in trigger:
+            raise Untranslatable("$document allow rule without a site")
+        trigger.pop("load-type", None)
+        return {"trigger": {"url-filter": ".*", **trigger}, "action": {"type": "ignore-previous-rules"}}
+
+    if subdocument:
+        if resource_types or excluded_types:
+            raise Untranslatable("$subdocument combined with other resource types")
+        resource_types = ["document"]
+        trigger["load-context"] = ["child-frame"]
+    elif excluded_types:
+        if resource_types:
+            raise Untranslatable("resource types both included and excluded")
+        # Popups are opt-in in ABP syntax, so a negated type list never covers them
+        resource_types = [t for t in RESOURCE_TYPES.values() if t not in excluded_types and t != "popup"]
+    if resource_types:
+        trigger["resource-type"] = sorted(set(resource_types))
+
+    url_filter = _url_filter_from_pattern(pattern, match_case)
+    if not url_filter.isascii():
+        raise Untranslatable("non-ASCII url-filter")
+    result_trigger = {"url-filter": url_filter}
+    if match_case:
+        result_trigger["url-filter-is-case-sensitive"] = True
+    result_trigger.update(trigger)
+    return {"trigger": result_trigger, "action": {"type": "ignore-previous-rules" if is_exception else "block"}}
+
+
+def parse_cosmetic_rule(rule_str: str) -> tuple[list[str], str, bool]:
+    """
+    Splits a simple element-hiding rule into (domains, selector, is_exception).
+    Raises Untranslatable for procedural, scriptlet, HTML-filtering and
+    style-injecting rules, which WebKit's css-display-none cannot express.
+    """
+    for separator in ("#@#", "##"):
+        index = rule_str.find(separator)
+        if index >= 0: break
+    else:
+        raise Untranslatable("procedural or extended cosmetic syntax")
+    if "#?#" in rule_str or "#$#" in rule_str:
+        raise Untranslatable("procedural or extended cosmetic syntax")
+    domains = [domain.strip() for domain in rule_str[:index].split(",") if domain.strip()]
+    selector = rule_str[index + len(separator):].strip()
+    if not selector or selector.startswith(("+js(", "^")):
+        raise Untranslatable("scriptlet or HTML filter")
+    selector_lower = selector.lower()
+    if any(op in selector_lower for op in UNSUPPORTED_SELECTOR_SYNTAX):
+        raise Untranslatable("procedural selector")
+    if not selector.isascii():
+        raise Untranslatable("non-ASCII selector")
+    return domains, selector, separator == "#@#"
+
+
+def _cosmetic_webkit_rules(cosmetic_rules: list[str], untranslatable: dict, max_selectors: int):
+    """
+    Merges element-hiding rules into css-display-none rules, one per set of
+    domains: selectors hidden on the same sites share a rule. `#@#`
+    exceptions remove their domains from specific rules and become
+    unless-domain on the generic rule with the same selector.
+    """
+    hide: dict[tuple[str, ...], list[str]] = {} # sorted domains ("" = generic) -> selectors
+    excepted: dict[str, set[str]] = {} # selector -> domains where it is allowed
+    parsed = []
+    for rule_str in cosmetic_rules:
+        try:
+            domains, selector, is_exception = parse_cosmetic_rule(rule_str)
+            included, excluded = _split_domain_list(domains)
+            _webkit_domains(included + excluded) # Validate up front
+        except Untranslatable as e:
+            _count_untranslatable(untranslatable, rule_str, str(e))
+            continue
+        if is_exception:
+            excepted.setdefault(selector, set()).update(domain.lower() for domain in included)
+        else:
+            parsed.append((included, excluded, selector))
+
+    unless: dict[tuple[str, ...], list[str]] = {} # generic selectors sharing the same unless-domain set
+    for included, excluded, selector in parsed:
+        allowed_on = excepted.get(selector, set())
+        if included:
+            remaining = tuple(sorted({domain.lower() for domain in included} - allowed_on))
+            if remaining:
+                hide.setdefault(remaining, []).append(selector)
+        else:
+            unless.setdefault(tuple(sorted({domain.lower() for domain in excluded} | allowed_on)), []).append(selector)
+
+    for groups, domain_key in ((hide, "if-domain"), (unless, "unless-domain")):
+        for domains, selectors in groups.items():
+            selectors = list(dict.fromkeys(selectors))
+            for start in range(0, len(selectors), max_selectors):
+                trigger = {"url-filter": ".*"}
+                if domains:
+                    trigger[domain_key] = _webkit_domains(list(domains))
+                yield {"trigger": trigger, "action": {"type": "css-display-none", "selector": ", ".join(selectors[start:start + max_selectors])}}
+
+
+def _count_untranslatable(untranslatable: dict, rule_str: str, reason: str):
+    untranslatable["count"] += 1
+    untranslatable["by_reason"][reason] = untranslatable["by_reason"].get(reason, 0) + 1
+    if len(untranslatable["examples"]) < untranslatable["max_examples"]:
+        untranslatable["examples"].append({"rule": rule_str, "reason": reason})
+
+
+def _hosts_rule_strings(rule_str: str):
+    hosts_match = HOSTS_LINE_RE.match(rule_str.split("#", 1)[0])
+    if not hosts_match: return
+    for host in hosts_match.group(1).split():
+        host = host.lower().rstrip(".")
+        if "." in host and host not in HOSTS_IGNORED_NAMES:
+            yield f"||{host}^"
+
+
+def resolve_webkit_manifest(webkit_config: dict) -> pathlib.Path:
+    output_dir = pathlib.Path(webkit_config.get("output_dir", "webkit"))
+    return output_dir / f"{webkit_config.get('basename', 'BravePowerList')}.webkit.manifest.json"
+
+
+def _chunk_path(webkit_config: dict, chunk_index: int) -> pathlib.Path:
+    output_dir = pathlib.Path(webkit_config.get("output_dir", "webkit"))
+    return output_dir / f"{webkit_config.get('basename', 'BravePowerList')}.webkit.{chunk_index}.json"
+
+
+class _ChunkWriter:
+    """
+    Streams WebKit rules into numbered JSON files of at most `max_rules`
+    rules each. WebKit applies ignore-previous-rules only within one content
+    blocker, so every chunk ends with the exception rules (`tail`), and the
+    $important block rules (`final`) follow them in the last chunk.
+    """
+
+    def __init__(self, webkit_config: dict, max_rules: int, tail: list[dict], final: list[dict]):
+        self.webkit_config = webkit_config
+        self.capacity = max_rules - len(tail)
+        self.tail, self.final = tail, final
+        self.chunks: list[dict] = []
+        self._file = None
+        self._count = 0
+        self._started = 0.0
+
+    def _open(self):
+        path = _chunk_path(self.webkit_config, len(self.chunks) + 1)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        self._started = time.perf_counter()
+        self._file = open(path, "w", encoding="utf-8")
+        self._file.write("[")
+        self._count = 0
+        self._path = path
+
+    def _write(self, webkit_rule: dict):
+        self._file.write(("\n" if self._count == 0 else ",\n") + json.dumps(webkit_rule, separators=(",", ":")))
+        self._count += 1
+
+    def _close(self, rules: list[dict]):
+        for webkit_rule in rules:
+            self._write(webkit_rule)
+        self._file.write("\n]\n")
+        self._file.close()
+        self._file = None
+        seconds = time.perf_counter() - self._started
+        self.chunks.append({"file": self._path.name, "rules": self._count, "seconds": round(seconds, 4)})
+        logger.info(f"WebKit export: Wrote chunk {len(self.chunks)} ({self._count} rules) to '{self._path.resolve()}' in {seconds:.3f}s.")
+
+    def add(self, webkit_rule: dict):
+        if self._file is None:
+            self._open()
+        elif self._count >= self.capacity:
+            self._close(self.tail)
+            self._open()
+        self._write(webkit_rule)
+
+    def finish(self):
+        if self._file is None:
+            self._open()
+        if self._count + len(self.final) > self.capacity:
+            self._close(self.tail)
+            self._open()
+        self._close(self.tail + self.final)
+
+
+def export_webkit_lists(unified_rules: dict, config: dict) -> dict:
+    """
+    Writes the rules of the output variant named by webkit_export_options
+    'variant' (default: every rule) as WebKit content-blocker JSON, split
+    into chunks of at most `max_rules_per_chunk` rules. Network and hosts
+    rules are translated one by one and streamed straight to the chunk
+    files; simple element-hiding rules are merged per domain set first.
+    Rules WebKit cannot express are counted, by reason, in the manifest.
+
+    Returns:
+        {"success": bool, "manifest": str, "chunks": [...], "untranslatable": int}
+    """
+    webkit_config = config.get("webkit_export_options", {})
+    manifest_path = resolve_webkit_manifest(webkit_config)
+    variant = None
+    if webkit_config.get("variant"):
+        from .generator import resolve_output_variants
+        variant = next((v for v in resolve_output_variants(config) if v["name"] == webkit_config["variant"]), None)
+        if variant is None:
+            logger.error(f"WebKit export: Output variant '{webkit_config['variant']}' is not configured.")
+            return {"success": False, "manifest": str(manifest_path), "chunks": [], "untranslatable": 0}
+
+    max_rules = webkit_config.get("max_rules_per_chunk", 50000)
+    untranslatable = {"count": 0, "by_reason": {}, "examples": [], "max_examples": webkit_config.get("report_max_examples", 200)}
+    selected = set(select_rules(unified_rules, variant))
+    network_rules, cosmetic_rules = [], []
+    for rule_data in unified_rules["rules"]:
+        if rule_data["string"] not in selected: continue
+        if rule_data["type"] == RuleType.NETWORK:
+            network_rules.append(rule_data["string"])
+        elif rule_data["type"] == RuleType.HOSTS_RULE:
+            network_rules.extend(_hosts_rule_strings(rule_data["string"]))
+        elif rule_data["type"] == RuleType.COSMETIC:
+            cosmetic_rules.append(rule_data["string"])
+        elif rule_data["type"] == RuleType.SCRIPTLET:
+            _count_untranslatable(untranslatable, rule_data["string"], "scriptlet")
+
+    def translated(rule_strings):
+        for rule_str in rule_strings:
+            try:
+                yield translate_network_rule(rule_str)
+            except Untranslatable as e:
+                _count_untranslatable(untranslatable, rule_str, str(e))
+
+    # Exceptions and $important rules are few; translate them up front so every chunk can carry them
+    exceptions = list(translated(r for r in network_rules if r.startswith("@@")))
+    important_strings = [r for r in network_rules if not r.startswith("@@") and re.search(r"\$(.*,)?important(,|$)", r)]
+    important = list(translated(important_strings))
+    if len(exceptions) + len(important) >= max_rules:
+        logger.error(f"WebKit export: {len(exceptions)} exception and {len(important)} important rule(s) "
+                     f"leave no room in chunks of {max_rules} rules.")
+        return {"success": False, "manifest": str(manifest_path), "chunks": [], "untranslatable": untranslatable["count"]}
+
+    important_set = set(important_strings)
+    writer = _ChunkWriter(webkit_config, max_rules, exceptions, important)
+    try:
+        for old_chunk in manifest_path.parent.glob(f"{webkit_config.get('basename', 'BravePowerList')}.webkit.*.json"):
+            if old_chunk != manifest_path: old_chunk.unlink() # A shorter list leaves fewer chunks behind
+        for webkit_rule in translated(r for r in network_rules if not r.startswith("@@") and r not in important_set):
+            writer.add(webkit_rule)
+        for webkit_rule in _cosmetic_webkit_rules(cosmetic_rules, untranslatable, webkit_config.get("max_selectors_per_rule", 250)):
+            writer.add(webkit_rule)
+        writer.finish()
+
+        untranslatable.pop("max_examples")
+        untranslatable["by_reason"] = dict(sorted(untranslatable["by_reason"].items(), key=lambda item: item[1], reverse=True))
+        manifest = {
+            "generated": datetime.now().isoformat(timespec="seconds"),
+            "variant": webkit_config.get("variant"),
+            "max_rules_per_chunk": max_rules,
+            "chunks": writer.chunks,
+            "untranslatable": untranslatable,
+        }
+        with open(manifest_path, "w", encoding="utf-8") as f:
+            json.dump(manifest, f, indent=2)
+    except (IOError, OSError) as e:
+        logger.error(f"WebKit export: Failed to write content-blocker JSON to {manifest_path.parent.resolve()}: {e}")
+        return {"success": False, "manifest": str(manifest_path), "chunks": writer.chunks, "untranslatable": untranslatable["count"]}
+
+    logger.info(f"WebKit export: {sum(chunk['rules'] for chunk in writer.chunks)} rules in {len(writer.chunks)} chunk(s); "
+                f"{untranslatable['count']} rule(s) untranslatable. Manifest: '{manifest_path.resolve()}'.")
+    return {"success": True, "manifest": str(manifest_path), "chunks": writer.chunks, "untranslatable": untranslatable["count"]}
@@ -0,0 +1,186 @@
+# tests/http_standin.py
+
+import gzip
+import hashlib
+import logging
+import re
+import socket
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+logger = logging.getLogger(__name__)
+
+_RANGE_RE = re.compile(r"^bytes=(\d+)-$")
+
+
+class FaultInjectingHTTPServer:
+    """
+    A local stand-in for list hosts, used to exercise the downloader against
+    the failures seen in production: 429/5xx with Retry-After, slow
+    responses, connections dropped mid-body, gzip transfer, Range
+    requests and If-None-Match revalidation. Runs on 127.0.0.1 in a
+    background thread:
+
+        with FaultInjectingHTTPServer() as server:
+            server.add_route("/easylist.txt", body, fail_first=2, fail_status=429, gzip=True)
+            await download_filter_lists([server.url("/easylist.txt")], {...})
+            server.requests  # every request received, with its headers
+    """
+
+    def __init__(self):
+        self._routes: dict[str, dict] = {}
+        self._lock = threading.Lock()
+        self.requests: list[dict] = []
+        self._httpd: ThreadingHTTPServer | None = None
+        self._thread: threading.Thread | None = None
+
+    def add_route(
+        self,
+        path: str,
+        body: bytes,
+        fail_first: int = 0,
+        fail_status: int = 503,
+        retry_after: float | None = None,
+        truncate_first: int = 0,
+        truncate_at: int | None = None,
+        delay_seconds: float = 0.0,
+        gzip: bool = False,
+        support_range: bool = True,
+        etag: bool = True,
+        range_start_override: int | None = None,
+    ):
+        """
+        Serves `body` at `path`. The first `fail_first` requests answer
+        `fail_status`; the next `truncate_first` full-body responses are cut
+        after `truncate_at` bytes (default: half the body) by closing the
+        connection. Every response is delayed by `delay_seconds`. With
+        `range_start_override`, Range requests are answered from that byte
+        instead of the requested one, as a misbehaving cache would.
+        """
+        with self._lock:
+            self._routes[path] = {
+                "body": body, "fail_first": fail_first, "fail_status": fail_status, "retry_after": retry_after,
+                "truncate_first": truncate_first, "truncate_at": truncate_at, "delay_seconds": delay_seconds,
+                "gzip": gzip, "support_range": support_range, "etag": etag, "range_start_override": range_start_override,
+                "hits": 0, "truncations": 0,
+            }
+
+    def set_body(self, path: str, body: bytes):
+        """Replaces the body served at `path`, keeping its fault settings and counters."""
+        with self._lock:
+            self._routes[path]["body"] = body
+
+    def url(self, path: str) -> str:
+        host, port = self._httpd.server_address[:2]
+        return f"http://{host}:{port}{path}"
+
+    def hits(self, path: str) -> int:
+        with self._lock:
+            return self._routes[path]["hits"]
+
+    def start(self) -> "FaultInjectingHTTPServer":
+        standin = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, format, *args):
+                logger.debug("Stand-in: " + format % args)
+
+            def do_GET(self):
+                with standin._lock:
+                    standin.requests.append({"path": self.path, "headers": dict(self.headers)})
+                    route = standin._routes.get(self.path)
+                    if route is not None:
+                        route["hits"] += 1
+                        hit = route["hits"]
+                if route is None:
+                    self._send_simple(404)
+                    return
+                if route["delay_seconds"]:
+                    time.sleep(route["delay_seconds"])
+                if hit <= route["fail_first"]:
+                    extra = {"Retry-After": str(route["retry_after"])} if route["retry_after"] is not None else {}
+                    self._send_simple(route["fail_status"], extra)
+                    return
+
+                representation = route["body"]
+                headers = {"Content-Type": "text/plain; charset=utf-8"}
+                if route["gzip"] and "gzip" in self.headers.get("Accept-Encoding", ""):
+                    representation = gzip.compress(representation, mtime=0)
+                    headers["Content-Encoding"] = "gzip"
+                etag = '"' + hashlib.sha1(representation).hexdigest() + '"'
+                if route["etag"]:
+                    headers["ETag"] = etag
+                if route["support_range"]:
+                    headers["Accept-Ranges"] = "bytes"
+                if route["etag"] and self.headers.get("If-None-Match") == etag:
+                    self._send_simple(304, {"ETag": etag})
+                    return
+
+                status, start = 200, 0
+                range_match = _RANGE_RE.match(self.headers.get("Range", ""))
+                if route["support_range"] and range_match:
+                    if_range = self.headers.get("If-Range")
+                    if if_range is None or if_range == etag:
+                        start = int(range_match.group(1))
+                        if route["range_start_override"] is not None:
+                            start = route["range_start_override"]
+                        if start >= len(representation):
+                            self._send_simple(416, {"Content-Range": f"bytes */{len(representation)}"})
+                            return
+                        status = 206
+                        headers["Content-Range"] = f"bytes {start}-{len(representation) - 1}/{len(representation)}"
+                payload = representation[start:]
+
+                truncate = False
+                if status == 200:
+                    with standin._lock:
+                        if route["truncations"] < route["truncate_first"]:
+                            route["truncations"] += 1
+                            truncate = True
+
+                self.send_response(status)
+                for name, value in headers.items():
+                    self.send_header(name, value)
+                self.send_header("Content-Length", str(len(payload)))
+                if truncate:
+                    self.send_header("Connection", "close")
+                self.end_headers()
+                if truncate:
+                    cut = route["truncate_at"] if route["truncate_at"] is not None else len(payload) // 2
+                    self.wfile.write(payload[:cut])
+                    self.wfile.flush()
+                    self.close_connection = True
+                    try:
+                        self.connection.shutdown(socket.SHUT_RDWR)
+                    except OSError:
+                        pass
+                    return
+                self.wfile.write(payload)
+
+            def _send_simple(self, status: int, extra_headers: dict | None = None):
+                self.send_response(status)
+                for name, value in (extra_headers or {}).items():
+                    self.send_header(name, value)
+                self.send_header("Content-Length", "0")
+                self.end_headers()
+
+        self._httpd = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self._httpd.daemon_threads = True
+        self._thread = threading.Thread(target=self._httpd.serve_forever, name="http-standin", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        if self._httpd is not None:
+            self._httpd.shutdown()
+            self._httpd.server_close()
+            self._httpd = None
+
+    def __enter__(self) -> "FaultInjectingHTTPServer":
+        return self.start()
+
+    def __exit__(self, exc_type, exc, tb):
+        self.stop()
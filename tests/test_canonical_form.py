@@ -0,0 +1,40 @@
+# tests/test_canonical_form.py
+
+import pytest
+
+from core_modules.canonical_form import canonical_key, canonicalize_network_rule
+from core_modules.parser_validator import RuleType, parse_and_validate_rules, split_network_options
+from core_modules.unifier_optimizer import collect_unified_rules
+from core_modules.webkit_exporter import Untranslatable, translate_network_rule
+
+
+def test_split_network_options_keeps_escaped_commas():
+    assert split_network_options(r"removeparam=/a\,b/,image") == [r"removeparam=/a\,b/", "image"]
+    assert split_network_options("third-party,script") == ["third-party", "script"]
+
+
+def test_escaped_comma_in_option_value_is_not_an_option():
+    # Split on bare commas, "b/" would become an option and sort apart from the value
+    assert canonicalize_network_rule(r"||example.com^$removeparam=/a\,b/,image") == r"||example.com^$image,removeparam=/a\,b/"
+    assert canonicalize_network_rule(r"||example.com^$domain=/a\,b/|c.com") == r"||example.com^$domain=/a\,b/|c.com"
+
+
+def test_rules_differing_only_inside_an_escaped_value_are_not_merged():
+    first, _ = canonical_key(r"||example.com^$removeparam=/a\,b/", RuleType.NETWORK)
+    second, _ = canonical_key("||example.com^$b/,removeparam=/a\\", RuleType.NETWORK) # Same pieces, split on bare commas
+    assert first != second
+
+
+def test_option_order_and_aliases_are_canonical():
+    assert canonical_key("||Example.com^$3p,css", RuleType.NETWORK)[0] == canonical_key("||example.com^$stylesheet,third-party", RuleType.NETWORK)[0]
+
+
+def test_escaped_comma_survives_validation_coverage_and_webkit_export():
+    rule = r"||ads.example.com^$domain=/a\,b/"
+    parsed = parse_and_validate_rules({"list": f"||example.com^\n{rule}\n"}, {}, top_level_sources=["list"])
+    assert [r["brave_validity_status"] for r in parsed] == ["VALID", "VALID"]
+    covered = {r["string"]: r["covered_by"] for r in collect_unified_rules(parsed)["rules"]}
+    assert covered[rule] == ["||example.com^"] # $domain only narrows the rule; "b/" is not an option
+    with pytest.raises(Untranslatable, match="regex domain"): # Not "unsupported option $b/"
+        translate_network_rule(rule)
+    assert translate_network_rule(r"||ads.example.com^$domain=c.com,image")["trigger"]["if-domain"] == ["*c.com"]
@@ -0,0 +1,40 @@
+# tests/test_dns_exporter.py
+
+import pathlib
+
+from core_modules.dns_exporter import export_dns_lists
+from core_modules.unifier_optimizer import collect_unified_rules
+
+
+def _unified(rule_strings):
+    return collect_unified_rules([
+        {"brave_validity_status": "VALID", "rule_type": "NETWORK", "original_rule_string": rule,
+         "source_url": "https://lists.example/list.txt", "line_number": line_number}
+        for line_number, rule in enumerate(rule_strings, 1)
+    ])
+
+
+def _config(tmp_path, formats):
+    return {"dns_export_options": {"output_dir": str(tmp_path), "basename": "test", "formats": formats}}
+
+
+def test_hosts_format_keeps_subdomains_of_blocked_domains(tmp_path):
+    unified = _unified(["||example.com^", "||ads.example.com^", "||tracker.test^"])
+    result = export_dns_lists(unified, _config(tmp_path, ["hosts", "dnsmasq"]))
+    hosts = pathlib.Path(tmp_path, "test.hosts").read_text().splitlines()
+    dnsmasq = pathlib.Path(tmp_path, "test.dnsmasq.conf").read_text().splitlines()
+    assert "0.0.0.0 ads.example.com" in hosts
+    assert "0.0.0.0 example.com" in hosts
+    assert "address=/ads.example.com/0.0.0.0" not in dnsmasq # dnsmasq matches subdomains itself
+    assert result["domain_count"] == 2
+
+
+def test_rpz_serial_increases_between_builds(tmp_path):
+    unified = _unified(["||example.com^"])
+    config = _config(tmp_path, ["rpz"])
+    serials = []
+    for _ in range(3):
+        export_dns_lists(unified, config)
+        soa = next(line for line in pathlib.Path(tmp_path, "test.rpz.zone").read_text().splitlines() if " SOA " in line)
+        serials.append(int(soa.split("(")[1].split()[0]))
+    assert serials[0] < serials[1] < serials[2]
@@ -0,0 +1,105 @@
+# tests/test_downloader.py
+
+import asyncio
+import time
+
+import pytest
+
+from core_modules.downloader import NOT_MODIFIED, SourceFetcher, create_session, download_filter_lists
+from http_standin import FaultInjectingHTTPServer
+
+LIST_BODY = "".join(f"||ads{i}.example.com^\n" for i in range(20000)).encode("utf-8")
+
+
+@pytest.fixture
+def server():
+    with FaultInjectingHTTPServer() as standin:
+        yield standin
+
+
+@pytest.fixture
+def downloader_config(tmp_path):
+    return {
+        "temp_dir": str(tmp_path / "downloads"),
+        "retries": 3,
+        "backoff_base_seconds": 0.01,
+        "backoff_max_seconds": 1.0,
+        "resume_min_bytes": 1024,
+        "resolve_includes": False,
+        "accept_encoding": ["identity"],
+    }
+
+
+def _download(urls, downloader_config, stats=None):
+    return asyncio.run(download_filter_lists(urls, downloader_config, stats))
+
+
+def test_429_with_retry_after_is_retried(server, downloader_config):
+    server.add_route("/list.txt", LIST_BODY, fail_first=1, fail_status=429, retry_after=0.2)
+    stats = {}
+    started = time.perf_counter()
+    result = _download([server.url("/list.txt")], downloader_config, stats)
+    assert result[server.url("/list.txt")] == LIST_BODY.decode("utf-8")
+    assert server.hits("/list.txt") == 2
+    assert stats[server.url("/list.txt")]["attempts"] == 2
+    assert time.perf_counter() - started >= 0.2 # Retry-After was honoured over the shorter backoff
+
+
+def test_dropped_connection_resumes_with_range(server, downloader_config):
+    server.add_route("/list.txt", LIST_BODY, truncate_first=1)
+    stats = {}
+    result = _download([server.url("/list.txt")], downloader_config, stats)
+    assert result[server.url("/list.txt")] == LIST_BODY.decode("utf-8")
+    assert stats[server.url("/list.txt")]["resumed"]
+    resume_request = server.requests[-1]["headers"]
+    assert resume_request["Range"] == f"bytes={len(LIST_BODY) // 2}-"
+    assert resume_request["If-Range"] == stats[server.url("/list.txt")]["etag"]
+
+
+def test_mismatched_content_range_restarts_from_zero(server, downloader_config):
+    server.add_route("/list.txt", LIST_BODY, truncate_first=1, range_start_override=100)
+    stats = {}
+    result = _download([server.url("/list.txt")], downloader_config, stats)
+    assert result[server.url("/list.txt")] == LIST_BODY.decode("utf-8")
+    assert "Range" not in server.requests[-1]["headers"] # The final, successful request fetched the whole body
+    assert server.hits("/list.txt") == 3
+
+
+def test_slow_primary_loses_to_mirror(server, downloader_config):
+    server.add_route("/primary.txt", LIST_BODY, delay_seconds=2.0)
+    server.add_route("/mirror.txt", LIST_BODY)
+    source = {"url": server.url("/primary.txt"), "mirrors": [server.url("/mirror.txt")]}
+    stats = {}
+    started = time.perf_counter()
+    result = _download([source], downloader_config, stats)
+    assert time.perf_counter() - started < 2.0
+    assert result[server.url("/primary.txt")] == LIST_BODY.decode("utf-8")
+    assert stats[server.url("/primary.txt")]["served_by"] == server.url("/mirror.txt")
+
+
+def test_conditional_request_revalidates_with_304(server, downloader_config, tmp_path):
+    server.add_route("/list.txt", LIST_BODY)
+
+    async def fetch_twice():
+        async with create_session(downloader_config) as session:
+            fetcher = SourceFetcher(session, downloader_config, tmp_path)
+            source = {"url": server.url("/list.txt"), "mirrors": []}
+            first = await fetcher.fetch(source)
+            etag = fetcher.stats[source["url"]]["etag"]
+            second = await fetcher.fetch(source, validators={"etag": etag})
+            return first, second, etag
+
+    first, second, etag = asyncio.run(fetch_twice())
+    assert first == LIST_BODY.decode("utf-8")
+    assert second is NOT_MODIFIED
+    assert server.requests[-1]["headers"]["If-None-Match"] == etag
+
+
+def test_gzip_transfer_is_decoded(server, downloader_config):
+    server.add_route("/list.txt", LIST_BODY, gzip=True)
+    downloader_config["accept_encoding"] = ["gzip"]
+    stats = {}
+    result = _download([server.url("/list.txt")], downloader_config, stats)
+    assert result[server.url("/list.txt")] == LIST_BODY.decode("utf-8")
+    assert stats[server.url("/list.txt")]["content_encoding"] == "gzip"
+    assert stats[server.url("/list.txt")]["wire_bytes"] < len(LIST_BODY)
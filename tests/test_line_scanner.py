@@ -0,0 +1,60 @@
+# tests/test_line_scanner.py
+
+from core_modules.line_scanner import MappedListSource
+from core_modules.parser_validator import parse_and_validate_rules
+from core_modules.unifier_optimizer import collect_unified_rules, select_rules
+
+LIST_TEXT = """[Adblock Plus 2.0]
+! Title: Test list
+! A general comment
+||ads.example.com^
+
+# hosts-style comment
+0.0.0.0 tracker.example
+
+example.org##.banner
+!#if env_brave
+||brave-only.example^
+!#endif
+"""
+
+
+def test_mapped_and_downloaded_lists_give_the_same_output(tmp_path):
+    path = tmp_path / "list.txt"
+    path.write_text(LIST_TEXT, encoding="utf-8")
+    outputs = []
+    for content in (MappedListSource(path), LIST_TEXT):
+        parsed = parse_and_validate_rules({"list": content}, {}, top_level_sources=["list"])
+        outputs.append(select_rules(collect_unified_rules(parsed)))
+    assert outputs[0] == outputs[1]
+    assert "! A general comment" in outputs[0]
+    assert "# hosts-style comment" in outputs[0]
+    assert not any(line.startswith("[Adblock") for line in outputs[0])
+
+
+def test_scanner_skips_only_blank_lines_and_the_version_header(tmp_path):
+    path = tmp_path / "list.txt"
+    path.write_text(LIST_TEXT, encoding="utf-8")
+    lines = dict(MappedListSource(path).iter_lines())
+    assert lines == {
+        2: "! Title: Test list", 3: "! A general comment", 4: "||ads.example.com^", 6: "# hosts-style comment",
+        7: "0.0.0.0 tracker.example", 9: "example.org##.banner", 10: "!#if env_brave", 11: "||brave-only.example^",
+        12: "!#endif",
+    }
+
+
+def test_comments_are_skipped_when_no_variant_keeps_them(tmp_path):
+    path = tmp_path / "list.txt"
+    path.write_text(LIST_TEXT + "#@#.ad\n##.generic\n", encoding="utf-8")
+    lines = dict(MappedListSource(path).iter_lines(keep_comments=False))
+    assert lines == {
+        4: "||ads.example.com^", 7: "0.0.0.0 tracker.example", 9: "example.org##.banner", 10: "!#if env_brave",
+        11: "||brave-only.example^", 12: "!#endif", 13: "#@#.ad", 14: "##.generic",
+    }
+    outputs = []
+    for content in (MappedListSource(path), path.read_text(encoding="utf-8")):
+        parsed = parse_and_validate_rules({"list": content}, {}, top_level_sources=["list"], keep_comments=False)
+        outputs.append(select_rules(collect_unified_rules(parsed)))
+    assert outputs[0] == outputs[1]
+    assert "||brave-only.example^" not in outputs[0] # The !#if block was still evaluated
+    assert not any(line.startswith(("!", "# ")) for line in outputs[0])
@@ -0,0 +1,28 @@
+# tests/test_network_matcher.py
+
+from core_modules.network_matcher import reference_network_rules, verify_unified_rules
+from core_modules.rule_budget import apply_rule_budget
+from core_modules.unifier_optimizer import collect_unified_rules
+
+SOURCE = "https://lists.example/list.txt"
+
+
+def _rephrased(rule_strings):
+    return [{"brave_validity_status": "VALID", "rule_type": "NETWORK", "original_rule_string": rule,
+             "source_url": SOURCE, "line_number": line_number}
+            for line_number, rule in enumerate(rule_strings, 1)]
+
+
+def test_verify_checks_budget_trimming_against_the_rephrased_rules(tmp_path):
+    rephrased = _rephrased(["||example.com^", "||ads.example.com^", "||cdn.test^"])
+    corpus = tmp_path / "corpus.txt"
+    corpus.write_text("https://ads.example.com/x https://site.test/ script\nhttps://cdn.test/x https://site.test/ script\n")
+
+    unified = collect_unified_rules(rephrased)
+    assert verify_unified_rules(unified, str(corpus), reference_rules=reference_network_rules(rephrased))["equivalence"]["equivalent"]
+
+    apply_rule_budget(unified, [SOURCE], {"max_rules_by_type": {"NETWORK": 1}})
+    for reference_rules in (reference_network_rules(rephrased), None): # None: rebuilt from "removed_rules"
+        equivalence = verify_unified_rules(unified, str(corpus), reference_rules=reference_rules)["equivalence"]
+        assert not equivalence["equivalent"]
+        assert equivalence["mismatches"] == 1
@@ -0,0 +1,71 @@
+# tests/test_provenance_index.py
+
+from core_modules.provenance_index import ProvenanceIndex, write_provenance_index
+from core_modules.unifier_optimizer import collect_unified_rules, select_rules
+
+SOURCE_A = "https://a.example/list.txt"
+SOURCE_B = "https://b.example/list.txt"
+HEADER_LINES = 3
+
+
+def _rule(source_url, line_number, rule, rule_type="NETWORK", rephrased=None):
+    rule_obj = {"brave_validity_status": "REPHRASED_AND_VALID" if rephrased else "VALID", "rule_type": rule_type,
+                "original_rule_string": rule, "source_url": source_url, "line_number": line_number}
+    if rephrased:
+        rule_obj["rephrased_rule_string"] = rephrased
+    return rule_obj
+
+
+def _write_index(tmp_path):
+    unified = collect_unified_rules([
+        _rule(SOURCE_A, 1, "||example.com^"),
+        _rule(SOURCE_A, 2, "! A general comment", rule_type="COMMENT"),
+        _rule(SOURCE_A, 3, "||ads.tracker.test^"),
+        _rule(SOURCE_A, 4, "site.org##.banner", rule_type="COSMETIC"),
+        _rule(SOURCE_B, 7, "||EXAMPLE.com^", rephrased="||example.com^"),
+        _rule(SOURCE_B, 8, "@@||cdn.ads.tracker.test^"),
+    ])
+    lines = select_rules(unified)
+    index_path = tmp_path / "list.txt.index"
+    write_provenance_index(unified, lines, HEADER_LINES, index_path)
+    return lines, ProvenanceIndex(index_path)
+
+
+def test_line_numbers_are_offset_by_the_header(tmp_path):
+    lines, index = _write_index(tmp_path)
+    with index:
+        assert index.header_lines == HEADER_LINES
+        assert index.line(HEADER_LINES) is None
+        assert index.line(HEADER_LINES + len(lines) + 1) is None
+        for line_index, line in enumerate(lines):
+            record = index.line(HEADER_LINES + line_index + 1)
+            assert record["line"] == line
+            assert record["output_line"] == HEADER_LINES + line_index + 1
+
+
+def test_find_line_returns_every_source_with_the_rephrased_original(tmp_path):
+    lines, index = _write_index(tmp_path)
+    with index:
+        record = index.find_line("||example.com^")
+        assert record["output_line"] == HEADER_LINES + lines.index("||example.com^") + 1
+        assert sorted(record["provenance"], key=lambda p: p["source_url"]) == [
+            {"source_url": SOURCE_A, "line_number": 1, "original": "||example.com^"},
+            {"source_url": SOURCE_B, "line_number": 7, "original": "||EXAMPLE.com^"},
+        ]
+        assert index.find_line("! A general comment")["provenance"] == [
+            {"source_url": SOURCE_A, "line_number": 2, "original": "! A general comment"}]
+        assert index.find_line("||missing.test^") is None
+
+
+def test_host_lines_cover_parent_domains_and_optionally_subdomains(tmp_path):
+    lines, index = _write_index(tmp_path)
+    with index:
+        def host_rules(host, include_subdomains=False):
+            return sorted(lines[i] for i in index.host_lines(host, include_subdomains))
+
+        assert host_rules("www.example.com") == ["||example.com^"] # Indexed under the parent domain
+        assert host_rules("site.org") == ["site.org##.banner"]
+        assert host_rules("tracker.test") == []
+        assert host_rules("tracker.test", include_subdomains=True) == ["@@||cdn.ads.tracker.test^", "||ads.tracker.test^"]
+        assert host_rules("ads.tracker.test", include_subdomains=True) == ["@@||cdn.ads.tracker.test^", "||ads.tracker.test^"]
+        assert host_rules("cdn.ads.tracker.test") == ["@@||cdn.ads.tracker.test^", "||ads.tracker.test^"]
@@ -0,0 +1,30 @@
+# tests/test_rule_budget.py
+
+import pytest
+
+from core_modules.rule_budget import apply_rule_budget
+from core_modules.unifier_optimizer import collect_unified_rules
+
+SOURCES = ["https://a.example/list.txt", "https://b.example/list.txt"]
+
+
+def _unified(rule_count: int) -> dict:
+    rules = []
+    for n in range(rule_count):
+        for source_url in SOURCES[:1 + n % 2]: # Odd rules come from both sources and are worth more
+            rules.append({"brave_validity_status": "VALID", "rule_type": "NETWORK", "original_rule_string": f"||ads{n}.test^",
+                          "source_url": source_url, "line_number": n + 1})
+    rules.append({"brave_validity_status": "VALID", "rule_type": "NETWORK", "original_rule_string": "@@||ok.test^",
+                  "source_url": SOURCES[0], "line_number": rule_count + 1})
+    return collect_unified_rules(rules)
+
+
+@pytest.mark.parametrize("limit", [0, 3, 25, 47, 50, 80]) # Both sides of the cut: small and large excess
+def test_global_budget_keeps_the_most_valuable_rules(limit):
+    unified = _unified(50)
+    report = apply_rule_budget(unified, [{"url": url} for url in SOURCES], {"max_rules_by_type": {"NETWORK": limit}})
+    kept = [r["string"] for r in unified["rules"] if not r["is_exception"]]
+    ranked = sorted((f"||ads{n}.test^" for n in range(50)), key=lambda rule: (int(rule[5:-6]) % 2, rule), reverse=True)
+    assert sorted(kept) == sorted(ranked[:limit])
+    assert "@@||ok.test^" in [r["string"] for r in unified["rules"]]
+    assert report["summary"]["exceptions_exempt"] == 1
@@ -0,0 +1,106 @@
+# tests/test_source_scheduler.py
+
+import asyncio
+
+from core_modules.checkpoints import checkpoint_path
+from http_standin import FaultInjectingHTTPServer
+from core_modules.main_generator import STAGES, run_pipeline
+from core_modules.source_scheduler import MemoryBudget, SourceScheduler
+
+
+async def _blocks(awaitable, timeout: float = 0.05) -> bool:
+    """Whether `awaitable` is still waiting after `timeout`; it keeps running either way."""
+    task = asyncio.ensure_future(awaitable)
+    await asyncio.sleep(timeout)
+    return not task.done()
+
+
+def test_memory_budget_admits_an_oversized_source_alone():
+    async def scenario():
+        budget = MemoryBudget(100)
+        await budget.acquire(500) # Larger than the whole budget, but nothing else is in memory
+        assert await _blocks(budget.acquire(10))
+        await budget.release(500)
+        await asyncio.sleep(0)
+        assert budget.in_use == 10
+        assert budget.peak == 500
+
+    asyncio.run(scenario())
+
+
+def test_memory_budget_settle_below_the_estimate_admits_waiting_fetches():
+    async def scenario():
+        budget = MemoryBudget(100)
+        await budget.acquire(60)
+        waiting = asyncio.ensure_future(budget.acquire(60))
+        await asyncio.sleep(0.05)
+        assert not waiting.done()
+        await budget.settle(60, 20) # The body came in smaller than estimated
+        await asyncio.wait_for(waiting, 1)
+        assert budget.in_use == 80
+
+    asyncio.run(scenario())
+
+
+def _config(tmp_path, filter_list_urls, **scheduler_options):
+    return {
+        "filter_list_urls": filter_list_urls,
+        "downloader_options": {"temp_dir": str(tmp_path / "downloads"), "retries": 0},
+        "rephraser_options": {"load_brave_metadata": False},
+        "rule_cost_options": {"enabled": False},
+        "scheduler_options": {"enabled": True, "min_sources": 0, "memory_budget_mb": 1, "estimated_source_mb": 0.01,
+                              **scheduler_options},
+        "output_filename": str(tmp_path / "list.txt"),
+        "checkpoint_options": {"checkpoint_dir": str(tmp_path / "checkpoints")},
+    }
+
+
+def test_failing_source_is_left_out(tmp_path):
+    local_list = tmp_path / "local.txt"
+    local_list.write_text("||local.example^\n")
+    with FaultInjectingHTTPServer() as server:
+        server.add_route("/good.txt", b"||remote.example^\n")
+        server.add_route("/broken.txt", b"", fail_first=10, fail_status=404)
+        broken_url = server.url("/broken.txt")
+        config = _config(tmp_path, [server.url("/good.txt"), broken_url, str(local_list)])
+        scheduler = SourceScheduler(config, {})
+        unified = asyncio.run(scheduler.run())
+    assert {rule["string"] for rule in unified["rules"]} == {"||remote.example^", "||local.example^"}
+    assert scheduler.results[broken_url]["status"] == "download_failed"
+    assert scheduler.results[str(local_list)]["status"] == "ok"
+
+
+def test_source_that_fails_processing_is_left_out(tmp_path):
+    good_list, bad_list = tmp_path / "good.txt", tmp_path / "bad.txt"
+    good_list.write_text("||good.example^\n")
+    bad_list.write_text("||bad.example^\n")
+
+    class FailingScheduler(SourceScheduler):
+        def _process(self, url, documents):
+            rule_count = super()._process(url, documents)
+            if url == str(bad_list):
+                raise RuntimeError("rephraser crashed") # After its rules reached the unified set
+            return rule_count
+
+    scheduler = FailingScheduler(_config(tmp_path, [str(good_list), str(bad_list)]), {})
+    unified = asyncio.run(scheduler.run())
+    assert [rule["string"] for rule in unified["rules"]] == ["||good.example^"]
+    assert scheduler.results[str(bad_list)]["status"] == "process_failed"
+    assert scheduler.budget.in_use == 0
+
+
+def test_scheduled_run_removes_stale_stage_checkpoints(tmp_path):
+    local_list = tmp_path / "local.txt"
+    local_list.write_text("||local.example^\n")
+    config = _config(tmp_path, [str(local_list)])
+    checkpoint_dir = tmp_path / "checkpoints"
+
+    config["scheduler_options"]["enabled"] = False
+    assert run_pipeline(config, STAGES, checkpoint_dir)
+    assert all(checkpoint_path(checkpoint_dir, stage).exists() for stage in STAGES[:3])
+
+    config["scheduler_options"]["enabled"] = True
+    assert run_pipeline(config, STAGES, checkpoint_dir)
+    assert not any(checkpoint_path(checkpoint_dir, stage).exists() for stage in STAGES[:3])
+    assert checkpoint_path(checkpoint_dir, "unify").exists()
+    assert not run_pipeline(config, ("unify",), checkpoint_dir) # Nothing stale to resume from
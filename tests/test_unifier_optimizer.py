@@ -0,0 +1,65 @@
+# tests/test_unifier_optimizer.py
+
+import random
+
+from core_modules.unifier_optimizer import UnifiedRuleSet, collect_unified_rules
+
+DOMAINS = ["example.com", "ads.example.com", "cdn.ads.example.com", "tracker.test", "a.tracker.test", "other.org",
+           *(f"s{n}.example.com" for n in range(40))]
+
+
+def _rule_objects(source_url: str, rule_strings: list[str]) -> list[dict]:
+    return [
+        {"brave_validity_status": "VALID", "rule_type": "COMMENT" if rule.startswith("!") else "NETWORK",
+         "original_rule_string": rule, "source_url": source_url, "line_number": line_number}
+        for line_number, rule in enumerate(rule_strings, 1)
+    ]
+
+
+def _random_rules(rng: random.Random) -> list[str]:
+    rules = []
+    for _ in range(rng.choice([rng.randint(0, 12), 200])): # Small diffs are bisected, large ones merged
+        domain = rng.choice(DOMAINS)
+        rules.append(rng.choice([
+            f"||{domain}^", f"||{domain}^$image", f"||{domain}/banner", f"@@||{domain}^", f"||{domain}^$third-party,image",
+            f"! comment about {domain}",
+        ]))
+    return rules
+
+
+def _snapshot(unified: dict) -> tuple:
+    return ([(r["string"], tuple(sorted(r["covered_by"] or ())), r["origins"]) for r in unified["rules"]],
+            [(c["string"], c["origins"]) for c in unified["comments"]])
+
+
+def test_group_replacements_match_a_full_rebuild():
+    rng = random.Random(7)
+    for sort_output in (True, False):
+        config = {"sort_output": sort_output}
+        unified_set = UnifiedRuleSet(config)
+        groups: dict[str, list[str]] = {}
+        for _ in range(150):
+            source_url = rng.choice(["https://a.example/list.txt", "https://b.example/list.txt", "https://c.example/list.txt"])
+            if groups.get(source_url) and rng.random() < 0.2:
+                unified_set.remove_group(source_url)
+                del groups[source_url]
+            else:
+                groups[source_url] = _random_rules(rng)
+                unified_set.replace_group(source_url, _rule_objects(source_url, groups[source_url]))
+            incremental = unified_set.result()
+
+            rebuilt_set = UnifiedRuleSet(config)
+            for url in unified_set._group_order: # Same group order as the incremental set
+                if url in groups:
+                    rebuilt_set.replace_group(url, _rule_objects(url, groups[url]))
+            expected = rebuilt_set.result()
+            if sort_output:
+                assert _snapshot(incremental) == _snapshot(expected)
+            else:
+                assert sorted(_snapshot(incremental)[0]) == sorted(_snapshot(expected)[0])
+
+
+def test_collect_unified_rules_marks_covered_rules():
+    unified = collect_unified_rules(_rule_objects("https://a.example/list.txt", ["||example.com^", "||ads.example.com^$image", "||example.com/banner"]))
+    covered = {r["string"]: r["covered_by"] for r in unified["rules"]}
+    assert covered == {"||example.com^": None, "||ads.example.com^$image": ["||example.com^"], "||example.com/banner": ["||example.com^"]}
@@ -0,0 +1,66 @@
+# tests/test_webkit_exporter.py
+
+import json
+
+import pytest
+
+from core_modules.unifier_optimizer import collect_unified_rules
+from core_modules.webkit_exporter import (
+    HOST_ANCHOR_REGEX, RESOURCE_TYPES, SEPARATOR_REGEX, Untranslatable, export_webkit_lists, translate_network_rule,
+)
+
+
+def test_host_rule_becomes_an_anchored_block():
+    assert translate_network_rule("||ads.example.com^") == {
+        "trigger": {"url-filter": HOST_ANCHOR_REGEX + "ads\\.example\\.com" + SEPARATOR_REGEX},
+        "action": {"type": "block"},
+    }
+
+
+def test_document_exception_becomes_a_site_allow_rule():
+    assert translate_network_rule("@@||example.com^$document") == {
+        "trigger": {"url-filter": ".*", "if-domain": ["*example.com"]},
+        "action": {"type": "ignore-previous-rules"},
+    }
+
+
+def test_negated_types_expand_to_every_other_type_but_popup():
+    trigger = translate_network_rule("||ads.test^$~script,~image")["trigger"]
+    expected = sorted(t for t in RESOURCE_TYPES.values() if t not in ("script", "image", "popup"))
+    assert trigger["resource-type"] == expected
+
+
+def test_domain_list_mixing_included_and_excluded_domains_is_rejected():
+    with pytest.raises(Untranslatable, match="mixes included and excluded"):
+        translate_network_rule("||ads.test^$domain=a.com|~b.com")
+    assert translate_network_rule("||ads.test^$domain=~a.com|~b.com")["trigger"]["unless-domain"] == ["*a.com", "*b.com"]
+
+
+def _unified(rule_strings):
+    return collect_unified_rules([
+        {"brave_validity_status": "VALID", "rule_type": "NETWORK", "original_rule_string": rule,
+         "source_url": "https://lists.example/list.txt", "line_number": line_number}
+        for line_number, rule in enumerate(rule_strings, 1)
+    ])
+
+
+def test_every_chunk_ends_with_the_exceptions_and_important_rules_go_last(tmp_path):
+    webkit_config = {"output_dir": str(tmp_path), "basename": "List", "max_rules_per_chunk": 4}
+    stale_chunk = tmp_path / "List.webkit.9.json"
+    stale_chunk.write_text("[]")
+    blocks = [f"||ads{n}.test^" for n in range(5)]
+    result = export_webkit_lists(_unified([*blocks, "@@||ok.test^", "||imp.test^$important"]),
+                                 {"webkit_export_options": webkit_config})
+
+    assert result["success"]
+    assert [chunk["rules"] for chunk in result["chunks"]] == [4, 4]
+    assert not stale_chunk.exists()
+    exception = translate_network_rule("@@||ok.test^")
+    important = translate_network_rule("||imp.test^$important")
+    first, second = (json.loads((tmp_path / f"List.webkit.{n}.json").read_text()) for n in (1, 2))
+    assert first[-1] == exception
+    assert second[-2:] == [exception, important]
+    blocked = [rule for rule in first + second if rule["action"]["type"] == "block" and rule != important]
+    assert blocked == [translate_network_rule(rule) for rule in blocks]
+    manifest = json.loads((tmp_path / "List.webkit.manifest.json").read_text())
+    assert [chunk["file"] for chunk in manifest["chunks"]] == ["List.webkit.1.json", "List.webkit.2.json"]